@@ -1,62 +1,136 @@
 #!/usr/bin/env python3
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from pathlib import Path
-import rasterio
-from rasterio.shutil import copy as rio_copy
+
+from aviris import metrics
+from aviris.cache import GranuleCache
+from aviris.convert import PRESETS, convert_batch, convert_windowed, find_data_file, init_worker
+from aviris.shard import Manifest
+from aviris.spectral import SpectralResampler
+from aviris.stats import reduce_directory
 
 INPUT_DIR = "/orange/ntziolas/teznatriana/AVIRIS_downloads/NGL2_HDR&BINPairs/"
 OUTPUT_DIR = "/orange/ntziolas/teznatriana/AVIRIS_downloads/NGL2_TranslatedTIFs/"
 
+# Peak memory per conversion is bounded by these, not by the scene size
+MAX_MEMORY = 256 * 1024 * 1024  # bytes per copied window
+GDAL_CACHE = 64 * 1024 * 1024   # GDAL block cache
+# Output layout, a name from aviris.convert.PRESETS or a JSON file from aviris.bench
+PRESET = "archive"
 
-def find_data_file(hdr_path: str):
-    """
-    For AVIRIS NGL2:
-    Look for data filename matching header without the .hdr extension.
-    """
-    base = hdr_path[:-4]  # strip ".hdr"
-
-    # Try exact match (no extension)
-    if os.path.exists(base):
-        return base
-
-    # Try known ENVI extensions
-    for ext in [".img", ".bsq", ".bin"]:
-        candidate = base + ext
-        if os.path.exists(candidate):
-            return candidate
-
-    return None
 
+def convert_claimed(manifest_path, output_dir, preset=PRESET, band_transform=None):
+    """Convert scenes claimed from a shared manifest until none are left."""
+    def convert_scene(scene, hdr_path):
+        data_file = find_data_file(hdr_path)
+        if data_file is None:
+            raise FileNotFoundError(f"Cannot find data file for {hdr_path}")
+        tif_path = os.path.join(output_dir, scene + ".tif")
+        if not os.path.exists(tif_path):
+            convert_windowed(data_file, tif_path, max_memory=MAX_MEMORY, gdal_cache=GDAL_CACHE, preset=preset,
+                             band_transform=band_transform)
+        return tif_path
 
-def convert_envi_to_tif(hdr_path: str, tif_path: str):
-    data_file = find_data_file(hdr_path)
-
-    if data_file is None:
-        print(f"❌ Cannot find data file for {hdr_path}")
-        return
-
-    # Rasterio requires opening the **data file**, not the header
-    try:
-        with rasterio.open(data_file) as src:
-            rio_copy(src, tif_path, driver="GTiff")
-            print(f"✔️ Converted: {tif_path}")
-    except Exception as e:
-        print(f"❌ Error: {hdr_path}\n   {e}")
+    with Manifest(manifest_path) as manifest:
+        return manifest.process(convert_scene)
 
 
 def main():
-    Path(OUTPUT_DIR).mkdir(exist_ok=True, parents=True)
-
-    hdr_files = sorted(glob(os.path.join(INPUT_DIR, "*.hdr")))
+    parser = argparse.ArgumentParser(description="Convert AVIRIS-NG ENVI HDR/BIN pairs to GeoTIFF")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--cache", metavar="DIR",
+                        help="convert the HDR/BIN pairs of this granule cache instead of --input-dir")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SLURM_CPUS_PER_TASK", 1)),
+                        help="parallel conversions (default: SLURM_CPUS_PER_TASK or 1)")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="also retry scenes that failed in an earlier run "
+                             "(with --manifest: python -m aviris.shard MANIFEST --reset-failed)")
+    parser.add_argument("--manifest", metavar="SQLITE",
+                        help="claim scenes from this shared manifest, so the tasks of a SLURM array "
+                             "split the scenes between them and a resubmitted array resumes")
+    parser.add_argument("--preset", default=PRESET,
+                        help=f"output layout: one of {', '.join(PRESETS)} or a JSON preset from aviris.bench")
+    parser.add_argument("--enmap-metadata",
+                        help="resample to the bands of this EnMAP METADATA.XML while converting")
+    parser.add_argument("--drop-water-bands", action="store_true",
+                        help="drop the 1.4 and 1.9 um water vapour absorption bands")
+    parser.add_argument("--no-stats", action="store_true",
+                        help="do not merge the per-scene band statistics into <output-dir>/collection_stats.json")
+    parser.add_argument("--backfill-stats", action="store_true",
+                        help="compute the statistics of GeoTIFFs converted before they were recorded")
+    args = parser.parse_args()
+
+    band_transform = None
+    if args.enmap_metadata:
+        band_transform = SpectralResampler.from_enmap_metadata(args.enmap_metadata, drop_water=args.drop_water_bands)
+    elif args.drop_water_bands:
+        band_transform = SpectralResampler(drop_water=True)
+
+    Path(args.output_dir).mkdir(exist_ok=True, parents=True)
+    # Per-scene read / write timings, see aviris.metrics
+    metrics.start_run("ngl2_to_geotiff", os.path.join(args.output_dir, "metrics"))
+
+    cache = None
+    if args.cache:
+        cache = GranuleCache(args.cache)
+        hdr_files = sorted(cache.files("%.hdr"))
+        # Keep the scenes from being evicted by other jobs until they are converted
+        pinned = [path for hdr in hdr_files for path in (hdr, find_data_file(hdr)) if path]
+        for path in pinned:
+            cache.pin(path)
+    else:
+        hdr_files = sorted(glob(os.path.join(args.input_dir, "*.hdr")))
 
     print(f"Found {len(hdr_files)} HDR files\n")
 
-    for hdr in hdr_files:
-        base = Path(hdr).stem
-        out_tif = os.path.join(OUTPUT_DIR, base + ".tif")
-        convert_envi_to_tif(hdr, out_tif)
-
+    reduce_stats = True
+    if args.manifest:
+        with Manifest(args.manifest) as manifest:
+            manifest.build({Path(hdr).stem: hdr for hdr in hdr_files})
+        # Every worker process claims scenes on its own
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args.threads_per_worker,)) as pool:
+            futures = [
+                pool.submit(convert_claimed, args.manifest, args.output_dir, args.preset, band_transform)
+                for _ in range(args.workers)
+            ]
+            counts = [future.result() for future in futures]
+        with Manifest(args.manifest) as manifest:
+            status = manifest.status()
+        print(f"\nThis task: {sum(c['done'] for c in counts)} converted, {sum(c['failed'] for c in counts)} failed")
+        print(f"Manifest: {status['done']} done, {status['failed']} failed, "
+              f"{status['running']} running, {status['pending']} pending")
+        # Only once the whole array is through; reduce_directory locks the
+        # output, so tasks that finish together merge only once
+        reduce_stats = status["running"] == 0 and status["pending"] == 0
+    else:
+        # With --workers 1 the scenes are converted in this process, same skips and summary
+        convert_batch(
+            hdr_files,
+            args.output_dir,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            retry_failed=args.retry_failed,
+            max_memory=MAX_MEMORY,
+            gdal_cache=GDAL_CACHE,
+            preset=args.preset,
+            band_transform=band_transform,
+        )
+
+    if cache is not None:
+        for path in pinned:
+            cache.unpin(path)
+
+    if reduce_stats and not args.no_stats:
+        # Collection-wide band statistics from the per-scene sidecars, no extra pass over the GeoTIFFs
+        reduce_directory(args.output_dir, backfill=args.backfill_stats)
+
+    metrics.report()
     print("\nDone.")
 
 
@@ -0,0 +1,3 @@
+"""
+Shared helpers for the AVIRIS / EnMAP download and conversion scripts.
+"""
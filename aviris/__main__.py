@@ -0,0 +1,3 @@
+from aviris.cli import main
+
+main()
@@ -0,0 +1,78 @@
+"""
+NASA Earthdata login, done at most once per process.
+
+Every stage of a run (catalog sync, checksum lookup, downloads, remote
+reads) takes the session from ``earthdata_session``. The first call logs in
+with earthaccess, falling back to ``~/.netrc`` credentials read by requests;
+later calls, e.g. for the next collection of a multi-collection run, return
+the same session without importing earthaccess or logging in again.
+"""
+import os
+
+from aviris import metrics
+
+_session = None
+
+
+def setup_netrc():
+    """Ask for Earthdata credentials and write ``~/.netrc`` if it does not exist."""
+    netrc_path = os.path.expanduser("~/.netrc")
+    if not os.path.exists(netrc_path):
+        username = input("Enter NASA Earthdata username: ")
+        password = input("Enter NASA Earthdata password: ")
+
+        with open(netrc_path, 'w') as f:
+            f.write(f"machine urs.earthdata.nasa.gov\n")
+            f.write(f"login {username}\n")
+            f.write(f"password {password}\n")
+
+        os.chmod(netrc_path, 0o600)
+        print(f"✅ Created .netrc file at {netrc_path}")
+    else:
+        print("✅ .netrc file already exists")
+
+
+def earthdata_session(strategy=None, pool_size=None):
+    """
+    The authenticated session of this process, logging in on first use
+
+    Parameters
+    ----------
+    strategy : str, optional
+        earthaccess login strategy, e.g. "interactive" to prompt and persist
+        the credentials to ``~/.netrc``. By default earthaccess looks for
+        credentials in the environment and ``~/.netrc``; only if that fails
+        is ``~/.netrc`` set up, prompting for them, for requests to read.
+    pool_size : int, optional
+        Keep-alive connections per host, see ``aviris.download.make_session``.
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _session
+    if _session is not None:
+        return _session
+
+    import requests
+
+    from aviris.download import DEFAULT_WORKERS, make_session
+
+    session = None
+    try:
+        import earthaccess
+        with metrics.stage("auth"):
+            auth = earthaccess.login(strategy=strategy, persist=True) if strategy else earthaccess.login()
+        if not auth:
+            raise Exception("earthaccess login failed")
+        session = earthaccess.get_requests_https_session()
+        print("✅ Authenticated with earthaccess")
+    except Exception:
+        # requests reads the .netrc credentials on its own
+        print("Using .netrc authentication")
+        if strategy is None:
+            setup_netrc()
+        session = requests.Session()
+
+    _session = make_session(session, pool_size=pool_size or DEFAULT_WORKERS)
+    return _session
@@ -0,0 +1,340 @@
+"""
+Compression / tiling benchmark for hyperspectral GeoTIFF outputs.
+
+Every candidate layout (compression, predictor, tile size, interleave) is
+written with ``convert_windowed`` from the same ENVI source, either a real
+scene or a synthetic reflectance cube, and measured for
+
+    write_mbps     uncompressed megabytes converted per second
+    ratio          on-disk size relative to the uncompressed cube
+    spectrum_ms    median latency of reading all bands of one pixel
+    band_ms        median latency of reading one full band
+
+Each read reopens the file, so GDAL's block cache does not hide the cost of
+the layout. The best candidate can be saved as a JSON preset, which
+``convert_windowed``, ``convert_batch`` and ``netcdf_to_cog`` accept as
+``preset="path/to/preset.json"`` next to the built-in ``PRESETS``.
+
+Example
+-------
+$ python -m aviris.bench --out bench.csv --save-preset archive.json --rank ratio
+$ python NGL2toGeoTIF.py --preset archive.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from aviris.convert import convert_windowed
+
+COMPRESSIONS = ("none", "lzw", "deflate", "zstd", "lerc")
+PREDICTORS = (1, 2, 3)
+TILES = (128, 256, 512)
+INTERLEAVES = ("pixel", "band")
+
+FIELDS = ["name", "compress", "predictor", "tile", "interleave", "write_s", "write_mbps",
+          "size_mb", "ratio", "spectrum_ms", "band_ms"]
+# Smaller is better for all of these except write_mbps
+RANK_KEYS = ("ratio", "write_mbps", "spectrum_ms", "band_ms")
+
+
+def _gaussian(wavelength, center, width):
+    return np.exp(-0.5 * ((wavelength - center) / width) ** 2)
+
+
+def synthetic_cube(path, bands=425, height=512, width=512, dtype="float32", nodata=-9999.0, seed=0):
+    """
+    Write an AVIRIS-NG like ENVI BIL reflectance cube
+
+    Pixels are mixtures of vegetation, soil and water spectra with smoothly
+    varying abundances, atmospheric absorption dips and sensor noise, so the
+    cube compresses like real reflectance rather than like random numbers.
+    A diagonal flightline edge is filled with ``nodata``.
+
+    Parameters
+    ----------
+    path : str
+        Output ENVI data file; the ``.hdr`` is written next to it.
+    bands, height, width : int
+        Cube shape.
+    dtype : str
+        "float32" reflectance, or "int16" reflectance scaled by 10000.
+    nodata : float
+        Fill value outside the flightline.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    str
+        ``path``
+    """
+    rng = np.random.default_rng(seed)
+    wavelength = np.linspace(380, 2510, bands)
+
+    vegetation = 0.05 + 0.4 / (1 + np.exp(-(wavelength - 715) / 12)) + 0.05 * _gaussian(wavelength, 550, 30)
+    soil = 0.1 + 0.25 * (wavelength - 380) / 2130
+    water = 0.08 * np.exp(-(wavelength - 380) / 150)
+    absorption = 1 - 0.9 * _gaussian(wavelength, 1400, 40) - 0.95 * _gaussian(wavelength, 1900, 50)
+    endmembers = np.stack([vegetation, soil, water]) * absorption
+
+    # Smooth abundance fields: coarse noise upsampled to the image size
+    coarse = rng.random((3, height // 32 + 2, width // 32 + 2))
+    rows = np.linspace(0, coarse.shape[1] - 1, height)
+    cols = np.linspace(0, coarse.shape[2] - 1, width)
+    fields = np.stack([
+        np.array([np.interp(cols, np.arange(coarse.shape[2]), line) for line in layer])[
+            np.round(rows).astype(int)]
+        for layer in coarse
+    ])
+    abundance = fields / fields.sum(axis=0)
+
+    r, c = np.mgrid[:height, :width]
+    outside = np.abs(r * width / height - c) > width / 3
+
+    profile = {
+        "driver": "ENVI",
+        "dtype": dtype,
+        "count": bands,
+        "height": height,
+        "width": width,
+        "crs": "EPSG:32611",
+        "transform": from_origin(500000.0, 4000000.0, 5.0, 5.0),
+        "nodata": nodata,
+        "interleave": "bil",
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        for row_off in range(0, height, 64):
+            rows_ = slice(row_off, min(row_off + 64, height))
+            block = np.einsum("ehw,eb->bhw", abundance[:, rows_], endmembers)
+            block += rng.normal(0, 0.003, block.shape)
+            if np.dtype(dtype).kind in "iu":
+                block = np.round(block * 10000)
+            block[:, outside[rows_]] = nodata
+            dst.write(block.astype(dtype), window=Window(0, row_off, width, block.shape[1]))
+        for band in range(bands):
+            dst.set_band_description(band + 1, f"{wavelength[band]:.2f} nm")
+    return path
+
+
+def candidates(compressions=COMPRESSIONS, predictors=PREDICTORS, tiles=TILES, interleaves=INTERLEAVES,
+               dtype="float32"):
+    """
+    Option dicts for every valid combination
+
+    The floating point predictor is skipped for integer data, and LERC and
+    uncompressed outputs are only tried without a predictor.
+    """
+    for compress, predictor, tile, interleave in itertools.product(compressions, predictors, tiles, interleaves):
+        if predictor == 3 and np.dtype(dtype).kind != "f":
+            continue
+        if compress in ("none", "lerc") and predictor != 1:
+            continue
+        options = {"compress": compress, "predictor": predictor, "tile": tile, "interleave": interleave}
+        if compress == "none":
+            del options["compress"], options["predictor"]
+        yield options
+
+
+def option_name(options):
+    return "{compress}-p{predictor}-t{tile}-{interleave}".format(
+        **{"compress": "none", "predictor": 1, **options}
+    )
+
+
+def _median_ms(path, read, samples):
+    timings = []
+    for sample in samples:
+        start = time.perf_counter()
+        with rasterio.open(path) as src:
+            read(src, sample)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def measure(src_path, options, out_dir, reads=20, seed=0, keep=False, sparse=True, **convert_options):
+    """
+    Convert ``src_path`` with one option set and time writes and reads
+
+    Statistics sidecars are never written, so the write time is that of the
+    GeoTIFF alone. ``sparse`` is fixed for all option sets, as skipping empty
+    tiles changes both the write time and the size.
+
+    Returns
+    -------
+    dict
+        One record with the fields in ``FIELDS``.
+    """
+    name = option_name(options)
+    dst_path = os.path.join(out_dir, f"{name}.tif")
+    tile_options = dict(options)
+    tile = tile_options.pop("tile")
+
+    with rasterio.open(src_path) as src:
+        raw_bytes = src.count * src.height * src.width * np.dtype(src.dtypes[0]).itemsize
+        height, width, bands = src.height, src.width, src.count
+
+    start = time.perf_counter()
+    convert_windowed(src_path, dst_path, tile=tile, sparse=sparse, stats=False, **tile_options, **convert_options)
+    write_s = time.perf_counter() - start
+    size = os.path.getsize(dst_path)
+
+    rng = np.random.default_rng(seed)
+    pixels = list(zip(rng.integers(0, height, reads), rng.integers(0, width, reads)))
+    band_indexes = rng.integers(1, bands + 1, reads)
+
+    with rasterio.Env(GDAL_CACHEMAX=64):
+        spectrum_ms = _median_ms(dst_path, lambda src, rc: src.read(window=Window(rc[1], rc[0], 1, 1)), pixels)
+        band_ms = _median_ms(dst_path, lambda src, band: src.read(int(band)), band_indexes)
+
+    if not keep:
+        os.remove(dst_path)
+
+    return {
+        "name": name,
+        "compress": options.get("compress", "none"),
+        "predictor": options.get("predictor", 1),
+        "tile": tile,
+        "interleave": options["interleave"],
+        "write_s": round(write_s, 3),
+        "write_mbps": round(raw_bytes / 1024 ** 2 / write_s, 1),
+        "size_mb": round(size / 1024 ** 2, 2),
+        "ratio": round(size / raw_bytes, 4),
+        "spectrum_ms": round(spectrum_ms, 2),
+        "band_ms": round(band_ms, 2),
+    }
+
+
+def run_benchmark(src_path=None, out_dir=None, configs=None, reads=20, csv_path=None, **synthetic):
+    """
+    Benchmark every candidate layout on one cube
+
+    Parameters
+    ----------
+    src_path : str, optional
+        ENVI data file (or any raster) to convert. A synthetic cube is
+        generated when omitted.
+    out_dir : str, optional
+        Scratch directory, a temporary directory by default.
+    configs : iterable of dict, optional
+        Option sets, ``candidates()`` by default.
+    reads : int
+        Reads per latency measurement.
+    csv_path : str, optional
+        Write the records to this CSV file.
+    **synthetic
+        Shape / dtype of the synthetic cube, see ``synthetic_cube``.
+
+    Returns
+    -------
+    list[dict]
+    """
+    with tempfile.TemporaryDirectory(dir=out_dir) as scratch:
+        if src_path is None:
+            src_path = synthetic_cube(os.path.join(scratch, "synthetic.bin"), **synthetic)
+            print(f"Synthetic cube: {src_path}")
+
+        with rasterio.open(src_path) as src:
+            dtype = src.dtypes[0]
+        configs = list(configs or candidates(dtype=dtype))
+
+        records = []
+        for i, options in enumerate(configs, start=1):
+            try:
+                record = measure(src_path, options, scratch, reads=reads)
+            except Exception as e:
+                print(f"[{i}/{len(configs)}] ❌ {option_name(options)}: {e}")
+                continue
+            records.append(record)
+            print(f"[{i}/{len(configs)}] {record['name']}: {record['write_mbps']}MB/s, "
+                  f"ratio {record['ratio']}, spectrum {record['spectrum_ms']}ms, band {record['band_ms']}ms")
+
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    return records
+
+
+def rank(records, by="ratio"):
+    """Records sorted best first by one of ``RANK_KEYS``."""
+    if by not in RANK_KEYS:
+        raise ValueError(f"Unknown ranking '{by}', expected one of {RANK_KEYS}")
+    return sorted(records, key=lambda r: -r[by] if by == "write_mbps" else r[by])
+
+
+def preset_from_record(record):
+    """Converter options of a benchmark record."""
+    options = {"tile": int(record["tile"]), "interleave": record["interleave"]}
+    if record["compress"] != "none":
+        options["compress"] = record["compress"]
+        options["predictor"] = int(record["predictor"])
+    return options
+
+
+def save_preset(record, path):
+    """Save the options of a benchmark record as a JSON preset."""
+    with open(path, "w") as f:
+        json.dump({**preset_from_record(record), "benchmark": {k: record[k] for k in FIELDS}}, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GeoTIFF layouts for hyperspectral cubes")
+    parser.add_argument("--input", help="ENVI data file to convert (default: synthetic cube)")
+    parser.add_argument("--bands", type=int, default=425)
+    parser.add_argument("--size", type=int, default=512, help="synthetic cube height and width")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--compress", nargs="+", default=list(COMPRESSIONS))
+    parser.add_argument("--predictor", nargs="+", type=int, default=list(PREDICTORS))
+    parser.add_argument("--tile", nargs="+", type=int, default=list(TILES))
+    parser.add_argument("--interleave", nargs="+", default=list(INTERLEAVES))
+    parser.add_argument("--reads", type=int, default=20)
+    parser.add_argument("--scratch", help="directory for the test outputs (default: system temp)")
+    parser.add_argument("--out", default="compression_benchmark.csv")
+    parser.add_argument("--rank", default="ratio", choices=RANK_KEYS)
+    parser.add_argument("--save-preset", help="write the best layout as a JSON preset")
+    args = parser.parse_args()
+
+    dtype = args.dtype
+    if args.input:
+        with rasterio.open(args.input) as src:
+            dtype = src.dtypes[0]
+
+    records = run_benchmark(
+        args.input,
+        out_dir=args.scratch,
+        configs=candidates(args.compress, args.predictor, args.tile, args.interleave, dtype=dtype),
+        reads=args.reads,
+        csv_path=args.out,
+        bands=args.bands,
+        height=args.size,
+        width=args.size,
+        dtype=args.dtype,
+    )
+    if not records:
+        print("❌ No layout could be written")
+        return
+
+    best = rank(records, args.rank)
+    print(f"\n📊 Best by {args.rank}:")
+    for record in best[:5]:
+        print(f"   {record['name']}: {record[args.rank]}")
+    print(f"✅ Results written to {args.out}")
+
+    if args.save_preset:
+        save_preset(best[0], args.save_preset)
+        print(f"✅ Preset written to {args.save_preset}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+Shared, quota-managed granule cache.
+
+Every downloaded file lives at ``<root>/data/<granule>/<filename>``, so the
+HDR / BIN pair of a scene always sits in one directory. A SQLite index next
+to it records the checksum and size each file was verified against, when it
+was last used and who is using it:
+
+    lookup     a file is only served if its checksum still matches the CMR
+               metadata; a reprocessed granule is fetched again
+    insert     bytes go to ``<file>.part`` and are renamed into place once
+               verified, and only then is the entry marked ready, so no reader
+               ever sees a partial file
+    quota      before a fetch its size is reserved; least recently used files
+               are evicted until it fits, skipping pinned and in-flight ones.
+               In-flight files count with their reservation or the size of
+               their ``.part`` file, whichever is larger, so a file of unknown
+               size counts as it arrives and is reserved in full once complete
+    pinning    a file that is being converted or matched is pinned by its
+               process and never evicted under it
+
+Entries are keyed by granule and file name, not by content: the HDR / BIN
+pair has to keep its names side by side for GDAL, so a file cannot live
+under its checksum. The checksum is validated on every lookup instead, and a
+granule that CMR now lists with another checksum replaces its old copy.
+
+Fetches of the same file are serialised with a lock file, so several
+processes (SLURM array tasks, notebooks) sharing a cache download each file
+once. Pins and reservations of processes that died on this host are cleaned
+up on the next eviction; those of processes on other hosts, whose liveness
+cannot be checked, once they are older than the cache's lease.
+
+The index uses SQLite's default rollback journal rather than WAL, whose
+shared-memory index does not work across the nodes of a network file system.
+
+Example
+-------
+>>> cache = GranuleCache("/orange/ntziolas/aviris_cache", quota=2 * 1024 ** 4)
+>>> hdr = cache.get(hdr_url, expected=expected.get(hdr_name), session=session, pin=True)
+>>> ...
+>>> cache.unpin(hdr)
+"""
+import fcntl
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from aviris import metrics
+from aviris.download import ThroughputReport, download_file, make_session, scene_key, verify_file
+
+DEFAULT_ROOT = os.environ.get("AVIRIS_CACHE", "aviris_cache")
+DEFAULT_QUOTA = int(os.environ["AVIRIS_CACHE_QUOTA"]) if os.environ.get("AVIRIS_CACHE_QUOTA") else None
+DEFAULT_LEASE = 12 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    granule TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    checksum TEXT,
+    algorithm TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    owner TEXT,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (granule, filename)
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS pins (
+    granule TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    pinned REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pins_entry ON pins (granule, filename);
+"""
+
+
+class CacheFullError(Exception):
+    """No room can be made for a file within the cache quota."""
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """False only for processes on this host that no longer exist."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remote(owner):
+    """True for owners on another host, whose processes cannot be checked."""
+    return (owner or "").rpartition(":")[0] != socket.gethostname()
+
+
+class GranuleCache:
+    """
+    Granule files on local disk, shared between threads and processes
+
+    Parameters
+    ----------
+    root : str
+        Cache directory, ``$AVIRIS_CACHE`` or ``aviris_cache`` by default.
+    quota : int, optional
+        Maximum bytes of cached files, ``$AVIRIS_CACHE_QUOTA`` by default;
+        unlimited if neither is set.
+    wait : float
+        Seconds to wait for pinned or in-flight files to be released when the
+        quota is full before raising ``CacheFullError``.
+    poll : float
+        Seconds between checks while waiting for the quota or for another
+        process' fetch.
+    lease : float
+        Seconds after which pins and in-flight fetches of processes on other
+        hosts are assumed abandoned; longer than any conversion of a pinned
+        file.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, quota=DEFAULT_QUOTA, wait=3600, poll=10, lease=DEFAULT_LEASE):
+        self.root = root
+        self.quota = quota
+        self.wait = wait
+        self.poll = poll
+        self.lease = lease
+        self.owner = _owner()
+        self._session = None
+        os.makedirs(os.path.join(root, "data"), exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=60,
+                                    isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL is not safe across nodes of a network file system, see above
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+        if "pinned" not in [row["name"] for row in self.conn.execute("PRAGMA table_info(pins)")]:
+            # Index of an earlier version; its pins count as expired for other hosts
+            self.conn.execute("ALTER TABLE pins ADD COLUMN pinned REAL NOT NULL DEFAULT 0")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        """One write transaction; BEGIN IMMEDIATE serialises all processes."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def path(self, granule, filename):
+        """Location of a cached file, whether it is present or not."""
+        return os.path.join(self.root, "data", granule, filename)
+
+    def _key(self, path):
+        """``(granule, filename)`` of a path inside the cache."""
+        granule_dir, filename = os.path.split(os.path.abspath(path))
+        return os.path.basename(granule_dir), filename
+
+    def lookup(self, granule, filename, expected=None, pin=False):
+        """
+        Path of a ready file, or None
+
+        The entry is dropped if the file is gone, has the wrong size or was
+        verified against a different checksum than ``expected``.
+        """
+        path = self.path(granule, filename)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM entries WHERE granule = ? AND filename = ? AND state = 'ready'",
+                (granule, filename),
+            ).fetchone()
+            if row is None:
+                return None
+            stale = not os.path.exists(path) or os.path.getsize(path) != row["size"]
+            if expected is not None and expected.checksum and row["checksum"] != expected.checksum:
+                stale = True
+            if stale:
+                self._delete(conn, granule, filename)
+                return None
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE granule = ? AND filename = ?",
+                (time.time(), granule, filename),
+            )
+            if pin:
+                self._pin(conn, granule, filename)
+        return path
+
+    def _pin(self, conn, granule, filename):
+        conn.execute("INSERT INTO pins VALUES (?, ?, ?, ?)", (granule, filename, self.owner, time.time()))
+
+    @contextmanager
+    def _fetch_lock(self, granule, filename):
+        """Exclusive lock for fetching one file, held across processes."""
+        os.makedirs(os.path.dirname(self.path(granule, filename)), exist_ok=True)
+        lock_path = os.path.join(self.root, "data", granule, f".{filename}.lock")
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _delete(self, conn, granule, filename):
+        conn.execute("DELETE FROM entries WHERE granule = ? AND filename = ?", (granule, filename))
+        conn.execute("DELETE FROM pins WHERE granule = ? AND filename = ?", (granule, filename))
+        path = self.path(granule, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _drop_dead(self, conn):
+        """Forget pins and reservations of dead processes, or expired ones of other hosts."""
+        expired = time.time() - self.lease
+        for row in conn.execute("SELECT DISTINCT owner FROM pins").fetchall():
+            if not _owner_alive(row["owner"]):
+                conn.execute("DELETE FROM pins WHERE owner = ?", (row["owner"],))
+            elif _remote(row["owner"]):
+                conn.execute("DELETE FROM pins WHERE owner = ? AND pinned < ?", (row["owner"], expired))
+        for row in conn.execute(
+            "SELECT granule, filename, owner, created FROM entries WHERE state = 'fetching'"
+        ).fetchall():
+            if not _owner_alive(row["owner"]) or (_remote(row["owner"]) and row["created"] < expired):
+                conn.execute("DELETE FROM entries WHERE granule = ? AND filename = ?",
+                             (row["granule"], row["filename"]))
+
+    def _used(self, conn):
+        """Bytes of ready files plus in-flight ones, see the module docstring."""
+        used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE state = 'ready'").fetchone()[0]
+        for row in conn.execute("SELECT granule, filename, size FROM entries WHERE state = 'fetching'"):
+            part = self.path(row["granule"], row["filename"]) + ".part"
+            used += max(row["size"], os.path.getsize(part) if os.path.exists(part) else 0)
+        return used
+
+    def _evict(self, conn, nbytes):
+        """Evict least recently used files until ``nbytes`` more fit; True if they do."""
+        if self.quota is None:
+            return True
+        self._drop_dead(conn)
+        used = self._used(conn)
+        if used + nbytes <= self.quota:
+            return True
+        candidates = conn.execute(
+            "SELECT granule, filename, size FROM entries e WHERE state = 'ready' AND NOT EXISTS "
+            "(SELECT 1 FROM pins p WHERE p.granule = e.granule AND p.filename = e.filename) "
+            "ORDER BY last_access"
+        ).fetchall()
+        for row in candidates:
+            self._delete(conn, row["granule"], row["filename"])
+            used -= row["size"]
+            print(f"🧹 Evicted {row['filename']} ({row['size'] / 1024 ** 2:.0f}MB) from the cache")
+            if used + nbytes <= self.quota:
+                return True
+        # Nothing left that will ever be released: let a single oversized file through
+        return used == 0
+
+    def _reserve(self, granule, filename, nbytes, expected):
+        """Make room for and register an in-flight file, waiting for the quota if needed."""
+        deadline = time.time() + self.wait
+        waited = False
+        while True:
+            with self._transaction() as conn:
+                if self._evict(conn, nbytes):
+                    now = time.time()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, 'fetching', ?, ?, ?)",
+                        (granule, filename, expected.checksum if expected else None,
+                         expected.algorithm if expected else None, nbytes, self.owner, now, now),
+                    )
+                    return
+            if time.time() > deadline:
+                raise CacheFullError(f"No room for {filename} ({nbytes} bytes) within the {self.quota} byte quota")
+            if not waited:
+                print("⏸️ Cache quota full, waiting for pinned files to be released")
+                waited = True
+            time.sleep(self.poll)
+
+    def _commit(self, granule, filename, path, pin, expected, reserved):
+        nbytes = os.path.getsize(path)
+        with self._transaction() as conn:
+            # The size was not known up front: make room for the rest of it
+            # while the file is still in flight and cannot be evicted itself
+            if nbytes > reserved and not self._evict(conn, nbytes - reserved):
+                print(f"⚠️ {filename} ({nbytes / 1024 ** 2:.0f}MB) leaves the cache above its quota")
+            now = time.time()
+            # Re-inserted in case the reservation expired while the file was fetched
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, 'ready', NULL, ?, ?)",
+                (granule, filename, expected.checksum if expected else None,
+                 expected.algorithm if expected else None, nbytes, now, now),
+            )
+            if pin:
+                self._pin(conn, granule, filename)
+
+    def _release(self, granule, filename):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM entries WHERE granule = ? AND filename = ? AND state = 'fetching'",
+                (granule, filename),
+            )
+
+    def get(self, url, granule=None, filename=None, expected=None, session=None, report=None,
+            download=None, pin=False, timeout=30):
+        """
+        Local path of a remote file, downloading it only if it is not cached
+
+        Parameters
+        ----------
+        url : str
+            File URL.
+        granule : str, optional
+            Cache directory of the file, the scene name of ``url`` (file name
+            without extension) by default, which the HDR and BIN share.
+        filename : str, optional
+            Name of the cached file, the last part of ``url`` by default.
+        expected : FileInfo, optional
+            Size and checksum from CMR, see ``aviris.cmr``. Cached files with
+            another checksum are fetched again.
+        session : requests.Session, optional
+            Session for ``aviris.download.download_file``, see
+            ``aviris.download.make_session`` for the default.
+        report : ThroughputReport, optional
+            Download counters to update.
+        download : callable, optional
+            ``download(url, path)`` used instead of ``download_file``, e.g.
+            for servers that need cookies. It must write ``path``.
+        pin : bool
+            Pin the file for this process, see ``unpin``.
+        timeout : float
+            Connect / read timeout of the download.
+
+        Returns
+        -------
+        str
+        """
+        filename = filename or url.split("/")[-1]
+        granule = granule or scene_key(filename)
+        path = self.lookup(granule, filename, expected, pin=pin)
+        if path is not None:
+            if report is not None:
+                report.skip()
+            metrics.record("cache_hit", filename, bytes=os.path.getsize(path))
+            return path
+
+        with self._fetch_lock(granule, filename):
+            # Another process may have fetched it while we waited for the lock
+            path = self.lookup(granule, filename, expected, pin=pin)
+            if path is not None:
+                if report is not None:
+                    report.skip()
+                metrics.record("cache_hit", filename, bytes=os.path.getsize(path))
+                return path
+
+            path = self.path(granule, filename)
+            if os.path.exists(path):
+                # Unindexed or stale copy, e.g. from an interrupted eviction
+                os.remove(path)
+            # Unknown sizes are reserved as nothing and accounted for in _commit
+            nbytes = expected.size if expected is not None and expected.size else 0
+            self._reserve(granule, filename, nbytes, expected)
+            try:
+                if download is not None:
+                    download(url, path + ".part")
+                    verify_file(path + ".part", expected, filename)
+                    os.replace(path + ".part", path)
+                else:
+                    if session is None:
+                        self._session = self._session or make_session()
+                        session = self._session
+                    report = report if report is not None else ThroughputReport()
+                    download_file(session, url, path, report, expected=expected, timeout=timeout)
+                    report.done()
+            except BaseException:
+                # The .part file is kept so that the next fetch resumes it
+                self._release(granule, filename)
+                raise
+            self._commit(granule, filename, path, pin, expected, nbytes)
+        return path
+
+    def add(self, src_path, granule=None, expected=None, move=False, pin=False):
+        """
+        Put an existing local file into the cache, e.g. a previous download
+
+        The file is copied (or moved) next to its final location and renamed
+        into place, so the insert is atomic as well.
+
+        Returns
+        -------
+        str
+            Path of the cached file.
+        """
+        filename = os.path.basename(src_path)
+        granule = granule or scene_key(filename)
+        path = self.lookup(granule, filename, expected, pin=pin)
+        if path is not None:
+            return path
+        with self._fetch_lock(granule, filename):
+            path = self.path(granule, filename)
+            nbytes = os.path.getsize(src_path)
+            self._reserve(granule, filename, nbytes, expected)
+            try:
+                if move:
+                    shutil.move(src_path, path + ".part")
+                else:
+                    shutil.copyfile(src_path, path + ".part")
+                os.replace(path + ".part", path)
+            except BaseException:
+                self._release(granule, filename)
+                raise
+            self._commit(granule, filename, path, pin, expected, nbytes)
+        return path
+
+    def pin(self, path):
+        """Protect a cached file from eviction until this process unpins it."""
+        granule, filename = self._key(path)
+        with self._transaction() as conn:
+            self._pin(conn, granule, filename)
+
+    def unpin(self, path):
+        """Release one pin of this process on a cached file."""
+        granule, filename = self._key(path)
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM pins WHERE rowid = (SELECT rowid FROM pins WHERE granule = ? AND filename = ? "
+                "AND owner = ? LIMIT 1)",
+                (granule, filename, self.owner),
+            )
+
+    @contextmanager
+    def pinned(self, paths):
+        """Pin ``paths`` for the duration of a ``with`` block."""
+        for path in paths:
+            self.pin(path)
+        try:
+            yield paths
+        finally:
+            for path in paths:
+                self.unpin(path)
+
+    def remove(self, path):
+        """Drop a cached file now, regardless of its pins."""
+        granule, filename = self._key(path)
+        with self._transaction() as conn:
+            self._delete(conn, granule, filename)
+
+    def evict(self, nbytes=0):
+        """Evict until the cache is ``nbytes`` below its quota; True if that worked."""
+        with self._transaction() as conn:
+            return self._evict(conn, nbytes)
+
+    def files(self, pattern=None):
+        """
+        Paths of all ready files, most recently used first
+
+        Parameters
+        ----------
+        pattern : str, optional
+            SQL ``LIKE`` pattern on the file name, e.g. ``"%.hdr"``.
+        """
+        query = "SELECT granule, filename FROM entries WHERE state = 'ready'"
+        params = ()
+        if pattern:
+            query += " AND filename LIKE ?"
+            params = (pattern,)
+        with self._lock:
+            rows = self.conn.execute(query + " ORDER BY last_access DESC", params).fetchall()
+        return [self.path(row["granule"], row["filename"]) for row in rows]
+
+    def usage(self):
+        """``(bytes used, number of files)`` including in-flight downloads."""
+        with self._lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return self._used(self.conn), count
@@ -0,0 +1,201 @@
+"""
+Local SQLite catalog of CMR granules.
+
+The first sync of a collection pages through the whole CMR feed once. Later
+syncs only ask CMR for granules updated since the previous sync, so listing
+and filtering a collection is a local query that also works offline.
+
+Example
+-------
+>>> catalog = Catalog()
+>>> catalog.sync("C2659129205-ORNL_CLOUD")
+>>> granules = catalog.granules("C2659129205-ORNL_CLOUD", start="2022-07-01")
+"""
+import json
+import os
+import sqlite3
+from dataclasses import replace
+from datetime import datetime, timezone
+
+DEFAULT_PATH = os.environ.get("AVIRIS_CATALOG", "aviris_catalog.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS granules (
+    id TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    title TEXT NOT NULL,
+    time_start TEXT,
+    time_end TEXT,
+    updated TEXT,
+    polygons TEXT,
+    links TEXT
+);
+CREATE INDEX IF NOT EXISTS granules_collection_title ON granules (collection, title);
+CREATE INDEX IF NOT EXISTS granules_collection_time ON granules (collection, time_start);
+CREATE TABLE IF NOT EXISTS sync_state (
+    collection TEXT PRIMARY KEY,
+    last_sync TEXT NOT NULL
+);
+"""
+
+
+class Catalog:
+    """
+    Granule catalog stored in a SQLite file
+
+    Parameters
+    ----------
+    path : str
+        Location of the database, ``$AVIRIS_CATALOG`` or
+        ``aviris_catalog.sqlite`` by default.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def last_sync(self, collection):
+        """Time of the last successful sync of ``collection``, or None."""
+        row = self.conn.execute(
+            "SELECT last_sync FROM sync_state WHERE collection = ?", (collection,)
+        ).fetchone()
+        return row["last_sync"] if row else None
+
+    def sync(self, collection, session=None, full=False, cmr_url=None):
+        """
+        Bring the catalog of ``collection`` up to date with CMR
+
+        Parameters
+        ----------
+        collection : str
+            Collection concept ID, e.g. "C2659129205-ORNL_CLOUD".
+        session : requests.Session, optional
+            Session to use for the CMR requests.
+        full : bool
+            Re-read the whole collection and drop granules that are no longer
+            in CMR, instead of only fetching the ones updated since last sync.
+        cmr_url : str, optional
+            Base URL of the CMR search API, ``aviris.cmr.CMR_URL`` by default.
+
+        Returns
+        -------
+        int
+            Number of granules added or updated.
+        """
+        # Imported here so that reading the catalog does not load requests
+        from aviris.cmr import CMR_URL, search_granules
+
+        cmr_url = cmr_url or CMR_URL
+        # Taken before the query so nothing updated during the sync is missed
+        started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        since = None if full else self.last_sync(collection)
+
+        params = {"updated_since": since} if since else {}
+        seen = []
+        for entry in search_granules(collection, session=session, cmr_url=cmr_url, **params):
+            seen.append(self._row(collection, entry))
+            if len(seen) % 2000 == 0:
+                print(f"Catalog {collection}: {len(seen)} granules received")
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?)", seen
+            )
+            if full:
+                self.conn.execute("CREATE TEMP TABLE seen (id TEXT PRIMARY KEY)")
+                self.conn.executemany("INSERT INTO seen VALUES (?)", [(row[0],) for row in seen])
+                self.conn.execute(
+                    "DELETE FROM granules WHERE collection = ? AND id NOT IN (SELECT id FROM seen)",
+                    (collection,),
+                )
+                self.conn.execute("DROP TABLE seen")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (collection, started)
+            )
+
+        print(f"✅ Catalog {collection}: {len(seen)} granules added or updated")
+        return len(seen)
+
+    @staticmethod
+    def _row(collection, entry):
+        return (
+            entry["id"],
+            collection,
+            entry["title"],
+            entry.get("time_start"),
+            entry.get("time_end"),
+            entry.get("updated"),
+            json.dumps(entry.get("polygons", [])),
+            json.dumps(entry.get("links", [])),
+        )
+
+    def granules(self, collection, start=None, end=None, title_like=None, query=None):
+        """
+        Granules of ``collection`` in the same shape as the granules.json entries
+
+        Parameters
+        ----------
+        collection : str
+            Collection concept ID.
+        start, end : str, optional
+            Only return granules that start at or after ``start`` and before
+            ``end`` (ISO 8601 strings, e.g. "2022-07-01").
+        title_like : str, optional
+            SQL ``LIKE`` pattern on the granule title, e.g. "%_rfl_%".
+        query : GranuleQuery, optional
+            Its date window and title pattern run in SQL, the spatial filters
+            vectorized over the returned footprints.
+
+        Returns
+        -------
+        list[dict]
+            Granules sorted by title.
+        """
+        if query is not None:
+            start = max(filter(None, [start, query.start]), default=None)
+            end = min(filter(None, [end, query.end]), default=None)
+
+        sql = "SELECT * FROM granules WHERE collection = ?"
+        args = [collection]
+        if start:
+            sql += " AND time_start >= ?"
+            args.append(start)
+        if end:
+            sql += " AND time_start < ?"
+            args.append(end)
+        if title_like:
+            sql += " AND title LIKE ?"
+            args.append(title_like)
+        if query is not None and query.title_pattern:
+            sql += " AND title GLOB ?"
+            args.append(query.title_pattern)
+        sql += " ORDER BY title"
+
+        granules = [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "time_start": row["time_start"],
+                "time_end": row["time_end"],
+                "updated": row["updated"],
+                "polygons": json.loads(row["polygons"]),
+                "links": json.loads(row["links"]),
+            }
+            for row in self.conn.execute(sql, args)
+        ]
+        if query is None or (query.lat_band is None and query.bbox is None and query.polygon is None):
+            return granules
+        # The date window and title pattern already ran in SQL
+        return replace(query, start=None, end=None, title_pattern=None).filter(granules)
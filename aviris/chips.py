@@ -0,0 +1,333 @@
+"""
+Sharded AVIRIS / EnMAP training chips.
+
+Cuts co-located patches out of the aligned GeoTIFFs written by
+``aviris.coregister`` and stores them in fixed-size NPY shards, so a training
+loader never opens a whole scene:
+
+    <pair>_000_aviris.npy   (chips, AVIRIS bands, size, size) float32
+    <pair>_000_enmap.npy    (chips, EnMAP bands, size, size) in the EnMAP dtype
+    <pair>_000_mask.npy     (chips, size, size) uint8, 1 where both are valid
+    <pair>.csv              index of the pair's chips
+    index.csv               index of all chips
+
+Chips are the first axis of every shard and the shards are plain C-order
+``.npy`` files, so reading one chip from a memory-mapped shard is a single
+contiguous read of ``bands * size * size`` values. Every index row holds the
+chip's shard and position, its bounds in the pair CRS and in lon / lat, the
+AVIRIS and EnMAP acquisition dates, the EnMAP cloud cover and the valid
+fraction of the chip. Pairs are exported in parallel, one pair per process;
+each pair writes only its own shards, so workers never share a file.
+
+Example
+-------
+>>> metadata = {pair_name(aviris_path, enmap_path): pair_metadata(row)}
+>>> export_chips(image_pairs, "coregistered", "chips", metadata=metadata, workers=8)
+>>> chips = ChipDataset("chips")
+>>> aviris, enmap, mask = chips[12345]
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import rasterio
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+
+from aviris import metrics
+from aviris.convert import DEFAULT_GDAL_CACHE, init_worker
+from aviris.coregister import pair_name
+
+DEFAULT_SIZE = 64
+DEFAULT_CHIPS_PER_SHARD = 128
+KINDS = ("aviris", "enmap", "mask")
+METADATA_FIELDS = ("aviris_granule", "aviris_title", "aviris_date", "enmap_id", "enmap_date", "cloud_cover")
+INDEX_FIELDS = ("chip", "shard", "position", "pair", "row", "col", "valid_fraction", "crs",
+                "left", "bottom", "right", "top", "lon_min", "lat_min", "lon_max", "lat_max") + METADATA_FIELDS
+
+
+def pair_metadata(row):
+    """Index metadata (``METADATA_FIELDS``) of one row of ``aviris.enmap.match_enmap``."""
+    return {
+        "aviris_granule": row["granule_id"],
+        "aviris_title": row["title"],
+        "aviris_date": row["time_start"].isoformat(),
+        "enmap_id": row["enmap_id"],
+        "enmap_date": row["start_datetime"].isoformat(),
+        "cloud_cover": float(row["cloud_cover"]),
+    }
+
+
+def chip_windows(mask, size=DEFAULT_SIZE, stride=None, min_valid=0.9):
+    """
+    Chip windows of a pair with enough valid pixels
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        ``(rows, cols)`` validity mask of the pair.
+    size : int
+        Chip size in pixels.
+    stride : int, optional
+        Step between chips, ``size`` (no overlap) by default.
+    min_valid : float
+        Smallest fraction of valid pixels a chip may have.
+
+    Returns
+    -------
+    list[tuple[int, int, float]]
+        ``(row, col, valid_fraction)`` of every chip, in row-major order.
+    """
+    stride = stride or size
+    rows, cols = mask.shape
+    if rows < size or cols < size:
+        return []
+    # Valid pixels of every chip at once from a summed-area table
+    table = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+    table[1:, 1:] = mask.astype(bool).cumsum(axis=0).cumsum(axis=1)
+    row0 = np.arange(0, rows - size + 1, stride)[:, np.newaxis]
+    col0 = np.arange(0, cols - size + 1, stride)[np.newaxis, :]
+    valid = (table[row0 + size, col0 + size] - table[row0, col0 + size]
+             - table[row0 + size, col0] + table[row0, col0]) / (size * size)
+    keep = np.argwhere(valid >= min_valid)
+    return [(int(row0[r, 0]), int(col0[0, c]), float(valid[r, c])) for r, c in keep]
+
+
+def export_pair(paths, out_dir, name, size=DEFAULT_SIZE, stride=None, min_valid=0.9,
+                chips_per_shard=DEFAULT_CHIPS_PER_SHARD, metadata=None, gdal_cache=DEFAULT_GDAL_CACHE):
+    """
+    Cut the chips of one co-registered pair into shards
+
+    Parameters
+    ----------
+    paths : dict
+        ``{"aviris", "enmap", "mask"}`` aligned GeoTIFFs of the pair, as
+        returned by ``aviris.coregister.coregister_pair``.
+    out_dir : str
+        Directory for the shards.
+    name : str
+        Pair name, the prefix of its shards.
+    size, stride, min_valid
+        Chip layout, see ``chip_windows``.
+    chips_per_shard : int
+        Chips per shard; the last shard of a pair may hold fewer.
+    metadata : dict, optional
+        Values of ``METADATA_FIELDS`` copied into every index row.
+    gdal_cache : int
+        GDAL block cache size in bytes.
+
+    Returns
+    -------
+    list[dict]
+        The index rows of the pair's chips, also written to ``<name>.csv``.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    metadata = metadata or {}
+    rows = []
+
+    with rasterio.Env(GDAL_CACHEMAX=max(1, gdal_cache // (1024 * 1024))):
+        with rasterio.open(paths["aviris"]) as aviris, rasterio.open(paths["enmap"]) as enmap, \
+                rasterio.open(paths["mask"]) as mask_src:
+            mask = mask_src.read(1)
+            windows = chip_windows(mask, size, stride, min_valid)
+            shapes = {
+                "aviris": ((aviris.count, size, size), np.float32),
+                "enmap": ((enmap.count, size, size), np.dtype(enmap.dtypes[0])),
+                "mask": ((size, size), np.uint8),
+            }
+            crs = aviris.crs.to_string() if aviris.crs else ""
+
+            for shard_index, first in enumerate(range(0, len(windows), chips_per_shard)):
+                shard = f"{name}_{shard_index:03d}"
+                chunk = windows[first:first + chips_per_shard]
+                tmp = {kind: os.path.join(out_dir, f"{shard}_{kind}.npy.tmp") for kind in KINDS}
+                arrays = {
+                    kind: np.lib.format.open_memmap(tmp[kind], mode="w+", dtype=dtype, shape=(len(chunk), *shape))
+                    for kind, (shape, dtype) in shapes.items()
+                }
+
+                # One read of ``size`` rows per chip row of the shard, cut into chips
+                by_row = {}
+                for position, (row, col, valid) in enumerate(chunk):
+                    by_row.setdefault(row, []).append((position, col, valid))
+                for row, chips in by_row.items():
+                    strip = Window(0, row, aviris.width, size)
+                    aviris_strip = aviris.read(window=strip, out_dtype=np.float32)
+                    enmap_strip = enmap.read(window=strip)
+                    for position, col, valid in chips:
+                        arrays["aviris"][position] = aviris_strip[:, :, col:col + size]
+                        arrays["enmap"][position] = enmap_strip[:, :, col:col + size]
+                        arrays["mask"][position] = mask[row:row + size, col:col + size]
+
+                        bounds = aviris.window_bounds(Window(col, row, size, size))
+                        lon_lat = transform_bounds(aviris.crs, "EPSG:4326", *bounds) if aviris.crs else bounds
+                        rows.append({
+                            "chip": f"{shard}:{position}",
+                            "shard": shard,
+                            "position": position,
+                            "pair": name,
+                            "row": row,
+                            "col": col,
+                            "valid_fraction": round(valid, 4),
+                            "crs": crs,
+                            **dict(zip(("left", "bottom", "right", "top"), bounds)),
+                            **dict(zip(("lon_min", "lat_min", "lon_max", "lat_max"), lon_lat)),
+                            **{field: metadata.get(field, "") for field in METADATA_FIELDS},
+                        })
+
+                for kind in KINDS:
+                    arrays[kind].flush()
+                    del arrays[kind]
+                    os.replace(tmp[kind], os.path.join(out_dir, f"{shard}_{kind}.npy"))
+
+    rows.sort(key=lambda r: (r["shard"], r["position"]))
+    # Written last: a pair with an index is complete
+    write_index(rows, os.path.join(out_dir, f"{name}.csv"))
+    return rows
+
+
+def write_index(rows, path):
+    """Index rows as CSV, replaced only once complete."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_index(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _export(paths, out_dir, name, options):
+    start = time.time()
+    with metrics.stage("chips", name) as m:
+        rows = export_pair(paths, out_dir, name, **options)
+        m.update(chips=len(rows), bytes=sum(
+            os.path.getsize(os.path.join(out_dir, f"{shard}_{kind}.npy"))
+            for shard in {r["shard"] for r in rows} for kind in KINDS
+        ))
+    return time.time() - start, len(rows)
+
+
+def export_chips(pairs, coregister_dir, out_dir, metadata=None, workers=None, threads_per_worker=1, **options):
+    """
+    Export the chips of many co-registered pairs in parallel, one pair per process
+
+    Pairs that already have an index in ``out_dir`` are skipped, and so are
+    pairs without co-registered GeoTIFFs (no overlap, or failed).
+
+    Parameters
+    ----------
+    pairs : list[tuple[str, str]]
+        ``(aviris_path, enmap_path)`` tuples, as passed to
+        ``aviris.coregister.coregister_pairs``.
+    coregister_dir : str
+        Output directory of ``coregister_pairs``.
+    out_dir : str
+        Directory for the shards and the indexes.
+    metadata : dict, optional
+        Per-pair index metadata keyed by ``pair_name(aviris_path,
+        enmap_path)``, see ``pair_metadata``.
+    workers : int, optional
+        Number of worker processes, all CPUs by default.
+    threads_per_worker : int
+        GDAL threads each worker may use.
+    **options
+        Passed on to ``export_pair``, e.g. ``size=128``.
+
+    Returns
+    -------
+    list[dict]
+        All index rows, also written to ``<out_dir>/index.csv``.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    metadata = metadata or {}
+    names = []
+    jobs = {}
+
+    for aviris_path, enmap_path in pairs:
+        name = pair_name(aviris_path, enmap_path)
+        names.append(name)
+        paths = {kind: os.path.join(coregister_dir, f"{name}_{kind}.tif") for kind in KINDS}
+        if os.path.exists(os.path.join(out_dir, f"{name}.csv")) or not os.path.exists(paths["mask"]):
+            continue
+        jobs[name] = paths
+
+    print(f"{len(jobs)} pairs to export, {len(names) - len(jobs)} skipped, {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_worker,)) as pool:
+        futures = {
+            pool.submit(_export, paths, out_dir, name, {**options, "metadata": metadata.get(name)}): name
+            for name, paths in jobs.items()
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            name = futures[future]
+            try:
+                seconds, count = future.result()
+                print(f"[{i}/{len(jobs)}] ✔️ {name}: {count} chips in {seconds:.1f}s")
+            except Exception as e:
+                print(f"[{i}/{len(jobs)}] ❌ {name}: {e}")
+
+    rows = []
+    for name in dict.fromkeys(names):
+        path = os.path.join(out_dir, f"{name}.csv")
+        if os.path.exists(path):
+            rows.extend(read_index(path))
+    write_index(rows, os.path.join(out_dir, "index.csv"))
+    print(f"📦 {len(rows)} chips in {out_dir}")
+    return rows
+
+
+class ChipDataset:
+    """
+    Random access to exported chips
+
+    Shards are memory-mapped on first use, in the process that reads them,
+    so the dataset can be handed to the worker processes of a data loader.
+    ``dataset[i]`` reads chip ``i`` of the index with one contiguous read per
+    array.
+
+    Parameters
+    ----------
+    directory : str
+        Output directory of ``export_chips``.
+    index : list[dict], optional
+        Index rows to use, e.g. filtered by date or cloud cover; all chips in
+        ``<directory>/index.csv`` by default.
+    """
+
+    def __init__(self, directory, index=None):
+        self.directory = directory
+        self.index = index if index is not None else read_index(os.path.join(directory, "index.csv"))
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _shard(self, shard):
+        arrays = self._shards.get(shard)
+        if arrays is None:
+            arrays = self._shards[shard] = {
+                kind: np.load(os.path.join(self.directory, f"{shard}_{kind}.npy"), mmap_mode="r")
+                for kind in KINDS
+            }
+        return arrays
+
+    def __getitem__(self, i):
+        """``(aviris, enmap, mask)`` arrays of one chip."""
+        row = self.index[i]
+        arrays = self._shard(row["shard"])
+        position = int(row["position"])
+        return tuple(np.array(arrays[kind][position]) for kind in KINDS)
+
+    def __getstate__(self):
+        # Memory maps are reopened in the receiving process
+        return {**self.__dict__, "_shards": {}}
@@ -0,0 +1,268 @@
+"""
+Command line entry point for the registered collections.
+
+    python -m aviris list [COLLECTION ...] [--sync] [--links]
+    python -m aviris download COLLECTION ... [--limit N]
+    python -m aviris convert COLLECTION ... [--preset archive] [--manifest SQLITE]
+    python -m aviris match COLLECTION ... [--cloud-cover 30] [--months 1]
+
+Collections are the short names or concept IDs of ``aviris.registry``.
+Heavy modules (rasterio, geopandas, earthaccess) are imported by the
+subcommand that needs them, so ``list`` answers from the local catalog
+without loading them, and the Earthdata login happens once per process,
+on first use, for all collections of a run.
+"""
+import argparse
+import os
+
+from aviris.registry import COLLECTIONS, get_collection
+
+
+def _granules(catalog, collection, args, session=None):
+    """Granules of a collection from the catalog, synced with CMR first with ``--sync`` or on first use."""
+    if args.sync or catalog.last_sync(collection.concept_id) is None:
+        catalog.sync(collection.concept_id, session=session)
+    return catalog.granules(collection.concept_id, start=args.start or collection.start, end=args.end)
+
+
+def _data_links(collection, granules, limit=None):
+    """``(granule_id, url)`` of every data file, the first ``limit`` only if given."""
+    links = [(granule["id"], url) for granule in granules for url in collection.data_links(granule)]
+    return links[:limit] if limit else links
+
+
+def _start_metrics(args):
+    from aviris import metrics
+
+    if args.metrics_dir:
+        names = [get_collection(name).name for name in args.collections]
+        metrics.start_run("_".join([args.command, *names]), args.metrics_dir)
+
+
+def _report(args):
+    from aviris import metrics
+
+    if args.metrics_dir:
+        metrics.report()
+
+
+def _fetch(collection, args, catalog, session, cache):
+    """Download the data files of a collection through the cache; returns the local paths."""
+    from aviris.cmr import fetch_file_info
+    from aviris.download import download_files
+
+    links = _data_links(collection, _granules(catalog, collection, args, session), args.limit)
+    if not links:
+        print(f"No {' / '.join(collection.suffixes)} links in {collection.name}")
+        return []
+    print(f"⬇️ {collection.name}: {len(links)} files")
+    # Sizes and checksums from CMR, every file is verified before it is kept
+    expected = fetch_file_info({granule_id for granule_id, _ in links}, session=session)
+    return download_files([url for _, url in links], session=session, expected=expected, cache=cache)
+
+
+def _cache(args):
+    from aviris.cache import GranuleCache
+
+    # $AVIRIS_CACHE_QUOTA applies unless a quota is given
+    return GranuleCache(quota=args.cache_quota) if args.cache_quota else GranuleCache()
+
+
+def cmd_list(args):
+    from aviris.catalog import Catalog
+
+    if not args.collections:
+        for collection in COLLECTIONS.values():
+            print(f"{collection.name:8s} {collection.concept_id:24s} {collection.format:7s} {collection.title}")
+        return
+
+    with Catalog(args.catalog) as catalog:
+        for name in args.collections:
+            collection = get_collection(name)
+            granules = _granules(catalog, collection, args)
+            links = _data_links(collection, granules, args.limit)
+            print(f"\n{collection.title} ({collection.concept_id})")
+            print(f"Granules: {len(granules)}, last sync {catalog.last_sync(collection.concept_id)}")
+            print(f"Data files ({', '.join(collection.suffixes)}): {len(links)}")
+            if args.links:
+                for _, url in links:
+                    print(url)
+
+
+def cmd_download(args):
+    from aviris.auth import earthdata_session
+    from aviris.catalog import Catalog
+
+    _start_metrics(args)
+    session = earthdata_session(args.login)
+    cache = _cache(args)
+    with Catalog(args.catalog) as catalog:
+        for name in args.collections:
+            collection = get_collection(name)
+            files = _fetch(collection, args, catalog, session, cache)
+            print(f"\n✅ {collection.name}: {len(files)} files in {cache.root}")
+    _report(args)
+
+
+def _convert_envi(collection, args, catalog, session, cache, output_dir):
+    """Convert a collection with the pipeline; True once no scene is left, also for the other array tasks."""
+    from aviris.cmr import fetch_file_info
+    from aviris.pipeline import run_pipeline
+    from aviris.shard import Manifest
+
+    links = _data_links(collection, _granules(catalog, collection, args, session), args.limit)
+    if not links:
+        print(f"No {' / '.join(collection.suffixes)} links in {collection.name}")
+        return True
+    expected = fetch_file_info({granule_id for granule_id, _ in links}, session=session)
+    # Under a SLURM job array every task claims scenes from the shared manifest
+    manifest = Manifest(args.manifest) if args.manifest else None
+    try:
+        result = run_pipeline(
+            [url for _, url in links],
+            None,
+            output_dir,
+            session=session,
+            expected=expected,
+            cache=cache,
+            manifest=manifest,
+            preset=args.preset or "archive",
+        )
+        finished = manifest is None or not any(manifest.status()[state] for state in ("pending", "running"))
+    finally:
+        if manifest is not None:
+            manifest.close()
+    print(f"\n✅ {collection.name}: {len(result['converted'])} GeoTIFFs in {output_dir}, "
+          f"{len(result['failed'])} failed")
+    return finished
+
+
+def _convert_netcdf(collection, args, catalog, session, cache, output_dir):
+    from aviris.cog import netcdf_to_cog
+
+    os.makedirs(output_dir, exist_ok=True)
+    for nc_path in _fetch(collection, args, catalog, session, cache):
+        cog_path = os.path.join(output_dir, os.path.basename(nc_path)[:-3] + ".tif")
+        if os.path.exists(cog_path):
+            continue
+        try:
+            # Pinned so that other jobs filling the cache cannot evict it mid-conversion
+            with cache.pinned([nc_path]):
+                netcdf_to_cog(nc_path, cog_path, preset=args.preset)
+            print(f"✅ COG written: {cog_path}")
+        except Exception as e:
+            print(f"❌ COG conversion failed for {nc_path}: {e}")
+
+
+def cmd_convert(args):
+    from aviris.auth import earthdata_session
+    from aviris.catalog import Catalog
+    from aviris.stats import reduce_directory
+
+    _start_metrics(args)
+    session = earthdata_session(args.login)
+    cache = _cache(args)
+    with Catalog(args.catalog) as catalog:
+        for name in args.collections:
+            collection = get_collection(name)
+            output_dir = args.output_dir or collection.output_dir
+            finished = True
+            if collection.format == "envi":
+                finished = _convert_envi(collection, args, catalog, session, cache, output_dir)
+            else:
+                _convert_netcdf(collection, args, catalog, session, cache, output_dir)
+            # Collection-wide band statistics from the sidecars written while converting, once
+            # every task of an array is through; the merge is locked, so it runs only once
+            if finished:
+                reduce_directory(output_dir)
+    _report(args)
+
+
+def cmd_match(args):
+    from aviris.catalog import Catalog
+    from aviris.enmap import match_enmap
+    from aviris.footprints import FootprintIndex
+    from aviris.query import GranuleQuery
+
+    _start_metrics(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    query = GranuleQuery(lat_band=(-90, args.lat_max))
+    with Catalog(args.catalog) as catalog:
+        for name in args.collections:
+            collection = get_collection(name)
+            granules = query.filter(_granules(catalog, collection, args))
+            # One granule per scene: the ones holding the first data file, e.g. the .hdr
+            granules = [g for g in granules if any(url.endswith(collection.suffixes[0])
+                                                   for url in collection.data_links(g))]
+            footprints = FootprintIndex.for_catalog(catalog, collection.concept_id)
+            pairs = match_enmap(granules, footprints, cloud_cover_max=args.cloud_cover, months=args.months)
+            if pairs is None:
+                continue
+            path = os.path.join(args.output_dir, f"{collection.name}_enmap_pairs.csv")
+            pairs.to_csv(path, index=False)
+            print(f"✅ {collection.name}: {len(pairs)} pairs in {path}")
+    _report(args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m aviris", description="AVIRIS collection downloads and conversion")
+    parser.add_argument("--catalog", default=os.environ.get("AVIRIS_CATALOG", "aviris_catalog.sqlite"),
+                        help="local granule catalog (default: $AVIRIS_CATALOG or aviris_catalog.sqlite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, func, help, metrics=True):
+        sub = subparsers.add_parser(name, help=help)
+        sub.set_defaults(func=func)
+        sub.add_argument("--start", help="ignore granules starting before this (default: per collection)")
+        sub.add_argument("--end", help="ignore granules starting at or after this")
+        sub.add_argument("--limit", type=int, help="only the first N data files, e.g. for testing")
+        sub.add_argument("--sync", action="store_true",
+                         help="ask CMR for new granules first (always done for a collection not yet in the catalog)")
+        if metrics:
+            sub.add_argument("--metrics-dir", default="metrics",
+                             help="directory for the run's metrics, '' to disable (default: metrics)")
+        return sub
+
+    sub = add_command("list", cmd_list, "summarize collections from the local catalog", metrics=False)
+    sub.add_argument("collections", nargs="*", help="collections to list (default: show the registry)")
+    sub.add_argument("--links", action="store_true", help="print the data file URLs")
+
+    for name, func, help in (("download", cmd_download, "download the data files into the granule cache"),
+                             ("convert", cmd_convert, "download and convert to GeoTIFF / COG")):
+        sub = add_command(name, func, help)
+        sub.add_argument("collections", nargs="+")
+        sub.add_argument("--login", metavar="STRATEGY",
+                         help="earthaccess login strategy, e.g. 'interactive' (default: ~/.netrc)")
+        sub.add_argument("--cache-quota", type=float, metavar="GB",
+                         help="granule cache quota (default: $AVIRIS_CACHE_QUOTA)")
+        if name == "convert":
+            sub.add_argument("--output-dir", help="output directory (default: per collection)")
+            sub.add_argument("--preset", help="output layout, see aviris.convert.PRESETS "
+                                              "(default: archive for ENVI, the COG defaults for NetCDF)")
+            sub.add_argument("--manifest", metavar="SQLITE",
+                             help="claim scenes from this shared manifest, e.g. under a SLURM job array")
+
+    sub = add_command("match", cmd_match, "pair AVIRIS granules with EnMAP L2A scenes")
+    sub.add_argument("collections", nargs="+")
+    sub.add_argument("--cloud-cover", type=float, default=30, help="maximum EnMAP cloud cover in percent")
+    sub.add_argument("--months", type=int, default=1, help="maximum time between the acquisitions")
+    sub.add_argument("--lat-max", type=float, default=45, help="whole footprint below this latitude")
+    sub.add_argument("--output-dir", default="matches")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    for name in getattr(args, "collections", []):
+        try:
+            get_collection(name)
+        except KeyError as e:
+            parser.error(e.args[0])
+    if getattr(args, "cache_quota", None) is not None:
+        args.cache_quota = int(args.cache_quota * 1024 ** 3)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
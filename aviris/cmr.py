@@ -0,0 +1,133 @@
+"""
+Helpers for the NASA CMR granule search API.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from aviris import metrics
+
+CMR_URL = "https://cmr.earthdata.nasa.gov/search"
+
+# Size in bytes and checksum of one data file, as published in the UMM-G record
+FileInfo = namedtuple("FileInfo", ["size", "checksum", "algorithm"])
+
+# The only granules.json fields we use, everything else is dropped while paging
+GRANULE_FIELDS = ("id", "title", "time_start", "time_end", "updated", "polygons", "links")
+
+
+def _trim(entry):
+    """Keep only the granule fields the scripts use, links reduced to rel / href."""
+    trimmed = {key: entry[key] for key in GRANULE_FIELDS if key in entry}
+    trimmed["links"] = [
+        {"rel": link.get("rel"), "href": link.get("href")} for link in entry.get("links", [])
+    ]
+    return trimmed
+
+
+def _fetch_page(session, url, params, search_after):
+    headers = {"Accept-Encoding": "gzip"}
+    if search_after:
+        headers["CMR-Search-After"] = search_after
+    with metrics.stage("cmr_page", params.get("collection_concept_id")) as m:
+        response = session.get(url, params=params, headers=headers, timeout=60)
+        response.raise_for_status()
+        entries = [_trim(entry) for entry in response.json().get("feed", {}).get("entry", [])]
+        m.update(bytes=len(response.content), items=len(entries), retries=metrics.response_retries(response))
+    return entries, response.headers.get("CMR-Search-After")
+
+
+def search_granules(collection, session=None, page_size=2000, cmr_url=CMR_URL, **params):
+    """
+    Yield the granules.json entries of a collection
+
+    Pages are chained with the ``CMR-Search-After`` header instead of
+    ``page_num``, so there is no limit on how deep we can page. The next page
+    is requested in the background while the current one is consumed, and every
+    entry is trimmed to ``GRANULE_FIELDS`` as soon as its page is parsed.
+
+    Parameters
+    ----------
+    collection : str
+        Collection concept ID, e.g. "C2659129205-ORNL_CLOUD".
+    session : requests.Session, optional
+        Session to use for the requests.
+    page_size : int
+        Number of granules per page (CMR allows up to 2000).
+    cmr_url : str
+        Base URL of the CMR search API.
+    **params
+        Extra CMR search parameters such as ``temporal`` or ``updated_since``.
+    """
+    session = session or requests.Session()
+    url = f"{cmr_url}/granules.json"
+    params = {
+        "collection_concept_id": collection,
+        "page_size": page_size,
+        "sort_key": "-start_date",
+        **params,
+    }
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(_fetch_page, session, url, params, None)
+        while future is not None:
+            entries, search_after = future.result()
+            future = None
+            if len(entries) == page_size and search_after:
+                future = pool.submit(_fetch_page, session, url, params, search_after)
+            yield from entries
+
+
+def _file_info(entry):
+    checksum = entry.get("Checksum") or {}
+    return FileInfo(
+        size=entry.get("SizeInBytes"),
+        checksum=checksum.get("Value"),
+        algorithm=checksum.get("Algorithm"),
+    )
+
+
+def fetch_file_info(granule_ids, session=None, batch_size=100, cmr_url=CMR_URL):
+    """
+    Look up the size and checksum of every data file of the given granules
+
+    Parameters
+    ----------
+    granule_ids : list[str]
+        Granule concept IDs, i.e. the ``id`` field of the granules.json entries.
+    session : requests.Session, optional
+        Session to use for the requests.
+    batch_size : int
+        Number of granules to look up per request.
+    cmr_url : str
+        Base URL of the CMR search API.
+
+    Returns
+    -------
+    dict
+        ``{filename: FileInfo}`` for every file listed in the
+        ``ArchiveAndDistributionInformation`` of the UMM-G records.
+    """
+    session = session or requests.Session()
+    granule_ids = list(granule_ids)
+    info = {}
+
+    for i in range(0, len(granule_ids), batch_size):
+        batch = granule_ids[i:i + batch_size]
+        with metrics.stage("cmr_umm", items=len(batch)) as m:
+            response = session.get(
+                f"{cmr_url}/granules.umm_json",
+                params={"concept_id[]": batch, "page_size": len(batch)},
+                timeout=60,
+            )
+            response.raise_for_status()
+            m.update(bytes=len(response.content), retries=metrics.response_retries(response))
+
+        for item in response.json().get("items", []):
+            data_granule = item.get("umm", {}).get("DataGranule", {})
+            for entry in data_granule.get("ArchiveAndDistributionInformation", []):
+                if "Name" in entry:
+                    info[entry["Name"]] = _file_info(entry)
+
+    return info
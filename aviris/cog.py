@@ -0,0 +1,272 @@
+"""
+AVIRIS-3 ``RFL_ORT.nc`` -> Cloud-Optimized GeoTIFF conversion.
+
+The reflectance cube is read from the NetCDF file in tile-aligned windows
+(never a whole variable at once) together with its map geolocation and
+per-band wavelength / FWHM, written to a tiled intermediate GeoTIFF and then
+laid out as a COG with internal tiling, overviews and the floating point
+predictor. Scaled integer reflectance (``scale_factor`` / ``add_offset``) is
+copied as stored, with the scale and offset set on the COG bands, so the
+``_FillValue`` stays the nodata value.
+"""
+import os
+import time
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import Affine
+
+from aviris import metrics
+from aviris.convert import (DEFAULT_GDAL_CACHE, DEFAULT_MAX_MEMORY, empty_tiles, iter_windows, resolve_preset,
+                            write_sparse)
+from aviris.stats import make_stats, sidecar_path
+
+BAND_DIMS = ("wavelength", "wavelengths", "band", "bands")
+Y_DIMS = ("northing", "y", "lat", "latitude", "row", "rows", "downtrack", "lines")
+# GTiff predictor numbers as COG driver values
+COG_PREDICTORS = {1: "NO", 2: "STANDARD", 3: "FLOATING_POINT"}
+# The COG copy re-encodes the intermediate anyway, so it only needs to be
+# small on disk (the disk budget and cache quota do not count it) and fast to write
+INTERMEDIATE_OPTIONS = {"compress": "deflate", "zlevel": 1}
+
+
+def _find_variable(group, name):
+    """Depth-first search for a variable by name in a group and its subgroups."""
+    if name in group.variables:
+        return group.variables[name]
+    for subgroup in group.groups.values():
+        var = _find_variable(subgroup, name)
+        if var is not None:
+            return var
+    return None
+
+
+def _geolocation(ds, var, y_dim, x_dim):
+    """CRS, affine transform and whether rows run south to north."""
+    grid_mapping = None
+    if "grid_mapping" in var.ncattrs():
+        grid_mapping = _find_variable(ds, var.getncattr("grid_mapping"))
+
+    crs = None
+    if grid_mapping is not None:
+        for attr in ("crs_wkt", "spatial_ref"):
+            if attr in grid_mapping.ncattrs():
+                crs = CRS.from_wkt(grid_mapping.getncattr(attr))
+                break
+
+    if grid_mapping is not None and "GeoTransform" in grid_mapping.ncattrs():
+        x0, dx, _, y0, _, dy = [float(v) for v in str(grid_mapping.getncattr("GeoTransform")).split()]
+        height = var.shape[var.dimensions.index(y_dim)]
+        top = y0 + dy * height if dy > 0 else y0
+        return crs, Affine(dx, 0, x0, 0, -abs(dy), top), dy > 0
+
+    # Fall back to the 1D cell-centre coordinate variables
+    x = _find_variable(ds, x_dim)[:]
+    y = _find_variable(ds, y_dim)[:]
+    dx = float(x[1] - x[0])
+    dy = float(y[1] - y[0])
+    south_up = dy > 0
+    top = float(y.max()) + abs(dy) / 2
+    transform = Affine(dx, 0, float(x[0]) - dx / 2, 0, -abs(dy), top)
+    return crs, transform, south_up
+
+
+def netcdf_to_cog(nc_path, cog_path, variable="reflectance", max_memory=DEFAULT_MAX_MEMORY,
+                  gdal_cache=DEFAULT_GDAL_CACHE, compress=None, blocksize=None, preset=None,
+                  band_transform=None, sparse=True, stats=True):
+    """
+    Convert the reflectance of an AVIRIS-3 ``RFL_ORT.nc`` file to a COG
+
+    Parameters
+    ----------
+    nc_path : str
+        Input NetCDF file.
+    cog_path : str
+        Output COG.
+    variable : str
+        Name of the reflectance variable, searched in all groups.
+    max_memory : int
+        Upper bound in bytes for one window read from the NetCDF file.
+    gdal_cache : int
+        GDAL block cache size in bytes.
+    compress : str, optional
+        COG compression, e.g. "deflate", "zstd" or "lzw". Defaults to the
+        preset's, or "deflate".
+    blocksize : int, optional
+        Internal tile size of the COG. Defaults to the preset's ``tile``, or
+        512.
+    preset : str or dict, optional
+        Output layout, see ``aviris.convert.resolve_preset``. COGs are always
+        pixel interleaved, so the preset's ``interleave`` is ignored.
+    band_transform : object, optional
+        Spectral transform applied to every window, prepared with the
+        file's ``wavelength`` / ``fwhm``; see
+        ``aviris.convert.convert_windowed``.
+    sparse : bool
+        Leave out tiles that are entirely ``_FillValue``, in the
+        intermediate file and in the COG (``SPARSE_OK=TRUE``).
+    stats : bool or dict
+        Save per-band statistics as ``<cog_path>.stats.json``, see
+        ``aviris.convert.convert_windowed``.
+
+    Returns
+    -------
+    str
+        ``cog_path``
+    """
+    import netCDF4
+
+    options = resolve_preset(preset) if preset else {}
+    compress = compress or options.get("compress", "deflate")
+    blocksize = blocksize or options.get("tile", 512)
+    tmp_path = cog_path + ".strips.tif"
+
+    read_seconds = stats_seconds = 0.0
+    with metrics.stage("convert", os.path.basename(cog_path), bytes=0, skipped_tiles=0) as m:
+        try:
+            with netCDF4.Dataset(nc_path) as ds:
+                var = _find_variable(ds, variable)
+                if var is None:
+                    raise KeyError(f"No '{variable}' variable in {nc_path}")
+                # Values as stored, so that they match the _FillValue; the
+                # scale and offset are set on the COG bands instead
+                var.set_auto_maskandscale(False)
+                scale = float(var.getncattr("scale_factor")) if "scale_factor" in var.ncattrs() else 1.0
+                offset = float(var.getncattr("add_offset")) if "add_offset" in var.ncattrs() else 0.0
+
+                dims = [d.lower() for d in var.dimensions]
+                band_axis = next(i for i, d in enumerate(dims) if d in BAND_DIMS)
+                y_axis = next(i for i, d in enumerate(dims) if d in Y_DIMS)
+                x_axis = ({0, 1, 2} - {band_axis, y_axis}).pop()
+                bands, height, width = (var.shape[band_axis], var.shape[y_axis], var.shape[x_axis])
+
+                crs, transform, south_up = _geolocation(ds, var, var.dimensions[y_axis], var.dimensions[x_axis])
+                nodata = var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None
+                sparse = sparse and nodata is not None
+
+                wavelength = _find_variable(ds, "wavelength")
+                fwhm = _find_variable(ds, "fwhm")
+                wavelength = wavelength[:] if wavelength is not None else None
+                fwhm = fwhm[:] if fwhm is not None else None
+
+                transform_bands = None
+                if band_transform is not None:
+                    if wavelength is None:
+                        raise KeyError(f"No 'wavelength' variable in {nc_path}")
+                    transform_bands = band_transform.prepare(wavelength, fwhm)
+                dtype = transform_bands.dtype if transform_bands is not None else var.dtype.name
+
+                profile = {
+                    "driver": "GTiff",
+                    "dtype": dtype,
+                    "count": transform_bands.count if transform_bands is not None else bands,
+                    "height": height,
+                    "width": width,
+                    "crs": crs,
+                    "transform": transform,
+                    "nodata": nodata,
+                    "tiled": True,
+                    "blockxsize": blocksize,
+                    "blockysize": blocksize,
+                    "bigtiff": "IF_SAFER",
+                    "sparse_ok": sparse,
+                    **INTERMEDIATE_OPTIONS,
+                }
+
+                if transform_bands is not None:
+                    descriptions = transform_bands.descriptions
+                elif wavelength is not None:
+                    descriptions = [f"{float(wavelength[band]):.2f} nm" for band in range(bands)]
+                else:
+                    descriptions = None
+                # Resampled bands are weighted means of stored values, so the scale holds for them too
+                band_stats = make_stats(stats, profile["count"], dtype, descriptions, scale=scale, offset=offset)
+
+                with rasterio.Env(GDAL_CACHEMAX=max(1, gdal_cache // (1024 * 1024))):
+                    with rasterio.open(tmp_path, "w", **profile) as dst:
+                        if scale != 1.0 or offset != 0.0:
+                            dst.scales = [scale] * profile["count"]
+                            dst.offsets = [offset] * profile["count"]
+                        if transform_bands is not None:
+                            for band, description in enumerate(transform_bands.descriptions):
+                                dst.set_band_description(band + 1, description)
+                                dst.update_tags(band + 1, **transform_bands.band_tags(band))
+                        elif wavelength is not None:
+                            for band in range(bands):
+                                description = f"{float(wavelength[band]):.2f} nm"
+                                if fwhm is not None:
+                                    dst.update_tags(band + 1, fwhm=f"{float(fwhm[band]):.4f}")
+                                dst.set_band_description(band + 1, description)
+                                dst.update_tags(band + 1, wavelength=f"{float(wavelength[band]):.4f}")
+
+                        windows = iter_windows(height, width, bands, var.dtype.itemsize, blocksize, max_memory)
+                        for window in windows:
+                            row_off, row_end = window.row_off, window.row_off + window.height
+                            # Output rows run north to south; flip south-up files on the fly
+                            if south_up:
+                                src_rows = slice(height - row_end, height - row_off)
+                            else:
+                                src_rows = slice(row_off, row_end)
+
+                            index = [slice(None)] * 3
+                            index[y_axis] = src_rows
+                            index[x_axis] = slice(window.col_off, window.col_off + window.width)
+                            tick = time.perf_counter()
+                            block = np.transpose(var[tuple(index)], (band_axis, y_axis, x_axis))
+                            read_seconds += time.perf_counter() - tick
+                            m["bytes"] += block.nbytes
+                            if south_up:
+                                block = block[:, ::-1, :]
+                            empty = empty_tiles(block, nodata, blocksize) if sparse else None
+                            if empty is not None and empty.all():
+                                m["skipped_tiles"] += empty.size
+                                continue
+                            if transform_bands is not None:
+                                block = transform_bands(np.ascontiguousarray(block), nodata)
+                            block = np.ascontiguousarray(block)
+                            if band_stats is not None:
+                                tick = time.perf_counter()
+                                band_stats.update(block, nodata)
+                                stats_seconds += time.perf_counter() - tick
+                            if empty is not None:
+                                m["skipped_tiles"] += write_sparse(dst, block, window, blocksize, empty)
+                            else:
+                                dst.write(block, window=window)
+
+                    if "predictor" in options:
+                        predictor = int(options["predictor"])
+                        if predictor == 3 and not np.issubdtype(dtype, np.floating):
+                            predictor = 2
+                        predictor = COG_PREDICTORS[predictor]
+                    else:
+                        predictor = "YES" if np.issubdtype(dtype, np.floating) else "NO"
+                    tick = time.perf_counter()
+                    rio_copy(
+                        tmp_path,
+                        cog_path + ".tmp",
+                        driver="COG",
+                        compress=compress,
+                        predictor=predictor,
+                        blocksize=blocksize,
+                        overviews="AUTO",
+                        overview_resampling="AVERAGE",
+                        bigtiff="IF_SAFER",
+                        num_threads="ALL_CPUS",
+                        sparse_ok=sparse,
+                    )
+                    m["cog_seconds"] = round(time.perf_counter() - tick, 4)
+
+            os.replace(cog_path + ".tmp", cog_path)
+            if band_stats is not None:
+                band_stats.scenes = [os.path.basename(cog_path)]
+                band_stats.save(sidecar_path(cog_path))
+            m.update(read_seconds=round(read_seconds, 4), stats_seconds=round(stats_seconds, 4),
+                     output_bytes=os.path.getsize(cog_path))
+        finally:
+            # Neither the intermediate nor a partial COG outlives a failed conversion
+            for path in (tmp_path, cog_path + ".tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+    return cog_path
@@ -0,0 +1,413 @@
+"""
+Bounded-memory ENVI -> GeoTIFF conversion.
+
+The cube is copied in tile-aligned windows instead of ``dst.write(src.read())``,
+so peak memory depends on ``max_memory`` and the GDAL block cache, not on the
+size of the flightline. Several conversions can then share one node, which is
+what ``convert_batch`` does with a process pool.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from aviris import metrics
+from aviris.envi import header_path, read_header, spectral_info
+from aviris.stats import make_stats, sidecar_path
+
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+DEFAULT_GDAL_CACHE = 64 * 1024 * 1024
+DEFAULT_TILE = 256
+
+# Named output layouts, chosen with ``python -m aviris.bench`` on a 425 band
+# float32 reflectance cube. ``tile`` is the tile size in pixels, the other keys
+# are GTiff creation options. A pixel interleaved tile holds every band, so
+# reading one spectrum or one band decompresses far more data than with band
+# interleave; only the floating point predictor gains from it.
+PRESETS = {
+    # What the download scripts wrote so far: 0.62 of the raw size, slow reads
+    "lzw": {"compress": "lzw", "tile": 256, "interleave": "pixel"},
+    # Smallest files (0.39) with the fastest compressed writes
+    "archive": {"compress": "zstd", "predictor": 3, "tile": 128, "interleave": "pixel"},
+    # Fast spectra and bands (~60 / ~10 ms per read) at 0.46
+    "spectral": {"compress": "zstd", "predictor": 2, "tile": 128, "interleave": "band"},
+    # Fastest band reads and small files (0.41), e.g. for quicklooks
+    "band": {"compress": "zstd", "predictor": 3, "tile": 256, "interleave": "band"},
+}
+
+
+def find_data_file(hdr_path: str):
+    """
+    For AVIRIS NGL2:
+    Look for data filename matching header without the .hdr extension.
+    """
+    base = hdr_path[:-4]  # strip ".hdr"
+
+    # Try exact match (no extension)
+    if os.path.exists(base):
+        return base
+
+    # Try known ENVI extensions
+    for ext in [".img", ".bsq", ".bin"]:
+        candidate = base + ext
+        if os.path.exists(candidate):
+            return candidate
+
+    return None
+
+
+def resolve_preset(preset):
+    """
+    Options of a named preset or of a JSON preset file
+
+    Parameters
+    ----------
+    preset : str or dict
+        A key of ``PRESETS``, a ``.json`` file written by
+        ``aviris.bench.save_preset`` or an option dict.
+
+    Returns
+    -------
+    dict
+        A copy of the options, with ``tile`` and GTiff creation options.
+    """
+    if isinstance(preset, dict):
+        options = dict(preset)
+    elif preset in PRESETS:
+        options = dict(PRESETS[preset])
+    elif os.path.exists(preset):
+        with open(preset) as f:
+            options = json.load(f)
+    else:
+        raise ValueError(f"Unknown preset '{preset}', expected one of {list(PRESETS)} or a JSON file")
+    # Benchmark results saved alongside the options
+    options.pop("benchmark", None)
+    return options
+
+
+def iter_windows(height, width, bands, itemsize, tile=DEFAULT_TILE, max_memory=DEFAULT_MAX_MEMORY):
+    """
+    Tile-aligned windows whose ``bands x rows x cols`` buffer fits ``max_memory``
+
+    Full-width strips are preferred because ENVI BIL/BIP data is stored row by
+    row. If not even ``tile`` full rows fit, the strip is split into columns,
+    but never narrower than one tile.
+    """
+    row_bytes = width * bands * itemsize
+    rows = (max_memory // row_bytes) // tile * tile
+    if rows >= tile:
+        cols = width
+    else:
+        rows = tile
+        cols = max(tile, (max_memory // (tile * bands * itemsize)) // tile * tile)
+
+    for row_off in range(0, height, rows):
+        for col_off in range(0, width, cols):
+            yield Window(col_off, row_off, min(cols, width - col_off), min(rows, height - row_off))
+
+
+def empty_tiles(block, nodata, tile):
+    """
+    Tiles of a tile-aligned ``(bands, rows, cols)`` block that hold only nodata
+
+    Returns
+    -------
+    numpy.ndarray
+        ``(tile rows, tile cols)`` booleans, True where every band of every
+        pixel in the tile is ``nodata`` (or NaN for a NaN ``nodata``).
+    """
+    _, rows, cols = block.shape
+    valid = np.zeros((rows, cols), dtype=bool)
+    is_nan = np.isnan(nodata)
+    for band in block:
+        valid |= ~np.isnan(band) if is_nan else band != nodata
+    tiles_y, tiles_x = -(-rows // tile), -(-cols // tile)
+    padded = np.zeros((tiles_y * tile, tiles_x * tile), dtype=bool)
+    padded[:rows, :cols] = valid
+    return ~padded.reshape(tiles_y, tile, tiles_x, tile).any(axis=(1, 3))
+
+
+def write_sparse(dst, block, window, tile, empty):
+    """
+    Write the non-empty tiles of a tile-aligned block
+
+    Runs of neighbouring non-empty tiles in a tile row are written together.
+    With ``SPARSE_OK=TRUE`` the skipped tiles are never allocated in the file
+    and read back as nodata.
+
+    Returns
+    -------
+    int
+        Number of skipped tiles.
+    """
+    if not empty.any():
+        dst.write(block, window=window)
+        return 0
+    _, rows, cols = block.shape
+    for ty, row in enumerate(empty):
+        edges = np.flatnonzero(np.diff(np.concatenate([[True], row, [True]]).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            y0, x0 = ty * tile, start * tile
+            part = block[:, y0:y0 + tile, x0:end * tile]
+            dst.write(part, window=Window(window.col_off + x0, window.row_off + y0, part.shape[2], part.shape[1]))
+    return int(empty.sum())
+
+
+def source_nodata(src, src_path):
+    """Nodata of a source raster, falling back to the ENVI ``data ignore value``."""
+    if src.nodata is not None:
+        return src.nodata
+    path = header_path(src_path)
+    return read_header(path).get("data ignore value") if path else None
+
+
+def convert_windowed(src_path, dst_path, max_memory=DEFAULT_MAX_MEMORY, gdal_cache=DEFAULT_GDAL_CACHE,
+                     tile=None, preset=None, band_transform=None, sparse=True, stats=True,
+                     **creation_options):
+    """
+    Copy a raster to a tiled GeoTIFF window by window
+
+    The output is written to ``<dst_path>.tmp`` and renamed when complete, so
+    an interrupted run never leaves a truncated GeoTIFF behind.
+
+    Parameters
+    ----------
+    src_path : str
+        Input raster, e.g. the ENVI ``.bin`` data file.
+    dst_path : str
+        Output GeoTIFF.
+    max_memory : int
+        Upper bound in bytes for the array of one window.
+    gdal_cache : int
+        GDAL block cache size in bytes (``GDAL_CACHEMAX``).
+    tile : int, optional
+        Output tile size in pixels, taken from the preset or ``DEFAULT_TILE``
+        if omitted.
+    preset : str or dict, optional
+        Output layout, see ``resolve_preset``.
+    band_transform : object, optional
+        Spectral transform applied to every window, e.g. an
+        ``aviris.spectral.SpectralResampler``. Its ``prepare(wavelength,
+        fwhm, bbl)`` is called with the bands from the ENVI header of
+        ``src_path`` and must return a callable ``block, nodata -> block``
+        with ``count``, ``dtype``, ``descriptions`` and ``band_tags(band)``.
+    sparse : bool
+        Skip tiles that are entirely nodata (the ENVI ``data ignore value``)
+        and write a sparse GeoTIFF (``SPARSE_OK=TRUE``); for orthorectified
+        flightlines that is most of the bounding box, so compression time and
+        file size drop with the empty area.
+    stats : bool or dict
+        Accumulate per-band statistics of the written pixels and save them as
+        ``<dst_path>.stats.json``, see ``aviris.stats``; a dict holds
+        ``BandStats`` options such as ``value_range`` and ``bins``.
+    **creation_options
+        Extra GTiff creation options, e.g. ``compress="lzw"``. They override
+        the preset.
+    """
+    tmp_path = dst_path + ".tmp"
+    options = resolve_preset(preset) if preset else {}
+    preset_tile = options.pop("tile", DEFAULT_TILE)
+    tile = tile or preset_tile
+    options.update(creation_options)
+
+    # Split of the conversion time, to tell disk reads from compression
+    timings = {"read_seconds": 0.0, "transform_seconds": 0.0, "write_seconds": 0.0, "stats_seconds": 0.0}
+    with metrics.stage("convert", os.path.basename(dst_path), bytes=0, skipped_tiles=0) as m:
+        with rasterio.Env(GDAL_CACHEMAX=max(1, gdal_cache // (1024 * 1024))):
+            with rasterio.open(src_path) as src:
+                profile = src.profile.copy()
+                # ENVI "line" interleave has no GTiff equivalent
+                profile.pop("interleave", None)
+                nodata = source_nodata(src, src_path)
+                sparse = sparse and nodata is not None
+                profile["nodata"] = nodata
+                if sparse:
+                    profile["sparse_ok"] = True
+                profile.update(
+                    driver="GTiff",
+                    tiled=True,
+                    blockxsize=tile,
+                    blockysize=tile,
+                    bigtiff="IF_SAFER",
+                    **options,
+                )
+                itemsize = np.dtype(src.dtypes[0]).itemsize
+                tags = src.tags()
+                descriptions = src.descriptions
+
+                transform = None
+                if band_transform is not None:
+                    transform = band_transform.prepare(*spectral_info(src_path))
+                    profile.update(count=transform.count, dtype=transform.dtype)
+                    # Per-band ENVI wavelength tags refer to the source bands
+                    tags = {k: v for k, v in tags.items() if not k.startswith("Band_")}
+                    descriptions = transform.descriptions
+
+                # The floating point predictor is only defined for float data
+                if int(profile.get("predictor", 1)) == 3 and np.dtype(profile["dtype"]).kind != "f":
+                    profile["predictor"] = 2
+
+                # Resampled bands are weighted means of source bands, so the source scale holds for them too
+                band_stats = make_stats(stats, profile["count"], profile["dtype"],
+                                        descriptions if any(descriptions) else None,
+                                        scale=src.scales[0], offset=src.offsets[0])
+
+                with rasterio.open(tmp_path, "w", **profile) as dst:
+                    dst.update_tags(**tags)
+                    for band, description in enumerate(descriptions, start=1):
+                        if description:
+                            dst.set_band_description(band, description)
+                        if transform is not None:
+                            dst.update_tags(band, **transform.band_tags(band - 1))
+
+                    windows = iter_windows(src.height, src.width, src.count, itemsize, tile, max_memory)
+                    for window in windows:
+                        tick = time.perf_counter()
+                        block = src.read(window=window)
+                        timings["read_seconds"] += time.perf_counter() - tick
+                        m["bytes"] += block.nbytes
+                        empty = empty_tiles(block, nodata, tile) if sparse else None
+                        if empty is not None and empty.all():
+                            m["skipped_tiles"] += empty.size
+                            continue
+                        if transform is not None:
+                            tick = time.perf_counter()
+                            block = transform(block, nodata)
+                            timings["transform_seconds"] += time.perf_counter() - tick
+                        if band_stats is not None:
+                            tick = time.perf_counter()
+                            band_stats.update(block, nodata)
+                            timings["stats_seconds"] += time.perf_counter() - tick
+                        tick = time.perf_counter()
+                        if empty is not None:
+                            m["skipped_tiles"] += write_sparse(dst, block, window, tile, empty)
+                        else:
+                            dst.write(block, window=window)
+                        timings["write_seconds"] += time.perf_counter() - tick
+
+        os.replace(tmp_path, dst_path)
+        if band_stats is not None:
+            band_stats.scenes = [os.path.basename(dst_path)]
+            band_stats.save(sidecar_path(dst_path))
+        m.update({key: round(value, 4) for key, value in timings.items()}, output_bytes=os.path.getsize(dst_path))
+    return dst_path
+
+
+def init_worker(threads):
+    """
+    Limit the GDAL / OpenMP threads of a worker process
+
+    Meant as the ``initializer`` of a ``ProcessPoolExecutor``, with
+    ``initargs=(threads,)``.
+    """
+    # Read by GDAL when the worker first touches it, so it stays per process
+    os.environ["GDAL_NUM_THREADS"] = str(threads)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+
+
+def _convert_scene(hdr_path, tif_path, options):
+    start = time.time()
+    data_file = find_data_file(hdr_path)
+    if data_file is None:
+        raise FileNotFoundError(f"Cannot find data file for {hdr_path}")
+    convert_windowed(data_file, tif_path, **options)
+    return time.time() - start, os.path.getsize(tif_path)
+
+
+def convert_batch(hdr_files, output_dir, workers=None, threads_per_worker=1, retry_failed=False,
+                  summary_path=None, **options):
+    """
+    Convert many ENVI scenes in parallel, one scene per worker process
+
+    A scene is skipped when its GeoTIFF already exists, or when an earlier run
+    left a ``<name>.tif.failed`` marker (unless ``retry_failed``). Every worker
+    gets its own GDAL cache (``gdal_cache`` in ``options``) and thread budget.
+
+    Parameters
+    ----------
+    hdr_files : list[str]
+        ENVI header files.
+    output_dir : str
+        Directory for the GeoTIFFs.
+    workers : int, optional
+        Number of worker processes, all CPUs by default; with 1 the scenes
+        are converted one by one in this process.
+    threads_per_worker : int
+        GDAL / OpenMP threads each worker may use.
+    retry_failed : bool
+        Also convert scenes that failed in an earlier run.
+    summary_path : str, optional
+        CSV file for the per-scene summary, ``<output_dir>/conversion_summary.csv``
+        by default.
+    **options
+        Passed on to ``convert_windowed``, e.g. ``preset="archive"``.
+
+    Returns
+    -------
+    list[dict]
+        One record per scene with ``scene``, ``status``, ``seconds``,
+        ``bytes`` and ``error``, in the order of ``hdr_files``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    records = {}
+    jobs = {}
+
+    for hdr in hdr_files:
+        scene = os.path.splitext(os.path.basename(hdr))[0]
+        tif_path = os.path.join(output_dir, scene + ".tif")
+        if os.path.exists(tif_path):
+            records[hdr] = {"scene": scene, "status": "exists", "seconds": 0, "bytes": os.path.getsize(tif_path), "error": ""}
+        elif os.path.exists(tif_path + ".failed") and not retry_failed:
+            records[hdr] = {"scene": scene, "status": "failed-before", "seconds": 0, "bytes": 0, "error": ""}
+        else:
+            jobs[hdr] = (scene, tif_path)
+
+    print(f"{len(jobs)} scenes to convert, {len(records)} skipped, {workers} workers")
+
+    def finished():
+        """``(hdr, result, error)`` of every job as it completes."""
+        if workers == 1:
+            init_worker(threads_per_worker)
+            for hdr, (scene, tif_path) in jobs.items():
+                try:
+                    yield hdr, _convert_scene(hdr, tif_path, options), None
+                except Exception as e:
+                    yield hdr, None, e
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(threads_per_worker,)) as pool:
+            futures = {
+                pool.submit(_convert_scene, hdr, tif_path, options): hdr
+                for hdr, (scene, tif_path) in jobs.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    for i, (hdr, result, error) in enumerate(finished(), start=1):
+        scene, tif_path = jobs[hdr]
+        if error is None:
+            seconds, size = result
+            records[hdr] = {"scene": scene, "status": "converted", "seconds": round(seconds, 1), "bytes": size, "error": ""}
+            print(f"[{i}/{len(jobs)}] ✔️ {scene}: {seconds:.1f}s, {size / (1024 * 1024):.1f}MB")
+        else:
+            with open(tif_path + ".failed", "w") as f:
+                f.write(f"{error}\n")
+            records[hdr] = {"scene": scene, "status": "failed", "seconds": 0, "bytes": 0, "error": str(error)}
+            print(f"[{i}/{len(jobs)}] ❌ {scene}: {error}")
+
+    results = [records[hdr] for hdr in hdr_files]
+    summary_path = summary_path or os.path.join(output_dir, "conversion_summary.csv")
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["scene", "status", "seconds", "bytes", "error"])
+        writer.writeheader()
+        writer.writerows(results)
+    return results
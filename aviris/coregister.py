@@ -0,0 +1,342 @@
+"""
+Block-wise co-registration of AVIRIS scenes onto the EnMAP 30 m grid.
+
+For every AVIRIS / EnMAP pair only the overlap of the two scenes is
+processed. The output grid is the EnMAP pixel grid clipped to that overlap,
+and the ~5 m AVIRIS pixels are aggregated into each 30 m EnMAP pixel with
+GDAL's area-weighted ``average`` resampling, one strip of output rows at
+a time from just the AVIRIS rows under that strip. Memory therefore depends on ``max_memory``
+and the warp buffer, not on the size of either cube.
+
+Every pair produces three aligned GeoTIFFs with identical grids:
+
+    <pair>_aviris.tif   AVIRIS reflectance (optionally resampled to EnMAP bands)
+    <pair>_enmap.tif    the matching EnMAP window
+    <pair>_mask.tif     1 where both scenes have valid data
+
+Example
+-------
+>>> coregister_pairs([("ang..._img.bin", "ENMAP01-....tif")], "pairs", workers=4)
+"""
+import csv
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from aviris import metrics
+from aviris.convert import DEFAULT_GDAL_CACHE, DEFAULT_MAX_MEMORY, init_worker, resolve_preset
+from aviris.envi import spectral_info
+
+DEFAULT_PRESET = "spectral"
+# GDAL warp buffer per pair in MB
+DEFAULT_WARP_MEMORY = 128
+
+
+def _snap_window(bounds, dataset, margin=0):
+    """Pixel window of ``dataset`` covering ``bounds``, snapped outwards and clipped."""
+    left, bottom, right, top = bounds
+    window = from_bounds(left, bottom, right, top, transform=dataset.transform)
+    # Tolerate float noise when the bounds already sit on pixel edges
+    col0 = max(int(math.floor(window.col_off + 1e-6)) - margin, 0)
+    row0 = max(int(math.floor(window.row_off + 1e-6)) - margin, 0)
+    col1 = min(int(math.ceil(window.col_off + window.width - 1e-6)) + margin, dataset.width)
+    row1 = min(int(math.ceil(window.row_off + window.height - 1e-6)) + margin, dataset.height)
+    if col1 <= col0 or row1 <= row0:
+        return None
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+def overlap_window(aviris, enmap):
+    """
+    EnMAP pixel window covered by the AVIRIS scene, or None
+
+    The AVIRIS bounds are transformed to the EnMAP CRS, clipped to the EnMAP
+    scene and snapped outwards to whole EnMAP pixels.
+    """
+    left, bottom, right, top = transform_bounds(aviris.crs, enmap.crs, *aviris.bounds, densify_pts=21)
+    left, bottom = max(left, enmap.bounds.left), max(bottom, enmap.bounds.bottom)
+    right, top = min(right, enmap.bounds.right), min(top, enmap.bounds.top)
+    if left >= right or bottom >= top:
+        return None
+    return _snap_window((left, bottom, right, top), enmap)
+
+
+def pair_name(aviris_path, enmap_path):
+    """``<aviris scene>__<enmap scene>``"""
+    aviris = os.path.basename(aviris_path).split(".")[0]
+    enmap = os.path.splitext(os.path.basename(enmap_path))[0]
+    return f"{aviris}__{enmap}"
+
+
+def _profile(enmap, window, count, dtype, nodata, options):
+    options = dict(options)
+    tile = options.pop("tile", 256)
+    profile = {
+        "driver": "GTiff",
+        "count": count,
+        "dtype": dtype,
+        "nodata": nodata,
+        "crs": enmap.crs,
+        "transform": enmap.window_transform(window),
+        "width": window.width,
+        "height": window.height,
+        "tiled": True,
+        "blockxsize": tile,
+        "blockysize": tile,
+        "bigtiff": "IF_SAFER",
+        **options,
+    }
+    if int(profile.get("predictor", 1)) == 3 and np.dtype(dtype).kind != "f":
+        profile["predictor"] = 2
+    return profile
+
+
+def _source_extent(aviris, enmap, strip):
+    """
+    ``(rows, cols)`` of AVIRIS read for an EnMAP strip, see ``_warp_strip``
+
+    The bounding extent of the strip in AVIRIS pixels, so a source grid
+    that is rotated against the EnMAP grid (ENVI ``map info`` rotation) is
+    accounted for; clipped to the scene like the read.
+    """
+    left, bottom, right, top = transform_bounds(enmap.crs, aviris.crs, *enmap.window_bounds(strip), densify_pts=21)
+    cols, rows = zip(*(~aviris.transform * (x, y) for x in (left, right) for y in (bottom, top)))
+    # Plus the margin and the outward snapping of _snap_window
+    return (min(math.ceil(max(rows) - min(rows)) + 3, aviris.height),
+            min(math.ceil(max(cols) - min(cols)) + 3, aviris.width))
+
+
+def _strip_rows(aviris, enmap, window, out_bands, max_memory):
+    """Output rows per strip such that the AVIRIS read and the strip's arrays fit in ``max_memory``."""
+    def strip_bytes(rows):
+        src_rows, src_cols = _source_extent(aviris, enmap, Window(window.col_off, window.row_off, window.width, rows))
+        # AVIRIS is read as float32 whatever its stored type
+        return (src_rows * src_cols * aviris.count + rows * window.width * out_bands) * 4
+
+    # The extent grows with the rows, so the largest strip that fits is found by bisection
+    low, high = 1, window.height
+    while low < high:
+        middle = (low + high + 1) // 2
+        if strip_bytes(middle) <= max_memory:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _warp_strip(aviris, enmap, strip, nodata, resampling, warp_memory):
+    """
+    AVIRIS data aggregated onto one strip of the EnMAP grid
+
+    Only the AVIRIS rows and columns under the strip (plus a one pixel
+    margin) are read, then warped from memory.
+    """
+    out = np.full((aviris.count, strip.height, strip.width), nodata, dtype=np.float32)
+    bounds = transform_bounds(enmap.crs, aviris.crs, *enmap.window_bounds(strip), densify_pts=21)
+    src_window = _snap_window(bounds, aviris, margin=1)
+    if src_window is None:
+        return out
+
+    reproject(
+        aviris.read(window=src_window, out_dtype=np.float32),
+        out,
+        src_transform=aviris.window_transform(src_window),
+        src_crs=aviris.crs,
+        src_nodata=nodata,
+        dst_transform=enmap.window_transform(strip),
+        dst_crs=enmap.crs,
+        dst_nodata=nodata,
+        resampling=resampling,
+        warp_mem_limit=warp_memory,
+    )
+    return out
+
+
+def coregister_pair(aviris_path, enmap_path, out_dir, max_memory=DEFAULT_MAX_MEMORY,
+                    gdal_cache=DEFAULT_GDAL_CACHE, warp_memory=DEFAULT_WARP_MEMORY,
+                    resampling=Resampling.average, band_transform=None, preset=DEFAULT_PRESET):
+    """
+    Put one AVIRIS scene on the grid of one EnMAP scene over their overlap
+
+    Parameters
+    ----------
+    aviris_path : str
+        AVIRIS data file, e.g. the ENVI ``_img.bin``.
+    enmap_path : str
+        EnMAP L2A image (``SPECTRAL_IMAGE.TIF``).
+    out_dir : str
+        Directory for the three output GeoTIFFs.
+    max_memory : int
+        Upper bound in bytes for the arrays of one output strip.
+    gdal_cache : int
+        GDAL block cache size in bytes.
+    warp_memory : int
+        GDAL warp buffer in MB.
+    resampling : rasterio.enums.Resampling
+        ``average`` aggregates every source pixel that overlaps an output
+        pixel, weighted by the overlapping area.
+    band_transform : object, optional
+        Spectral transform for the AVIRIS bands, e.g. a
+        ``SpectralResampler`` to EnMAP bands; see
+        ``aviris.convert.convert_windowed``.
+    preset : str or dict
+        Output layout, see ``aviris.convert.resolve_preset``.
+
+    Returns
+    -------
+    dict or None
+        ``{"aviris", "enmap", "mask"}`` output paths, ``"valid"`` pixel
+        count, or None if the scenes do not overlap.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    name = pair_name(aviris_path, enmap_path)
+    paths = {kind: os.path.join(out_dir, f"{name}_{kind}.tif") for kind in ("aviris", "enmap", "mask")}
+    options = resolve_preset(preset) if preset else {}
+
+    with rasterio.Env(GDAL_CACHEMAX=max(1, gdal_cache // (1024 * 1024))):
+        with rasterio.open(aviris_path) as aviris, rasterio.open(enmap_path) as enmap:
+            window = overlap_window(aviris, enmap)
+            if window is None:
+                return None
+
+            transform = band_transform.prepare(*spectral_info(aviris_path)) if band_transform is not None else None
+            aviris_count = transform.count if transform is not None else aviris.count
+            aviris_nodata = aviris.nodata if aviris.nodata is not None else -9999.0
+            enmap_nodata = enmap.nodata
+
+            # Warped AVIRIS, transformed AVIRIS, EnMAP and mask arrays per output pixel
+            rows = _strip_rows(aviris, enmap, window, aviris.count + aviris_count + enmap.count + 1, max_memory)
+
+            profiles = {
+                "aviris": _profile(enmap, window, aviris_count, "float32", aviris_nodata, options),
+                "enmap": _profile(enmap, window, enmap.count, enmap.dtypes[0], enmap_nodata, options),
+                "mask": _profile(enmap, window, 1, "uint8", None, {"compress": "deflate", "tile": options.get("tile", 256)}),
+            }
+            tmp = {kind: path + ".tmp" for kind, path in paths.items()}
+
+            valid_pixels = 0
+            with rasterio.open(tmp["aviris"], "w", **profiles["aviris"]) as dst_aviris, \
+                    rasterio.open(tmp["enmap"], "w", **profiles["enmap"]) as dst_enmap, \
+                    rasterio.open(tmp["mask"], "w", **profiles["mask"]) as dst_mask:
+
+                descriptions = transform.descriptions if transform is not None else aviris.descriptions
+                for band, description in enumerate(descriptions, start=1):
+                    if description:
+                        dst_aviris.set_band_description(band, description)
+                    if transform is not None:
+                        dst_aviris.update_tags(band, **transform.band_tags(band - 1))
+                for band, description in enumerate(enmap.descriptions, start=1):
+                    if description:
+                        dst_enmap.set_band_description(band, description)
+
+                for row_off in range(0, window.height, rows):
+                    strip = Window(0, row_off, window.width, min(rows, window.height - row_off))
+                    source_strip = Window(window.col_off, window.row_off + row_off, strip.width, strip.height)
+
+                    block = _warp_strip(aviris, enmap, source_strip, aviris_nodata, resampling, warp_memory)
+                    valid = ~(block == aviris_nodata).any(axis=0)
+                    if transform is not None:
+                        block = transform(block, aviris_nodata)
+                    block = block.astype(np.float32, copy=False)
+
+                    enmap_block = enmap.read(window=source_strip)
+                    if enmap_nodata is not None:
+                        valid &= ~(enmap_block == enmap_nodata).any(axis=0)
+                    block[:, ~valid] = aviris_nodata
+
+                    dst_aviris.write(block, window=strip)
+                    dst_enmap.write(enmap_block, window=strip)
+                    dst_mask.write(valid.astype(np.uint8)[np.newaxis], window=strip)
+                    valid_pixels += int(valid.sum())
+
+    for kind, path in paths.items():
+        os.replace(tmp[kind], path)
+    return {**paths, "valid": valid_pixels}
+
+
+def _coregister(aviris_path, enmap_path, out_dir, options):
+    start = time.time()
+    with metrics.stage("coregister", pair_name(aviris_path, enmap_path)) as m:
+        result = coregister_pair(aviris_path, enmap_path, out_dir, **options)
+        if result is not None:
+            m.update(valid=result["valid"], bytes=sum(os.path.getsize(result[kind]) for kind in ("aviris", "enmap", "mask")))
+    return time.time() - start, result
+
+
+def coregister_pairs(pairs, out_dir, workers=None, threads_per_worker=1, summary_path=None, **options):
+    """
+    Co-register many AVIRIS / EnMAP pairs in parallel, one pair per process
+
+    Pairs whose mask already exists are skipped.
+
+    Parameters
+    ----------
+    pairs : list[tuple[str, str]]
+        ``(aviris_path, enmap_path)`` tuples.
+    out_dir : str
+        Directory for the aligned GeoTIFFs.
+    workers : int, optional
+        Number of worker processes, all CPUs by default.
+    threads_per_worker : int
+        GDAL threads each worker may use.
+    summary_path : str, optional
+        CSV file for the per-pair summary, ``<out_dir>/coregister_summary.csv``
+        by default.
+    **options
+        Passed on to ``coregister_pair``.
+
+    Returns
+    -------
+    list[dict]
+        One record per pair with ``pair``, ``status``, ``seconds``,
+        ``valid`` and ``error``, in the order of ``pairs``.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    records = {}
+    jobs = {}
+
+    for aviris_path, enmap_path in pairs:
+        name = pair_name(aviris_path, enmap_path)
+        if os.path.exists(os.path.join(out_dir, f"{name}_mask.tif")):
+            records[name] = {"pair": name, "status": "exists", "seconds": 0, "valid": "", "error": ""}
+        else:
+            jobs[name] = (aviris_path, enmap_path)
+
+    print(f"{len(jobs)} pairs to co-register, {len(records)} skipped, {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_worker,)) as pool:
+        futures = {
+            pool.submit(_coregister, aviris_path, enmap_path, out_dir, options): name
+            for name, (aviris_path, enmap_path) in jobs.items()
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            name = futures[future]
+            try:
+                seconds, result = future.result()
+            except Exception as e:
+                records[name] = {"pair": name, "status": "failed", "seconds": 0, "valid": "", "error": str(e)}
+                print(f"[{i}/{len(jobs)}] ❌ {name}: {e}")
+                continue
+            if result is None:
+                records[name] = {"pair": name, "status": "no-overlap", "seconds": round(seconds, 1), "valid": 0, "error": ""}
+                print(f"[{i}/{len(jobs)}] ⚠️ {name}: scenes do not overlap")
+            else:
+                records[name] = {"pair": name, "status": "done", "seconds": round(seconds, 1), "valid": result["valid"], "error": ""}
+                print(f"[{i}/{len(jobs)}] ✔️ {name}: {result['valid']} valid pixels in {seconds:.1f}s")
+
+    results = [records[pair_name(*pair)] for pair in pairs]
+    summary_path = summary_path or os.path.join(out_dir, "coregister_summary.csv")
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["pair", "status", "seconds", "valid", "error"])
+        writer.writeheader()
+        writer.writerows(results)
+    return results
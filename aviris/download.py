@@ -0,0 +1,427 @@
+"""
+Concurrent granule downloader shared by the NGL2 / AVIRIS-3 scripts.
+
+All files are fetched through one pooled, authenticated requests session by a
+bounded thread pool. Each host gets its own concurrency limit so that we do not
+hammer a single DAAC endpoint, and an aggregate throughput report is printed at
+the end of the run.
+
+Files are written to ``<name>.part`` first and only renamed into place once
+their size and checksum match the CMR metadata. An interrupted download is
+resumed with an HTTP ``Range`` request from the last byte on disk.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from aviris import metrics
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 4
+
+
+class IntegrityError(Exception):
+    """A downloaded file does not match the size / checksum in its metadata."""
+
+
+class _ZlibChecksum:
+    """hashlib-like wrapper around the running zlib checksums."""
+
+    def __init__(self, func, start):
+        self.func = func
+        self.value = start
+
+    def update(self, data):
+        self.value = self.func(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value & 0xFFFFFFFF:08x}"
+
+
+def new_hasher(algorithm):
+    """Return an incremental hasher for a UMM-G checksum algorithm, or None."""
+    name = (algorithm or "").lower().replace("-", "")
+    if name == "adler32":
+        return _ZlibChecksum(zlib.adler32, 1)
+    if name == "crc32":
+        return _ZlibChecksum(zlib.crc32, 0)
+    if name in hashlib.algorithms_available:
+        return hashlib.new(name)
+    return None
+
+
+class _TimedHasher:
+    """Hasher that keeps track of the time spent hashing."""
+
+    def __init__(self, hasher):
+        self.hasher = hasher
+        self.seconds = 0.0
+        self.nbytes = 0
+
+    @classmethod
+    def new(cls, algorithm):
+        hasher = new_hasher(algorithm)
+        return cls(hasher) if hasher is not None else None
+
+    def update(self, data):
+        start = time.perf_counter()
+        self.hasher.update(data)
+        self.seconds += time.perf_counter() - start
+        self.nbytes += len(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def _checksum_matches(hasher, expected):
+    digest = hasher.hexdigest()
+    expected = str(expected).strip().lower()
+    if digest == expected:
+        return True
+    # Adler-32 / CRC32 values are sometimes published as decimal integers
+    return expected.isdigit() and int(expected) == int(digest, 16)
+
+
+def _total_size(response, offset):
+    """Full file size from a (possibly partial) response, or None if unknown."""
+    match = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return int(length) + offset if length is not None else None
+
+
+def verify_file(path, expected, filename=None):
+    """
+    Check a complete file against its size and checksum from CMR
+
+    ``download_file`` verifies while the bytes stream in; this reads back a
+    file that was fetched some other way. Like there, a file that is too
+    short is kept so that it can be resumed, anything else is deleted.
+
+    Parameters
+    ----------
+    path : str
+        File to check.
+    expected : FileInfo or None
+        Size and checksum, see ``aviris.cmr``; nothing is checked if None.
+    filename : str, optional
+        Name recorded in the metrics, the base name of ``path`` by default.
+
+    Raises
+    ------
+    IntegrityError
+        If the file does not match ``expected``.
+    """
+    if expected is None:
+        return
+    filename = filename or os.path.basename(path)
+    actual = os.path.getsize(path)
+    if expected.size and actual != expected.size:
+        if actual > expected.size:
+            os.remove(path)
+        raise IntegrityError(f"size {actual} does not match expected {expected.size}")
+    hasher = _TimedHasher.new(expected.algorithm) if expected.checksum else None
+    if hasher is None:
+        return
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    fields = dict(seconds=round(hasher.seconds, 4), cpu_seconds=round(hasher.seconds, 4), bytes=hasher.nbytes)
+    if not _checksum_matches(hasher, expected.checksum):
+        os.remove(path)
+        error = f"{expected.algorithm} checksum {hasher.hexdigest()} does not match {expected.checksum}"
+        metrics.record("verify", filename, status="failed", error=error, **fields)
+        raise IntegrityError(error)
+    metrics.record("verify", filename, algorithm=expected.algorithm, **fields)
+
+
+def scene_key(url):
+    """Scene name of a file URL, i.e. the file name without its extension."""
+    return os.path.splitext(url.split("/")[-1])[0]
+
+
+def make_session(session=None, pool_size=DEFAULT_WORKERS):
+    """
+    Return an authenticated session with a connection pool sized for the workers
+
+    Parameters
+    ----------
+    session : requests.Session, optional
+        An existing session, e.g. ``earthaccess.get_requests_https_session()``.
+        If omitted the earthaccess session is used when available, otherwise a
+        plain session (requests reads ``~/.netrc`` for the credentials).
+    pool_size : int
+        Number of keep-alive connections to keep per host.
+
+    Returns
+    -------
+    requests.Session
+    """
+    if session is None:
+        try:
+            import earthaccess
+            session = earthaccess.get_requests_https_session()
+        except Exception:
+            session = requests.Session()
+
+    retry = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class HostLimiter:
+    """Per-host semaphores so one slow endpoint cannot take all the workers."""
+
+    def __init__(self, per_host=DEFAULT_PER_HOST):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+class ThroughputReport:
+    """Thread-safe byte / file counters for the aggregate download rate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.time()
+        self.bytes = 0
+        self.files = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.failed = []
+
+    def add(self, nbytes):
+        with self._lock:
+            self.bytes += nbytes
+
+    def done(self):
+        with self._lock:
+            self.files += 1
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def resume(self):
+        with self._lock:
+            self.resumed += 1
+
+    def fail(self, url, error):
+        with self._lock:
+            self.failed.append((url, str(error)))
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    @property
+    def rate(self):
+        """Aggregate throughput in MB/s."""
+        elapsed = self.elapsed
+        return self.bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.files} downloaded ({self.resumed} resumed), {self.skipped} already present, "
+            f"{len(self.failed)} failed - "
+            f"{self.bytes / (1024 * 1024):.1f}MB in {self.elapsed:.1f}s ({self.rate:.1f}MB/s)"
+        )
+
+
+def download_file(session, url, filepath, report, expected=None, timeout=30):
+    """
+    Download ``url`` to ``filepath`` through a resumable ``.part`` file
+
+    The checksum is computed while the bytes stream in, so a completed file is
+    never read back. When resuming, only the bytes already in the ``.part``
+    file are hashed before the transfer continues.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Session used for the request.
+    url : str
+        File URL.
+    filepath : str
+        Final location of the file.
+    report : ThroughputReport
+        Counters to update.
+    expected : FileInfo, optional
+        Size and checksum from the CMR metadata, see ``aviris.cmr``.
+    timeout : float
+        Connect / read timeout in seconds.
+
+    Raises
+    ------
+    IntegrityError
+        If the file does not match ``expected``. A ``.part`` file that is too
+        short is kept so that the next run resumes it, anything else is
+        deleted.
+    """
+    part = filepath + ".part"
+    size = expected.size if expected else None
+    checksum = expected.checksum if expected else None
+    hasher = _TimedHasher.new(expected.algorithm) if checksum else None
+    filename = os.path.basename(filepath)
+
+    with metrics.stage("download", filename) as m:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if size is not None and offset > size:
+            os.remove(part)
+            offset = 0
+
+        if offset and hasher:
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+
+        transferred = 0
+        if size is None or offset < size:
+            # Byte offsets only line up with the stored file without transfer encoding
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                m["retries"] = metrics.response_retries(response)
+                # 416: the .part file already holds every byte of the file
+                if response.status_code != 416:
+                    response.raise_for_status()
+                    if offset and response.status_code != 206:
+                        # The server ignored the Range header, start from scratch
+                        offset = 0
+                        hasher = _TimedHasher.new(expected.algorithm) if checksum else None
+                    elif offset:
+                        report.resume()
+                        m["resumed_from"] = offset
+                    if size is None:
+                        size = _total_size(response, offset)
+
+                    with open(part, "ab" if offset else "wb") as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if chunk:
+                                f.write(chunk)
+                                if hasher:
+                                    hasher.update(chunk)
+                                report.add(len(chunk))
+                                transferred += len(chunk)
+        m["bytes"] = transferred
+
+        try:
+            actual = os.path.getsize(part) if os.path.exists(part) else 0
+            if size is not None and actual != size:
+                if actual > size:
+                    os.remove(part)
+                raise IntegrityError(f"size {actual} does not match expected {size}")
+            if hasher and not _checksum_matches(hasher, checksum):
+                os.remove(part)
+                raise IntegrityError(f"{expected.algorithm} checksum {hasher.hexdigest()} does not match {checksum}")
+        except IntegrityError as e:
+            if hasher:
+                metrics.record("verify", filename, seconds=round(hasher.seconds, 4),
+                               cpu_seconds=round(hasher.seconds, 4), bytes=hasher.nbytes, status="failed", error=str(e))
+            raise
+        if hasher:
+            # Hashing happens while the bytes stream in; this is its share of the download
+            metrics.record("verify", filename, seconds=round(hasher.seconds, 4), cpu_seconds=round(hasher.seconds, 4),
+                           bytes=hasher.nbytes, algorithm=expected.algorithm)
+
+    os.replace(part, filepath)
+    return filepath
+
+
+def download_files(urls, out_dir=None, session=None, workers=DEFAULT_WORKERS,
+                   per_host=DEFAULT_PER_HOST, timeout=30, expected=None, cache=None):
+    """
+    Download many granule files concurrently
+
+    Parameters
+    ----------
+    urls : list[str]
+        File URLs to download.
+    out_dir : str
+        Destination directory, created if needed.
+    session : requests.Session, optional
+        Authenticated session to share between the workers.
+    workers : int
+        Size of the thread pool.
+    per_host : int
+        Maximum number of simultaneous requests against one host.
+    timeout : float
+        Connect / read timeout of each request in seconds.
+    expected : dict, optional
+        ``{filename: FileInfo}`` as returned by ``aviris.cmr.fetch_file_info``.
+        Files listed here are verified before they are moved into place.
+    cache : aviris.cache.GranuleCache, optional
+        Fetch through a shared cache instead of into ``out_dir``; files that
+        are already cached with the same checksum are not downloaded again.
+
+    Returns
+    -------
+    list[str]
+        Local paths of all verified files that are present after the run, in
+        the order of ``urls``.
+    """
+    if cache is None:
+        os.makedirs(out_dir, exist_ok=True)
+    session = make_session(session, pool_size=workers)
+    limiter = HostLimiter(per_host)
+    report = ThroughputReport()
+    expected = expected or {}
+
+    def fetch(url):
+        filename = url.split("/")[-1]
+        info = expected.get(filename)
+        if cache is not None:
+            with limiter(url):
+                return cache.get(url, expected=info, session=session, report=report, timeout=timeout)
+        filepath = os.path.join(out_dir, filename)
+        if os.path.exists(filepath):
+            if info is None or info.size is None or os.path.getsize(filepath) == info.size:
+                report.skip()
+                return filepath
+            # Left behind by a run without .part files, resume it instead
+            os.replace(filepath, filepath + ".part")
+        with limiter(url):
+            download_file(session, url, filepath, report, expected=info, timeout=timeout)
+        report.done()
+        return filepath
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, url): url for url in urls}
+        for i, future in enumerate(as_completed(futures), start=1):
+            url = futures[future]
+            filename = url.split("/")[-1]
+            try:
+                results[url] = future.result()
+                print(f"[{i}/{len(urls)}] ✅ {filename} - {report.rate:.1f}MB/s aggregate")
+            except Exception as e:
+                report.fail(url, e)
+                print(f"[{i}/{len(urls)}] ❌ Failed: {filename} - {e}")
+
+    print(f"\n📊 {report.summary()}")
+    return [results[url] for url in urls if url in results]
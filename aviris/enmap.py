@@ -0,0 +1,191 @@
+"""
+Batched AVIRIS <-> EnMAP matching against the DLR STAC API.
+
+Instead of one STAC search per AVIRIS granule, granules are grouped into
+grid cells and years and every group runs a single search over the union of
+its footprints and time windows. Item responses are cached on disk, and the
+actual pairing is a local spatial join followed by the +/- ``months`` time
+check, so thousands of flightlines cost a few tens of API calls.
+
+Example
+-------
+>>> pairs = match_enmap(granules, footprints, cloud_cover_max=30)
+>>> pairs[["title", "enmap_id", "image_href"]]
+"""
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from aviris import metrics
+
+STAC_URL = "https://geoservice.dlr.de/eoc/ogc/stac/v1"
+ENMAP_COLLECTION = "ENMAP_HSI_L2A"
+DEFAULT_CACHE_DIR = os.environ.get("AVIRIS_STAC_CACHE", "stac_cache")
+
+
+def search_items(client, bbox, start, end, cloud_cover_max, cache_dir=DEFAULT_CACHE_DIR,
+                 collection=ENMAP_COLLECTION):
+    """
+    STAC item dicts for one bbox / time window, cached on disk
+
+    Parameters
+    ----------
+    client : pystac_client.Client
+        Open STAC client.
+    bbox : list[float]
+        ``[minx, miny, maxx, maxy]`` in degrees.
+    start, end : str
+        Date range, e.g. "2023-01-01".
+    cloud_cover_max : float
+        Maximum allowed cloud coverage (%).
+    cache_dir : str
+        Directory for the cached responses.
+    collection : str
+        STAC collection to search.
+
+    Returns
+    -------
+    list[dict]
+    """
+    request = {
+        "url": client.self_href,
+        "collections": [collection],
+        "bbox": [round(float(v), 6) for v in bbox],
+        "datetime": f"{start}/{end}",
+        "query": {"eo:cloud_cover": {"lt": cloud_cover_max}},
+    }
+    key = hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, f"{key}.json")
+
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    with metrics.stage("stac", key[:12]) as m:
+        search = client.search(
+            collections=request["collections"],
+            bbox=request["bbox"],
+            datetime=request["datetime"],
+            query=request["query"],
+            limit=200,
+        )
+        items = list(search.items_as_dicts())
+        m["items"] = len(items)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(items, f)
+    os.replace(tmp_path, path)
+    return items
+
+
+def items_to_geodataframe(items, cloud_cover_max):
+    """
+    EnMAP items as a GeoDataFrame, keeping only the newest processing version
+
+    Items of the same acquisition (same ``start_datetime``) that were
+    reprocessed show up once per version; only the highest version is kept.
+    """
+    features = []
+    for item in {item["id"]: item for item in items}.values():
+        props = dict(item["properties"])
+        props["enmap_id"] = item["id"]
+        props["cloud_cover"] = props.get("eo:cloud_cover")
+        props["image_href"] = item.get("assets", {}).get("image", {}).get("href")
+        features.append({"type": "Feature", "geometry": item["geometry"], "properties": props})
+
+    if not features:
+        return None
+
+    gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+    gdf = gdf[gdf["cloud_cover"].astype(float) < cloud_cover_max]
+
+    gdf["start_datetime"] = pd.to_datetime(gdf["start_datetime"], utc=True)
+    gdf["version"] = gdf["version"].astype(str)
+    # Assumes version strings like "01.05.02" compare correctly lexicographically
+    gdf = gdf.sort_values(by=["start_datetime", "version"], ascending=[True, False])
+    return gdf.drop_duplicates(subset="start_datetime", keep="first")
+
+
+def match_enmap(granules, footprints, cloud_cover_max=30, months=1, cell_deg=2.0,
+                stac_url=STAC_URL, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Pair AVIRIS granules with EnMAP L2A scenes
+
+    Parameters
+    ----------
+    granules : list[dict]
+        AVIRIS granules.json entries or catalog rows.
+    footprints : FootprintIndex
+        Footprints of (at least) these granules, see ``aviris.footprints``.
+    cloud_cover_max : float
+        Maximum allowed EnMAP cloud coverage (%).
+    months : int
+        Maximum time difference between AVIRIS and EnMAP acquisitions.
+    cell_deg : float
+        Size of the grid cells used to group granules into one search.
+    stac_url : str
+        STAC API endpoint; point it at a local stand-in for testing.
+    cache_dir : str
+        Directory for cached STAC responses.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame or None
+        One row per AVIRIS / EnMAP pair with the AVIRIS ``granule_id``,
+        ``title`` and ``time_start`` and the EnMAP item properties,
+        ``enmap_id`` and ``image_href``.
+    """
+    from pystac_client import Client
+
+    aviris = gpd.GeoDataFrame(
+        {
+            "granule_id": [g["id"] for g in granules],
+            "title": [g["title"] for g in granules],
+            "time_start": pd.to_datetime([g["time_start"] for g in granules], utc=True),
+        },
+        geometry=[footprints.geometry(g["id"]) for g in granules],
+        crs="EPSG:4326",
+    )
+    aviris = aviris[aviris.geometry.notna()]
+    if aviris.empty:
+        return None
+
+    offset = pd.DateOffset(months=months)
+    bounds = aviris.geometry.bounds
+    groups = aviris.groupby([
+        np.floor((bounds["minx"] + bounds["maxx"]) / 2 / cell_deg).to_numpy(),
+        np.floor((bounds["miny"] + bounds["maxy"]) / 2 / cell_deg).to_numpy(),
+        aviris["time_start"].dt.year.to_numpy(),
+    ])
+
+    client = Client.open(stac_url)
+    items = []
+    for _, group in groups:
+        start = (group["time_start"].min() - offset).date()
+        end = (group["time_start"].max() + offset).date()
+        items.extend(search_items(client, group.total_bounds, start, end, cloud_cover_max, cache_dir))
+    print(f"{len(groups)} STAC searches for {len(aviris)} AVIRIS granules, {len(items)} EnMAP items")
+
+    with metrics.stage("match", items=len(items), granules=len(aviris)) as m:
+        enmap = items_to_geodataframe(items, cloud_cover_max)
+        if enmap is None or enmap.empty:
+            print("No matching scenes found.")
+            return None
+
+        # Keep AVIRIS column names unambiguous after the join
+        enmap = enmap.rename(columns={c: f"enmap_{c}" for c in aviris.columns if c in enmap and c != "geometry"})
+        pairs = gpd.sjoin(aviris, enmap, how="inner", predicate="intersects")
+        in_window = (
+            (pairs["start_datetime"] >= pairs["time_start"] - offset)
+            & (pairs["start_datetime"] <= pairs["time_start"] + offset)
+        )
+        pairs = pairs[in_window].drop(columns="index_right")
+        m["pairs"] = len(pairs)
+    print(f"Found {len(pairs)} AVIRIS / EnMAP pairs")
+    return pairs
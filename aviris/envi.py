@@ -0,0 +1,283 @@
+"""
+ENVI header parsing and memory-mapped reads.
+
+AVIRIS-NG L2 reflectance ships as ENVI data files with a text ``.hdr`` next
+to them. GDAL reads the raster itself, but the spectral metadata (band
+centres, FWHM, bad band list) is easiest to get from the header directly,
+and the storage layout (data type, byte order, interleave, header offset) is
+all a reader needs to address any pixel in the raw file without GDAL.
+"""
+import os
+
+import numpy as np
+from rasterio.transform import Affine
+
+INT_FIELDS = ("samples", "lines", "bands", "header offset", "data type", "byte order", "x start", "y start")
+FLOAT_FIELDS = ("data ignore value", "reflectance scale factor")
+FLOAT_LIST_FIELDS = ("wavelength", "fwhm", "bbl", "data gain values", "data offset values")
+# Wavelength units as written by ENVI, scaled to nanometers
+WAVELENGTH_UNITS = {"nanometers": 1.0, "nm": 1.0, "micrometers": 1000.0, "microns": 1000.0, "um": 1000.0}
+# ENVI "data type" codes
+ENVI_DTYPES = {1: "u1", 2: "i2", 3: "i4", 4: "f4", 5: "f8", 12: "u2", 13: "u4", 14: "i8", 15: "u8"}
+
+
+def header_path(data_path):
+    """The ``.hdr`` file of an ENVI data file, or None."""
+    for candidate in (data_path + ".hdr", os.path.splitext(data_path)[0] + ".hdr"):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _parse_value(key, value):
+    if value.startswith("{") and value.endswith("}"):
+        items = [item.strip() for item in value[1:-1].split(",")]
+        if key in FLOAT_LIST_FIELDS:
+            return np.array([float(item) for item in items if item])
+        return items
+    if key in INT_FIELDS:
+        return int(value)
+    if key in FLOAT_FIELDS:
+        return float(value)
+    return value
+
+
+def parse_header(text, name="header"):
+    """
+    Parse the text of an ENVI header into a dict
+
+    Keys are lower case. Integer fields (``samples``, ``lines``, ``bands``,
+    ``data type``, ...) are ints, ``wavelength``, ``fwhm``, ``bbl`` and the
+    gain / offset lists are numpy arrays, other ``{...}`` lists are lists of
+    strings and everything else stays a string.
+
+    Parameters
+    ----------
+    text : str
+        Header contents.
+    name : str
+        Used in error messages.
+
+    Returns
+    -------
+    dict
+    """
+    lines = text.splitlines()
+    if not lines or not lines[0].strip().startswith("ENVI"):
+        raise ValueError(f"{name} is not an ENVI header")
+
+    header = {}
+    key, value = None, None
+    for line in lines[1:]:
+        if key is not None:
+            # Continuation of a multi-line {...} value
+            value += " " + line.strip()
+        elif "=" in line:
+            key, value = (part.strip() for part in line.split("=", 1))
+            key = key.lower()
+        else:
+            continue
+        if value.startswith("{") and not value.endswith("}"):
+            continue
+        header[key] = _parse_value(key, value)
+        key, value = None, None
+    return header
+
+
+def read_header(path):
+    """Parse an ENVI ``.hdr`` file, see ``parse_header``."""
+    with open(path) as f:
+        return parse_header(f.read(), path)
+
+
+def numpy_dtype(header):
+    """Data type of the samples, including the byte order."""
+    dtype = np.dtype(ENVI_DTYPES[header["data type"]])
+    return dtype.newbyteorder(">" if header.get("byte order", 0) == 1 else "<")
+
+
+def storage_shape(header):
+    """Shape of the data in file order: BSQ ``(bands, lines, samples)``,
+    BIL ``(lines, bands, samples)`` or BIP ``(lines, samples, bands)``."""
+    bands, lines, samples = header["bands"], header["lines"], header["samples"]
+    interleave = header.get("interleave", "bsq").lower()
+    if interleave == "bil":
+        return lines, bands, samples
+    if interleave == "bip":
+        return lines, samples, bands
+    return bands, lines, samples
+
+
+def map_transform(header):
+    """
+    Affine transform and CRS from the ``map info`` field
+
+    Returns
+    -------
+    transform : rasterio.transform.Affine or None
+    crs : str or None
+        "EPSG:326xx" / "EPSG:327xx" for UTM, None for other projections.
+    """
+    info = header.get("map info")
+    if not info or len(info) < 7:
+        return None, None
+
+    ref_x, ref_y, x, y, dx, dy = (float(v) for v in info[1:7])
+    rotation = 0.0
+    for item in info[7:]:
+        if item.lower().startswith("rotation="):
+            rotation = float(item.split("=", 1)[1])
+    # The reference pixel is 1-based; it is shifted without rotation, exactly
+    # as GDAL's ENVI driver does, so both readers agree on every pixel
+    origin = Affine.translation(x - (ref_x - 1) * dx, y + (ref_y - 1) * dy)
+    transform = origin * Affine.rotation(rotation) * Affine.scale(dx, -dy)
+
+    crs = None
+    if info[0].strip().upper() == "UTM" and len(info) >= 9:
+        zone = int(info[7])
+        north = info[8].strip().lower().startswith("north")
+        crs = f"EPSG:{32600 + zone if north else 32700 + zone}"
+    return transform, crs
+
+
+def spectral_info(data_path):
+    """
+    Band centres and widths of an ENVI data file
+
+    Returns
+    -------
+    wavelength : numpy.ndarray
+        Band centres in nanometers.
+    fwhm : numpy.ndarray or None
+        Band widths in nanometers.
+    bbl : numpy.ndarray or None
+        Bad band list, 1 for usable bands.
+    """
+    path = header_path(data_path)
+    if path is None:
+        raise FileNotFoundError(f"No ENVI header for {data_path}")
+    header = read_header(path)
+    if "wavelength" not in header:
+        raise ValueError(f"{path} has no wavelength field")
+
+    scale = WAVELENGTH_UNITS.get(header.get("wavelength units", "nanometers").lower(), 1.0)
+    wavelength = header["wavelength"] * scale
+    fwhm = header["fwhm"] * scale if "fwhm" in header else None
+    return wavelength, fwhm, header.get("bbl")
+
+
+class EnviCube:
+    """
+    Memory-mapped ENVI data file
+
+    The data file is mapped read-only with the dtype, byte order, interleave
+    and header offset of its header, so opening a cube allocates nothing and
+    every accessor returns a view that only touches the pages it needs.
+
+    Parameters
+    ----------
+    path : str
+        The data file, or its ``.hdr``.
+
+    Example
+    -------
+    >>> cube = EnviCube("ang20220917t211723_rfl_v2aa1a_img.hdr")
+    >>> cube.spectrum(1100, 200)      # (bands,)
+    >>> cube.band(50)                 # (lines, samples)
+    >>> cube.read(Window(100, 1000, 200, 200), bands=range(0, cube.bands, 4))
+    """
+
+    def __init__(self, path):
+        if path.endswith(".hdr"):
+            from aviris.convert import find_data_file
+
+            hdr_path, data_path = path, find_data_file(path)
+            if data_path is None:
+                raise FileNotFoundError(f"No ENVI data file for {path}")
+        else:
+            hdr_path, data_path = header_path(path), path
+            if hdr_path is None:
+                raise FileNotFoundError(f"No ENVI header for {path}")
+
+        self.path = data_path
+        self.header = read_header(hdr_path)
+        self.lines = self.header["lines"]
+        self.samples = self.header["samples"]
+        self.bands = self.header["bands"]
+        self.interleave = self.header.get("interleave", "bsq").lower()
+        self.dtype = numpy_dtype(self.header)
+        self.offset = self.header.get("header offset", 0)
+        self.nodata = self.header.get("data ignore value")
+        self.transform, self.crs = map_transform(self.header)
+        self.data = np.memmap(data_path, dtype=self.dtype, mode="r", offset=self.offset,
+                              shape=storage_shape(self.header))
+
+    @property
+    def shape(self):
+        return self.bands, self.lines, self.samples
+
+    @property
+    def cube(self):
+        """The whole cube as a ``(bands, lines, samples)`` view."""
+        if self.interleave == "bil":
+            return self.data.transpose(1, 0, 2)
+        if self.interleave == "bip":
+            return self.data.transpose(2, 0, 1)
+        return self.data
+
+    def spectrum(self, row, col, bands=None):
+        """All (or the selected) bands of one pixel; contiguous for BIP."""
+        if self.interleave == "bil":
+            spectrum = self.data[row, :, col]
+        elif self.interleave == "bip":
+            spectrum = self.data[row, col, :]
+        else:
+            spectrum = self.data[:, row, col]
+        return spectrum if bands is None else spectrum[bands]
+
+    def band(self, band):
+        """One ``(lines, samples)`` band image; contiguous for BSQ."""
+        if self.interleave == "bil":
+            return self.data[:, band, :]
+        if self.interleave == "bip":
+            return self.data[:, :, band]
+        return self.data[band]
+
+    def read(self, window=None, bands=None):
+        """
+        A ``(bands, rows, cols)`` subset
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window, optional
+            Pixel window, the whole cube by default.
+        bands : int, slice or sequence of int, optional
+            0-based bands. An int or slice keeps the result a view of the
+            file; a list of bands is gathered into a new array.
+
+        Returns
+        -------
+        numpy.ndarray
+            In the byte order of the file.
+        """
+        cube = self.cube
+        if window is not None:
+            rows, cols = window.toslices()
+            cube = cube[:, rows, cols]
+        if bands is None:
+            return cube
+        if isinstance(bands, (int, np.integer)):
+            return cube[bands:bands + 1]
+        if not isinstance(bands, slice):
+            bands = np.asarray(list(bands), dtype=np.int64)
+        return cube[bands]
+
+    def close(self):
+        """Unmap the file; views taken before stay valid until released."""
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
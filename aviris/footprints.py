@@ -0,0 +1,153 @@
+"""
+STRtree index over AVIRIS flightline footprints.
+
+All CMR footprint strings are parsed in one vectorized step (see
+``aviris.query.parse_polygons``) into a shapely geometry array, and an STRtree
+is built on top of it. The parsed coordinates are saved as ``.npz`` next to
+the granule catalog, so later runs only rebuild the tree.
+
+Example
+-------
+>>> index = FootprintIndex.for_catalog(catalog, "C2659129205-ORNL_CLOUD")
+>>> index.query(enmap_scene_geometry)
+"""
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import box, shape
+
+from aviris.query import parse_polygons
+
+
+class FootprintIndex:
+    """
+    Spatial index of granule footprints
+
+    Parameters
+    ----------
+    ids, titles, time_start : array-like
+        Granule concept ID, title and start time for every footprint.
+    coords : numpy.ndarray
+        ``(n_points, 2)`` lon / lat vertices of all footprint rings.
+    offsets : numpy.ndarray
+        ``(n + 1,)`` start of each ring in ``coords``.
+    last_sync : str
+        Catalog sync time the footprints were built from.
+    """
+
+    def __init__(self, ids, titles, time_start, coords, offsets, last_sync=""):
+        self.last_sync = last_sync
+        self.ids = np.asarray(ids)
+        self.titles = np.asarray(titles)
+        self.time_start = np.asarray(time_start)
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        self.geometries = np.full(len(self.ids), None, dtype=object)
+        counts = np.diff(self.offsets)
+        # A valid ring needs at least 4 vertices, other granules stay None
+        valid = counts >= 4
+        if valid.any():
+            # shapely numbers the rings contiguously from 0, so only the valid ones count
+            ring_index = np.repeat(np.arange(valid.sum()), counts[valid])
+            keep = np.repeat(valid, counts)
+            rings = shapely.linearrings(self.coords[keep], indices=ring_index)
+            self.geometries[valid] = shapely.polygons(rings)
+
+        self._position = {granule_id: i for i, granule_id in enumerate(self.ids)}
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_granules(cls, granules):
+        """Build the index from granules.json entries or catalog rows."""
+        coords, offsets = parse_polygons(granules)
+        return cls(
+            [g["id"] for g in granules],
+            [g["title"] for g in granules],
+            [g.get("time_start") or "" for g in granules],
+            coords,
+            offsets,
+        )
+
+    def save(self, path):
+        np.savez(
+            path,
+            ids=self.ids,
+            titles=self.titles,
+            time_start=self.time_start,
+            coords=self.coords,
+            offsets=self.offsets,
+            last_sync=np.array(self.last_sync),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            last_sync = data["last_sync"].item() if "last_sync" in data else ""
+            return cls(
+                data["ids"], data["titles"], data["time_start"], data["coords"], data["offsets"],
+                last_sync=last_sync,
+            )
+
+    @classmethod
+    def for_catalog(cls, catalog, collection):
+        """
+        Index of a catalog collection, reusing the saved footprints if current
+
+        The ``.npz`` file sits next to the catalog database and is rebuilt
+        whenever the collection was synced after it was written.
+        """
+        base = os.path.splitext(catalog.path)[0]
+        path = f"{base}_{collection}_footprints.npz"
+        last_sync = catalog.last_sync(collection) or ""
+
+        if os.path.exists(path):
+            index = cls.load(path)
+            if index.last_sync == last_sync:
+                return index
+
+        index = cls.from_granules(catalog.granules(collection))
+        index.last_sync = last_sync
+        index.save(path)
+        return index
+
+    def geometry(self, granule_id):
+        """Footprint polygon of one granule, or None."""
+        return self.geometries[self._position[granule_id]]
+
+    def query(self, geom, predicate="intersects"):
+        """
+        Positions of the footprints that satisfy ``predicate`` against ``geom``
+
+        Parameters
+        ----------
+        geom : shapely geometry, GeoJSON dict or (west, south, east, north)
+            Area of interest, e.g. an EnMAP scene footprint.
+        predicate : str
+            Any STRtree predicate, e.g. "intersects", "within", "contains".
+
+        Returns
+        -------
+        numpy.ndarray
+            Sorted indices into ``ids`` / ``titles`` / ``geometries``.
+        """
+        if isinstance(geom, dict):
+            geom = shape(geom)
+        elif isinstance(geom, (tuple, list)):
+            geom = box(*geom)
+        return np.sort(self.tree.query(geom, predicate=predicate))
+
+    def query_bulk(self, geoms, predicate="intersects"):
+        """
+        Match many geometries at once
+
+        Returns
+        -------
+        numpy.ndarray
+            ``(2, n)`` array of (position in ``geoms``, footprint position) pairs.
+        """
+        return self.tree.query(np.asarray(geoms, dtype=object), predicate=predicate)
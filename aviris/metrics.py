@@ -0,0 +1,268 @@
+"""
+Per-stage metrics of a collection run.
+
+Every unit of work (a CMR page, a download, a checksum verification, a
+conversion, a co-registration) is timed with ``stage`` and, once a run is
+started, appended as one JSON line to the run's metrics file:
+
+    stage, item          what was done, e.g. "download", "ang..._img.bin"
+    start, seconds       wall clock start and duration
+    cpu_seconds          CPU time of the thread that did the work; close to
+                         ``seconds`` means CPU bound, far below means waiting
+                         for the network or the disk
+    bytes, mb_per_s      payload and its throughput
+    retries              HTTP retries done by urllib3
+    peak_rss_mb          peak resident memory of the process so far
+    status, error        "ok" or "failed"
+
+plus stage specific fields (e.g. ``read_seconds`` / ``write_seconds`` of a
+conversion). The file name is kept in ``$AVIRIS_METRICS``, so worker
+processes of ``convert_batch`` / ``coregister_pairs`` append to the same
+file. Without a started run nothing is written.
+
+Example
+-------
+>>> start_run("ngl2")                      # metrics/ngl2_20250101T120000.jsonl
+>>> ...
+>>> report()                               # summary table + CSV of all records
+$ python -m aviris.metrics metrics/ngl2_after.jsonl metrics/ngl2_before.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+ENV_VAR = "AVIRIS_METRICS"
+DEFAULT_DIR = "metrics"
+# Stages that wait on remote servers rather than on the local disk
+NETWORK_STAGES = ("auth", "cmr_page", "cmr_umm", "stac", "download", "remote_read")
+SUMMARY_FIELDS = ("stage", "count", "failed", "seconds", "span_seconds", "p50_seconds", "p95_seconds",
+                  "cpu_share", "gb", "mb_per_s", "retries", "peak_rss_mb", "bound")
+
+_lock = threading.Lock()
+
+
+def start_run(name, directory=DEFAULT_DIR):
+    """
+    Start recording to ``<directory>/<name>_<timestamp>.jsonl``
+
+    Returns
+    -------
+    str
+        Path of the metrics file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.jsonl")
+    os.environ[ENV_VAR] = path
+    print(f"📈 Recording metrics to {path}")
+    return path
+
+
+def current_path():
+    """Metrics file of the running run, or None."""
+    return os.environ.get(ENV_VAR) or None
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def response_retries(response):
+    """Number of retries urllib3 needed for a requests response."""
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    return len(retries.history) if retries is not None and retries.history else 0
+
+
+def record(stage_name, item=None, **fields):
+    """Append one pre-measured record to the run's metrics file."""
+    path = current_path()
+    if path is None:
+        return
+    entry = {"stage": stage_name, "item": item, "pid": os.getpid(), **fields}
+    seconds, nbytes = entry.get("seconds"), entry.get("bytes")
+    if seconds and nbytes is not None and "mb_per_s" not in entry:
+        entry["mb_per_s"] = round(nbytes / 1024 ** 2 / seconds, 3)
+    entry.setdefault("status", "ok")
+    line = (json.dumps(entry, default=float) + "\n").encode()
+    # One O_APPEND write per record, so processes sharing the file do not interleave
+    with _lock:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def stage(stage_name, item=None, **fields):
+    """
+    Time a unit of work and record it when the block exits
+
+    The yielded dict collects extra fields, e.g. ``m["bytes"] = n``.
+    Exceptions are recorded with ``status="failed"`` and re-raised.
+    """
+    entry = dict(fields)
+    start, wall, cpu = time.time(), time.perf_counter(), time.thread_time()
+    try:
+        yield entry
+    except BaseException as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e)[:200]
+        raise
+    finally:
+        seconds = time.perf_counter() - wall
+        record(
+            stage_name,
+            item,
+            start=round(start, 3),
+            seconds=round(seconds, 4),
+            cpu_seconds=round(time.thread_time() - cpu, 4),
+            peak_rss_mb=round(_peak_rss_mb(), 1),
+            **entry,
+        )
+
+
+def load(path):
+    """All records of a metrics file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    One row per stage, in order of first appearance
+
+    ``span_seconds`` is the wall time between the first start and the last
+    end of a stage, so ``seconds / span_seconds`` is its average concurrency
+    and ``mb_per_s`` its aggregate throughput over that span. ``bound`` is a
+    rough guess at the limiting resource: "cpu" when the worker threads were
+    busy computing for most of the time, otherwise "network" or "disk"
+    ("-" for untimed records such as cache hits).
+    """
+    stages = {}
+    for entry in records:
+        stages.setdefault(entry["stage"], []).append(entry)
+
+    rows = []
+    for name, entries in stages.items():
+        seconds = np.array([e.get("seconds", 0.0) for e in entries])
+        cpu = sum(e.get("cpu_seconds", 0.0) for e in entries)
+        nbytes = sum(e.get("bytes") or 0 for e in entries)
+        starts = [e["start"] for e in entries if "start" in e]
+        ends = [e["start"] + e.get("seconds", 0.0) for e in entries if "start" in e]
+        span = max(ends) - min(starts) if starts else float(seconds.sum())
+        cpu_share = cpu / seconds.sum() if seconds.sum() > 0 else 0.0
+        if seconds.sum() == 0:
+            bound = "-"
+        elif cpu_share >= 0.7:
+            bound = "cpu"
+        else:
+            bound = "network" if name in NETWORK_STAGES else "disk"
+        rows.append({
+            "stage": name,
+            "count": len(entries),
+            "failed": sum(e.get("status") == "failed" for e in entries),
+            "seconds": round(float(seconds.sum()), 1),
+            "span_seconds": round(span, 1),
+            "p50_seconds": round(float(np.percentile(seconds, 50)), 2),
+            "p95_seconds": round(float(np.percentile(seconds, 95)), 2),
+            "cpu_share": round(cpu_share, 2),
+            "gb": round(nbytes / 1024 ** 3, 3),
+            "mb_per_s": round(nbytes / 1024 ** 2 / span, 1) if span > 0 else 0.0,
+            "retries": sum(e.get("retries", 0) for e in entries),
+            "peak_rss_mb": max((e.get("peak_rss_mb", 0.0) for e in entries), default=0.0),
+            "bound": bound,
+        })
+    return rows
+
+
+def _print_table(rows, fields):
+    widths = [max(len(f), *(len(str(row[f])) for row in rows)) for f in fields]
+    print("  ".join(f.ljust(w) for f, w in zip(fields, widths)))
+    for row in rows:
+        print("  ".join(str(row[f]).ljust(w) for f, w in zip(fields, widths)))
+
+
+def write_csv(records, csv_path):
+    """All records as CSV, one column per field seen in any record."""
+    fields = []
+    for entry in records:
+        fields += [key for key in entry if key not in fields]
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+    return csv_path
+
+
+def report(path=None, csv_path=None):
+    """
+    Print the per-stage summary of a run and export its records as CSV
+
+    Parameters
+    ----------
+    path : str, optional
+        Metrics file, the current run's by default.
+    csv_path : str, optional
+        CSV export, ``path`` with ``.csv`` by default.
+
+    Returns
+    -------
+    list[dict]
+        The summary rows.
+    """
+    path = path or current_path()
+    if path is None or not os.path.exists(path):
+        print("No metrics recorded")
+        return []
+    records = load(path)
+    rows = summarize(records)
+    print(f"\n📈 Metrics of {path} ({len(records)} records)")
+    _print_table(rows, SUMMARY_FIELDS)
+    write_csv(records, csv_path or os.path.splitext(path)[0] + ".csv")
+    return rows
+
+
+def compare(path, baseline_path):
+    """Print the per-stage change in time and throughput between two runs."""
+    before = {row["stage"]: row for row in summarize(load(baseline_path))}
+    rows = []
+    for row in summarize(load(path)):
+        base = before.get(row["stage"])
+        if base is None:
+            continue
+        rows.append({
+            "stage": row["stage"],
+            "count": f"{base['count']} -> {row['count']}",
+            "span_seconds": f"{base['span_seconds']} -> {row['span_seconds']}",
+            "p50_seconds": f"{base['p50_seconds']} -> {row['p50_seconds']}",
+            "mb_per_s": f"{base['mb_per_s']} -> {row['mb_per_s']}",
+            "speedup": round(base["span_seconds"] / row["span_seconds"], 2) if row["span_seconds"] else "-",
+        })
+    print(f"\n📈 {path} vs {baseline_path}")
+    _print_table(rows, ("stage", "count", "span_seconds", "p50_seconds", "mb_per_s", "speedup"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the metrics file of a run")
+    parser.add_argument("metrics", help="JSONL metrics file")
+    parser.add_argument("baseline", nargs="?", help="metrics of an earlier run to compare against")
+    args = parser.parse_args()
+    report(args.metrics)
+    if args.baseline:
+        compare(args.metrics, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
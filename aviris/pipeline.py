@@ -0,0 +1,302 @@
+"""
+Pipelined download -> verify -> convert -> cleanup engine.
+
+Files are grouped into scenes (an HDR/BIN pair shares its name up to the
+extension) and every scene flows through four stages connected by bounded
+queues:
+
+    fetch      threads download the files of one scene each; size and checksum
+               are verified while streaming (see ``aviris.download``)
+    convert    a scene is converted once all of its files are present, while
+               the fetchers already work on the next ones; rasterio releases
+               the GIL while GDAL reads, compresses and writes, so converter
+               threads use separate cores
+    cleanup    the originals are deleted after a successful conversion, or
+               unpinned when they come from a shared ``GranuleCache``
+
+Before a scene is fetched its expected size is reserved against a byte quota
+on the scratch directory; the reservation is released once its originals are
+deleted. When the quota (or the free space on the disk) runs out, fetching
+pauses until conversions catch up, so a collection much larger than the
+scratch space can be processed in one run.
+
+With a shared ``aviris.shard.Manifest`` the scenes are claimed one at a time
+instead of taken from the URL list, so one pipeline per task of a job array
+splits a collection between nodes.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from aviris.convert import convert_windowed, find_data_file
+from aviris.download import HostLimiter, ThroughputReport, download_file, make_session, scene_key
+
+_DONE = object()
+
+
+def group_scenes(urls):
+    """``{scene: [urls]}`` in the order in which the scenes first appear."""
+    scenes = OrderedDict()
+    for url in urls:
+        scenes.setdefault(scene_key(url), []).append(url)
+    return scenes
+
+
+def convert_envi_scene(paths, output_dir, options):
+    """Default convert stage: the ENVI pair of a scene to ``<scene>.tif``."""
+    hdr_path = next((p for p in paths if p.endswith(".hdr")), None)
+    if hdr_path is None:
+        raise FileNotFoundError(f"No ENVI header among {[os.path.basename(p) for p in paths]}")
+    data_path = find_data_file(hdr_path)
+    if data_path is None:
+        raise FileNotFoundError(f"No ENVI data file for {hdr_path}")
+    tif_path = os.path.join(output_dir, os.path.basename(hdr_path)[:-4] + ".tif")
+    convert_windowed(data_path, tif_path, **options)
+    return tif_path
+
+
+class DiskBudget:
+    """
+    Byte reservations against a quota and the free space of a directory
+
+    Parameters
+    ----------
+    path : str
+        Scratch directory the downloads go to.
+    quota : int, optional
+        Maximum bytes of downloaded-but-not-cleaned-up scenes.
+    min_free : int
+        Keep at least this many bytes free on the file system.
+    """
+
+    def __init__(self, path, quota=None, min_free=0):
+        self.path = path
+        self.quota = quota
+        self.min_free = min_free
+        self.reserved = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes):
+        if self.reserved == 0:
+            # Always let one scene through, even if it is larger than the quota
+            return True
+        if self.quota is not None and self.reserved + nbytes > self.quota:
+            return False
+        return shutil.disk_usage(self.path).free - nbytes >= self.min_free
+
+    def reserve(self, nbytes):
+        with self._cond:
+            waited = False
+            while not self._fits(nbytes):
+                if not waited:
+                    print(f"⏸️ Scratch space full ({self.reserved / 1024 ** 3:.1f}GB in flight), pausing downloads")
+                    waited = True
+                self._cond.wait(timeout=30)
+            self.reserved += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.reserved -= nbytes
+            self._cond.notify_all()
+
+
+def run_pipeline(urls, download_dir, output_dir, session=None, expected=None, fetch_workers=4,
+                 convert_workers=2, queue_size=4, quota=None, min_free=0, per_host=4,
+                 convert=convert_envi_scene, delete_originals=True, cache=None, manifest=None, **options):
+    """
+    Download, convert and clean up scenes with overlapping stages
+
+    Parameters
+    ----------
+    urls : list[str]
+        File URLs, e.g. all ``.hdr`` and ``.bin`` links of a collection.
+    download_dir : str
+        Scratch directory for the downloaded originals, unused with a
+        ``cache``.
+    output_dir : str
+        Directory for the converted outputs.
+    session : requests.Session, optional
+        Authenticated session shared by the fetchers.
+    expected : dict, optional
+        ``{filename: FileInfo}`` used to verify downloads and size the
+        disk reservations.
+    fetch_workers : int
+        Scenes downloaded at the same time.
+    convert_workers : int
+        Converter threads.
+    queue_size : int
+        Capacity of the queues between the stages.
+    quota : int, optional
+        Byte quota for originals on the scratch directory.
+    min_free : int
+        Pause fetching when the scratch file system has less free space.
+    per_host : int
+        Maximum simultaneous requests against one host.
+    convert : callable
+        ``convert(paths, output_dir, options) -> output path``.
+    delete_originals : bool
+        Remove the downloaded files after a successful conversion.
+    cache : aviris.cache.GranuleCache, optional
+        Fetch through a shared cache instead of into ``download_dir``. Files
+        are pinned while their scene is converted and stay cached afterwards,
+        the cache quota bounds the disk use instead of deletion.
+    manifest : aviris.shard.Manifest, optional
+        Shared manifest for running one pipeline per task of a job array.
+        The scenes are added to it, and this pipeline only processes the
+        scenes it claims, marking each done or failed.
+    **options
+        Passed to ``convert``, e.g. ``compress="lzw"``.
+
+    Returns
+    -------
+    dict
+        ``{"converted": [...], "failed": [(scene, error), ...]}``. Failed
+        scenes keep their originals on disk.
+    """
+    if cache is not None:
+        download_dir = cache.root
+    os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    expected = expected or {}
+    session = make_session(session, pool_size=fetch_workers)
+    limiter = HostLimiter(per_host)
+    report = ThroughputReport()
+    budget = DiskBudget(download_dir, quota, min_free)
+    scenes = group_scenes(urls)
+
+    fetch_q = queue.Queue(maxsize=queue_size)
+    convert_q = queue.Queue(maxsize=queue_size)
+    cleanup_q = queue.Queue(maxsize=queue_size)
+    converted, failed = [], []
+    lock = threading.Lock()
+    fetchers_left = [fetch_workers]
+    schedule_error = []
+
+    def scene_bytes(scene_urls):
+        sizes = [expected.get(url.split("/")[-1]) for url in scene_urls]
+        return sum(info.size for info in sizes if info and info.size)
+
+    if manifest is not None:
+        manifest.build(dict(scenes))
+
+    def finish(scene, output=None, error=None):
+        if manifest is None:
+            return
+        if error is None:
+            manifest.done(scene, {"output": output})
+        else:
+            manifest.fail(scene, error)
+
+    def schedule():
+        try:
+            claimed = manifest.claims() if manifest is not None else scenes.items()
+            for scene, scene_urls in claimed:
+                nbytes = scene_bytes(scene_urls)
+                budget.reserve(nbytes)
+                fetch_q.put((scene, scene_urls, nbytes))
+        except BaseException as e:
+            # Raised once the scenes already queued are through, see below
+            schedule_error.append(e)
+            print(f"❌ Scheduling stopped - {e}")
+        finally:
+            # Without the sentinels the fetchers, and so every stage, would wait forever
+            for _ in range(fetch_workers):
+                fetch_q.put(_DONE)
+
+    def fetch():
+        while (job := fetch_q.get()) is not _DONE:
+            scene, scene_urls, nbytes = job
+            paths = []
+            try:
+                for url in scene_urls:
+                    filename = url.split("/")[-1]
+                    if cache is not None:
+                        with limiter(url):
+                            paths.append(cache.get(url, expected=expected.get(filename), session=session,
+                                                   report=report, pin=True))
+                        continue
+                    path = os.path.join(download_dir, filename)
+                    if not os.path.exists(path):
+                        with limiter(url):
+                            download_file(session, url, path, report, expected=expected.get(filename))
+                        report.done()
+                    paths.append(path)
+            except Exception as e:
+                if cache is not None:
+                    for path in paths:
+                        cache.unpin(path)
+                budget.release(nbytes)
+                report.fail(scene, e)
+                finish(scene, error=f"download: {e}")
+                with lock:
+                    failed.append((scene, f"download: {e}"))
+                print(f"❌ {scene}: download failed - {e}")
+                continue
+            print(f"⬇️ {scene}: {len(paths)} files ready - {report.rate:.1f}MB/s aggregate")
+            convert_q.put((scene, paths, nbytes))
+
+        # The last fetcher to finish tells every converter to stop
+        with lock:
+            fetchers_left[0] -= 1
+            last = fetchers_left[0] == 0
+        if last:
+            for _ in range(convert_workers):
+                convert_q.put(_DONE)
+
+    def run_convert():
+        while (job := convert_q.get()) is not _DONE:
+            scene, paths, nbytes = job
+            start = time.time()
+            try:
+                output = convert(paths, output_dir, options)
+            except Exception as e:
+                if cache is not None:
+                    for path in paths:
+                        cache.unpin(path)
+                budget.release(nbytes)
+                finish(scene, error=f"convert: {e}")
+                with lock:
+                    failed.append((scene, f"convert: {e}"))
+                print(f"❌ {scene}: conversion failed - {e}")
+                continue
+            print(f"✅ {scene}: converted in {time.time() - start:.1f}s")
+            finish(scene, output)
+            with lock:
+                converted.append(output)
+            cleanup_q.put((paths, nbytes))
+        cleanup_q.put(_DONE)
+
+    def cleanup():
+        remaining = convert_workers
+        while remaining:
+            job = cleanup_q.get()
+            if job is _DONE:
+                remaining -= 1
+                continue
+            paths, nbytes = job
+            if cache is not None:
+                for path in paths:
+                    cache.unpin(path)
+            elif delete_originals:
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+            budget.release(nbytes)
+
+    threads = [threading.Thread(target=schedule)]
+    threads += [threading.Thread(target=fetch) for _ in range(fetch_workers)]
+    threads += [threading.Thread(target=run_convert) for _ in range(convert_workers)]
+    threads += [threading.Thread(target=cleanup)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"\n📊 {report.summary()}")
+    print(f"✅ {len(converted)} scenes converted, {len(failed)} failed")
+    if schedule_error:
+        raise schedule_error[0]
+    return {"converted": converted, "failed": failed}
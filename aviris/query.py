@@ -0,0 +1,184 @@
+"""
+Declarative granule queries.
+
+A ``GranuleQuery`` is translated into CMR search parameters where CMR can do
+the filtering (``bounding_box``, ``polygon``, ``temporal`` and a
+``readable_granule_name`` pattern). Whatever CMR cannot express, such as
+"the whole footprint lies inside a latitude band", runs vectorized over the
+parsed footprints of all granules at once.
+
+Example
+-------
+>>> query = GranuleQuery(lat_band=(-90, 45), start="2023-01-01")
+>>> granules = list(search_granules(collection, **query.cmr_params()))
+>>> granules = query.filter(granules, server_side=True)
+"""
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from itertools import chain
+
+import numpy as np
+
+
+def parse_polygons(granules):
+    """
+    Parse the first footprint ring of every granule in one step
+
+    CMR encodes footprints as strings of "lat lon lat lon ..." pairs. All rings
+    are converted to floats in a single array operation.
+
+    Parameters
+    ----------
+    granules : list[dict]
+        granules.json entries.
+
+    Returns
+    -------
+    coords : numpy.ndarray
+        ``(n_points, 2)`` array of lon / lat vertices of all rings.
+    offsets : numpy.ndarray
+        ``(n_granules + 1,)`` start index of each ring in ``coords``; a granule
+        without a polygon has an empty ring.
+    """
+    tokens = [g["polygons"][0][0].split() if g.get("polygons") else [] for g in granules]
+    counts = np.fromiter((len(t) // 2 for t in tokens), dtype=np.int64, count=len(tokens))
+    values = np.array(list(chain.from_iterable(tokens)), dtype=np.float64)
+
+    coords = values.reshape(-1, 2)[:, ::-1]
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return coords, offsets
+
+
+def footprint_bounds(coords, offsets):
+    """
+    Per-granule ``(west, south, east, north)`` bounds of parsed footprints
+
+    Granules without a footprint get NaN bounds, so they never pass a spatial
+    filter.
+    """
+    bounds = np.full((len(offsets) - 1, 4), np.nan)
+    starts = offsets[:-1]
+    valid = offsets[1:] > starts
+    if valid.any():
+        # Empty rings have zero length, so reducing from the valid starts only
+        # still ends every segment at the right place
+        starts = starts[valid]
+        bounds[valid, 0] = np.minimum.reduceat(coords[:, 0], starts)
+        bounds[valid, 1] = np.minimum.reduceat(coords[:, 1], starts)
+        bounds[valid, 2] = np.maximum.reduceat(coords[:, 0], starts)
+        bounds[valid, 3] = np.maximum.reduceat(coords[:, 1], starts)
+    return bounds
+
+
+def _overlaps(bounds, box):
+    west, south, east, north = box
+    return (
+        (bounds[:, 0] <= east) & (bounds[:, 2] >= west)
+        & (bounds[:, 1] <= north) & (bounds[:, 3] >= south)
+    )
+
+
+def _closed_ccw(polygon):
+    """Close the ring and make it counter-clockwise, as CMR requires."""
+    ring = [tuple(p) for p in polygon]
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+    area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:]))
+    return ring if area > 0 else ring[::-1]
+
+
+@dataclass
+class GranuleQuery:
+    """
+    Spatial / temporal / filename constraints for a granule search
+
+    Parameters
+    ----------
+    bbox : tuple, optional
+        ``(west, south, east, north)`` in degrees; footprints must intersect it.
+    polygon : list, optional
+        ``[(lon, lat), ...]`` ring; footprints must intersect it.
+    lat_band : tuple, optional
+        ``(min_lat, max_lat)``; the whole footprint must lie inside the band.
+    start, end : str, optional
+        ISO 8601 date window on the granule start time.
+    title_pattern : str, optional
+        Glob on the granule title, e.g. "ang2023*_rfl_*".
+    """
+
+    bbox: tuple = None
+    polygon: list = None
+    lat_band: tuple = None
+    start: str = None
+    end: str = None
+    title_pattern: str = None
+
+    def cmr_params(self):
+        """CMR search parameters for everything CMR can filter on."""
+        params = {}
+
+        bbox = self.bbox
+        if self.lat_band is not None:
+            # CMR only knows "intersects", filter() tightens this to "inside"
+            west, south, east, north = bbox or (-180, -90, 180, 90)
+            bbox = (west, max(south, self.lat_band[0]), east, min(north, self.lat_band[1]))
+        if bbox is not None:
+            params["bounding_box"] = ",".join(str(v) for v in bbox)
+
+        if self.polygon is not None:
+            params["polygon"] = ",".join(f"{lon},{lat}" for lon, lat in _closed_ccw(self.polygon))
+
+        if self.start or self.end:
+            params["temporal"] = f"{self.start or ''},{self.end or ''}"
+
+        if self.title_pattern:
+            params["readable_granule_name"] = self.title_pattern
+            params["options[readable_granule_name][pattern]"] = "true"
+
+        return params
+
+    def filter(self, granules, server_side=False):
+        """
+        Apply the query to granule entries
+
+        Parameters
+        ----------
+        granules : iterable of dict
+            granules.json entries, e.g. from the local catalog.
+        server_side : bool
+            True if the granules came from a CMR search with ``cmr_params()``,
+            in which case only the filters CMR cannot do are applied.
+            The polygon constraint is checked against the footprint bounds
+            when applied locally.
+
+        Returns
+        -------
+        list[dict]
+        """
+        granules = list(granules)
+        if not granules:
+            return []
+        keep = np.ones(len(granules), dtype=bool)
+
+        if not server_side:
+            if self.start or self.end:
+                time_start = np.array([g.get("time_start") or "" for g in granules])
+                if self.start:
+                    keep &= time_start >= self.start
+                if self.end:
+                    keep &= time_start < self.end
+            if self.title_pattern:
+                keep &= np.array([fnmatch(g["title"], self.title_pattern) for g in granules], dtype=bool)
+
+        local_spatial = not server_side and (self.bbox is not None or self.polygon is not None)
+        if self.lat_band is not None or local_spatial:
+            bounds = footprint_bounds(*parse_polygons(granules))
+            if self.lat_band is not None:
+                keep &= (bounds[:, 1] >= self.lat_band[0]) & (bounds[:, 3] <= self.lat_band[1])
+            if not server_side and self.bbox is not None:
+                keep &= _overlaps(bounds, self.bbox)
+            if not server_side and self.polygon is not None:
+                lon, lat = np.asarray(self.polygon, dtype=float).T
+                keep &= _overlaps(bounds, (lon.min(), lat.min(), lon.max(), lat.max()))
+
+        return [g for g, k in zip(granules, keep) if k]
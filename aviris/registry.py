@@ -0,0 +1,99 @@
+"""
+Registry of the AVIRIS collections the scripts work with.
+
+The download scripts differed only in the collection concept ID, the suffix
+of the data links they keep and where their output goes; those now live
+here, one ``Collection`` per CMR collection, looked up by short name or
+concept ID.
+
+Example
+-------
+>>> collection = get_collection("ngl2")
+>>> urls = [url for granule in granules for url in collection.data_links(granule)]
+"""
+from dataclasses import dataclass
+
+DATA_REL = "http://esipfed.org/ns/fedsearch/1.1/data#"
+
+
+@dataclass(frozen=True)
+class Collection:
+    """
+    One CMR collection and how its files are handled
+
+    Attributes
+    ----------
+    name : str
+        Short name used on the command line.
+    concept_id : str
+        CMR collection concept ID.
+    title : str
+        Collection title, for listings.
+    suffixes : tuple[str, ...]
+        Data link suffixes to download, e.g. the ENVI ``.hdr`` and ``.bin``.
+    format : str
+        "envi" (converted with ``aviris.convert``) or "netcdf"
+        (``aviris.cog``).
+    output_dir : str
+        Default directory for converted outputs.
+    start : str
+        Granules that start before this are ignored.
+    """
+
+    name: str
+    concept_id: str
+    title: str
+    suffixes: tuple
+    format: str
+    output_dir: str
+    start: str = "2022-07-01T00:00:00.000Z"
+
+    def data_links(self, granule):
+        """Data URLs of a granule that end in one of the collection's suffixes."""
+        return [
+            link["href"]
+            for link in granule.get("links", [])
+            if link.get("rel") == DATA_REL and link.get("href", "").endswith(self.suffixes)
+        ]
+
+
+COLLECTIONS = {
+    collection.name: collection
+    for collection in (
+        Collection(
+            name="ngl2",
+            concept_id="C2659129205-ORNL_CLOUD",
+            title="AVIRIS-NG L2 Surface Reflectance, Facility Instrument Collection, V1",
+            suffixes=(".hdr", ".bin"),
+            format="envi",
+            output_dir="geotiffs",
+        ),
+        Collection(
+            name="av3l2a",
+            concept_id="C3369603199-ORNL_CLOUD",
+            title="AVIRIS-3 L2A Orthocorrected Surface Reflectance, Facility Instrument Collection",
+            suffixes=("RFL_ORT.nc",),
+            format="netcdf",
+            output_dir="AVIRIS_downloads/3L2A_COG",
+        ),
+        Collection(
+            name="shift",
+            concept_id="C3834287411-ORNL_CLOUD",
+            title="SHIFT: AVIRIS-NG L2A Orthorectified Surface Reflectance, V2",
+            # V2 of the SHIFT reflectance is distributed as NetCDF
+            suffixes=(".nc",),
+            format="netcdf",
+            output_dir="AVIRIS_downloads/SHIFT_COG",
+        ),
+    )
+}
+
+
+def get_collection(name):
+    """A registered collection by short name or concept ID."""
+    if name in COLLECTIONS:
+        return COLLECTIONS[name]
+    for collection in COLLECTIONS.values():
+        if name == collection.concept_id or collection.concept_id.startswith(name + "-"):
+            return collection
+    raise KeyError(f"Unknown collection {name!r}, expected one of {', '.join(COLLECTIONS)} or a concept ID")
@@ -0,0 +1,294 @@
+"""
+Partial reads of remote ENVI cubes over HTTP Range requests.
+
+Only the small ``.hdr`` is downloaded in full. From its lines, samples,
+bands, interleave, data type, byte order and header offset the byte ranges
+of any row / column / band subset are computed, rounded to fixed-size blocks,
+and the missing blocks are fetched with as few Range requests as possible:
+neighbouring blocks (and gaps of up to ``max_gap`` bytes) are merged into one
+request. Fetched blocks stay in an LRU cache, so overlapping reads, e.g. an
+AOI and then single spectra inside it, hit the network once.
+
+Example
+-------
+>>> cube = RemoteEnviCube("https://.../ang20220917t211723_rfl_v2aa1a_img.bin", session=session)
+>>> block = cube.read_bounds(enmap_bounds, crs="EPSG:32611", bands=range(0, 425, 4))
+>>> cube.bytes_fetched / cube.nbytes
+"""
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from aviris import metrics
+from aviris.download import make_session
+from aviris.envi import map_transform, numpy_dtype, parse_header
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_MAX_GAP = 1024 * 1024
+
+
+class BlockCache:
+    """
+    Thread-safe LRU cache of fixed-size file blocks
+
+    Parameters
+    ----------
+    max_bytes : int
+        Blocks are evicted, least recently used first, above this size.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            return block
+
+    def put(self, key, block):
+        with self._lock:
+            if key in self._blocks:
+                return
+            self._blocks[key] = block
+            self.nbytes += len(block)
+            while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+                _, evicted = self._blocks.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+
+class RemoteEnviCube:
+    """
+    ENVI cube on an HTTP server that supports Range requests
+
+    Parameters
+    ----------
+    url : str
+        URL of the data file, e.g. ``..._img.bin``.
+    session : requests.Session, optional
+        Authenticated session, see ``aviris.download.make_session``.
+    hdr_url : str, optional
+        URL of the header, by default ``url`` with ``.bin`` replaced by
+        ``.hdr`` (or ``.hdr`` appended).
+    block_size : int
+        Size of the cached blocks in bytes.
+    cache : BlockCache, optional
+        Shared block cache, a new one of ``DEFAULT_CACHE_SIZE`` by default.
+    max_gap : int
+        Unneeded bytes between two needed blocks that are still fetched in
+        the same request instead of starting a new one.
+    workers : int
+        Range requests issued in parallel.
+    timeout : float
+        Request timeout in seconds.
+    """
+
+    def __init__(self, url, session=None, hdr_url=None, block_size=DEFAULT_BLOCK_SIZE, cache=None,
+                 max_gap=DEFAULT_MAX_GAP, workers=4, timeout=60):
+        self.url = url
+        self.session = make_session(session, pool_size=workers)
+        self.block_size = block_size
+        self.cache = cache if cache is not None else BlockCache()
+        self.max_gap = max_gap
+        self.workers = workers
+        self.timeout = timeout
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._stats_lock = threading.Lock()
+
+        if hdr_url is None:
+            hdr_url = url[:-4] + ".hdr" if url.endswith(".bin") else url + ".hdr"
+        response = self.session.get(hdr_url, timeout=timeout)
+        response.raise_for_status()
+        self.header = parse_header(response.text, hdr_url)
+
+        self.lines = self.header["lines"]
+        self.samples = self.header["samples"]
+        self.bands = self.header["bands"]
+        self.interleave = self.header.get("interleave", "bsq").lower()
+        self.dtype = numpy_dtype(self.header)
+        self.offset = self.header.get("header offset", 0)
+        self.nodata = self.header.get("data ignore value")
+        self.transform, self.crs = map_transform(self.header)
+        self.nbytes = self.lines * self.samples * self.bands * self.dtype.itemsize
+
+    @property
+    def shape(self):
+        return self.bands, self.lines, self.samples
+
+    def _segments(self, rows, col0, col1, bands):
+        """
+        File offsets and length of the contiguous runs holding a subset
+
+        Returns
+        -------
+        starts : numpy.ndarray
+            Byte offset of every run, in output order.
+        length : int
+            Bytes per run.
+        """
+        item = self.dtype.itemsize
+        rows = np.asarray(rows, dtype=np.int64)[:, np.newaxis]
+        bands_ = np.asarray(bands, dtype=np.int64)[np.newaxis, :]
+        if self.interleave == "bip":
+            # One run per row with every band of the selected columns
+            starts = (rows[:, 0] * self.samples + col0) * self.bands * item
+            return self.offset + starts, (col1 - col0) * self.bands * item
+        if self.interleave == "bil":
+            starts = ((rows * self.bands + bands_) * self.samples + col0) * item
+        else:
+            starts = ((bands_ * self.lines + rows) * self.samples + col0) * item
+        # (row, band) order; rearranged to (band, row) after reading
+        return self.offset + starts.ravel(), (col1 - col0) * item
+
+    def _fetch_run(self, first, last):
+        """Fetch blocks ``first..last`` with one Range request."""
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.offset + self.nbytes) - 1
+        headers = {"Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"}
+        with metrics.stage("remote_read", self.url.split("/")[-1]) as m:
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"{self.url} does not support Range requests (HTTP {response.status_code})")
+            # Anything but exactly the requested bytes would shift every value read from them
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes (\d+)-(\d+)/", content_range)
+            if match is None or (int(match.group(1)), int(match.group(2))) != (start, end):
+                raise IOError(f"{self.url} answered bytes={start}-{end} with Content-Range {content_range!r}")
+            data = response.content
+            if len(data) != end - start + 1:
+                raise IOError(f"{self.url} sent {len(data)} bytes for bytes={start}-{end}")
+            m.update(bytes=len(data), retries=metrics.response_retries(response))
+        with self._stats_lock:
+            self.requests += 1
+            self.bytes_fetched += len(data)
+
+        blocks = {}
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            blocks[index] = data[offset:offset + self.block_size]
+            self.cache.put((self.url, index), blocks[index])
+        return blocks
+
+    def _get_blocks(self, indices):
+        """``{index: bytes}`` for sorted block indices, fetching what is not cached."""
+        blocks = {}
+        missing = []
+        for index in indices:
+            block = self.cache.get((self.url, index))
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+        if not missing:
+            return blocks
+
+        # Neighbouring missing blocks, or ones separated by a small gap, share a request
+        gap_blocks = self.max_gap // self.block_size
+        runs = [[missing[0], missing[0]]]
+        for index in missing[1:]:
+            if index - runs[-1][1] - 1 <= gap_blocks:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+
+        if len(runs) == 1 or self.workers == 1:
+            fetched = [self._fetch_run(first, last) for first, last in runs]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                fetched = list(pool.map(lambda run: self._fetch_run(*run), runs))
+        for run in fetched:
+            blocks.update(run)
+        return blocks
+
+    def _read_segments(self, starts, length):
+        """Bytes of all runs concatenated, as a uint8 array."""
+        first = starts // self.block_size
+        last = (starts + length - 1) // self.block_size
+        needed = np.unique(np.concatenate([np.arange(a, b + 1) for a, b in zip(first, last)]))
+        blocks = self._get_blocks(needed.tolist())
+
+        # All needed blocks back to back; the blocks of one segment are
+        # consecutive indices, so every segment is contiguous in this buffer
+        buffer = np.frombuffer(b"".join(blocks[i] for i in needed.tolist()), dtype=np.uint8)
+        positions = np.searchsorted(needed, first) * self.block_size + starts % self.block_size
+
+        # Copied with slices, merging segments that follow each other in the
+        # buffer, e.g. the rows of one band; a fancy index would need an int64
+        # offset per byte
+        out = np.empty(len(starts) * length, dtype=np.uint8)
+        breaks = np.flatnonzero(positions[1:] != positions[:-1] + length) + 1
+        bounds = np.concatenate([[0], breaks, [len(starts)]])
+        for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            src = int(positions[a])
+            out[a * length:b * length] = buffer[src:src + (b - a) * length]
+        return out
+
+    def read(self, window=None, bands=None):
+        """
+        Read a subset as a ``(bands, rows, cols)`` array
+
+        Parameters
+        ----------
+        window : rasterio.windows.Window, optional
+            Pixel window, the whole cube by default.
+        bands : sequence of int, optional
+            0-based band indices, all bands by default.
+
+        Returns
+        -------
+        numpy.ndarray
+            In native byte order.
+        """
+        if window is None:
+            window = Window(0, 0, self.samples, self.lines)
+        col0, row0 = int(window.col_off), int(window.row_off)
+        col1 = min(col0 + int(window.width), self.samples)
+        row1 = min(row0 + int(window.height), self.lines)
+        if col0 < 0 or row0 < 0 or col1 <= col0 or row1 <= row0:
+            raise ValueError(f"Window {window} is outside the {self.lines} x {self.samples} cube")
+
+        bands = np.arange(self.bands) if bands is None else np.asarray(list(bands), dtype=np.int64)
+        rows = np.arange(row0, row1)
+        width = col1 - col0
+
+        starts, length = self._segments(rows, col0, col1, bands)
+        data = np.frombuffer(self._read_segments(starts, length), dtype=self.dtype)
+
+        if self.interleave == "bip":
+            block = data.reshape(len(rows), width, self.bands)[:, :, bands].transpose(2, 0, 1)
+        else:
+            block = data.reshape(len(rows), len(bands), width).transpose(1, 0, 2)
+        return np.ascontiguousarray(block).astype(self.dtype.newbyteorder("="), copy=False)
+
+    def window(self, bounds, crs=None):
+        """Pixel window covering ``(left, bottom, right, top)`` given in ``crs``."""
+        if self.transform is None:
+            raise ValueError(f"{self.url} has no map info")
+        if crs is not None and self.crs is not None and str(crs) != self.crs:
+            bounds = transform_bounds(crs, self.crs, *bounds, densify_pts=21)
+        window = from_bounds(*bounds, transform=self.transform)
+        col0 = max(int(np.floor(window.col_off)), 0)
+        row0 = max(int(np.floor(window.row_off)), 0)
+        col1 = min(int(np.ceil(window.col_off + window.width)), self.samples)
+        row1 = min(int(np.ceil(window.row_off + window.height)), self.lines)
+        return Window(col0, row0, col1 - col0, row1 - row0)
+
+    def read_bounds(self, bounds, crs=None, bands=None):
+        """Read the pixels covering an AOI, e.g. the bounds of an EnMAP overlap."""
+        return self.read(self.window(bounds, crs), bands)
+
+    def spectrum(self, row, col, bands=None):
+        """All (or the selected) bands of one pixel."""
+        return self.read(Window(col, row, 1, 1), bands)[:, 0, 0]
@@ -0,0 +1,312 @@
+"""
+Shared work manifest for SLURM job arrays.
+
+A manifest is a SQLite file listing every item of a run (a scene, an HDR
+file, a pair) in a fixed order. Any number of workers, e.g. the tasks of a
+job array on different nodes, open the same manifest and claim one item at a
+time; a claim is a single ``BEGIN IMMEDIATE`` transaction, so no item is
+handed out twice. Finished items are marked ``done`` or ``failed`` and stay
+that way, so a resubmitted array only does what is left.
+
+Items claimed by a worker that died are handed out again: immediately if
+the worker ran on the same host, otherwise once its lease has expired. While
+a worker holds claims, a heartbeat thread renews their lease, so the lease
+only has to outlast a missed heartbeat, not the longest item.
+
+The manifest uses SQLite's default rollback journal rather than WAL: WAL
+keeps its index in shared memory, which processes on different nodes of a
+network file system (NFS, Lustre) do not share. The rollback journal only
+relies on POSIX file locks, which those file systems provide across nodes.
+
+Example
+-------
+``convert.sbatch``::
+
+    #SBATCH --array=0-31
+    python NGL2toGeoTIF.py --manifest /orange/ntziolas/manifests/ngl2.sqlite
+
+>>> manifest = Manifest("ngl2.sqlite")
+>>> manifest.build({name: urls for name, urls in group_scenes(urls).items()})
+>>> for key, urls in manifest.claims():
+...     manifest.done(key)
+$ python -m aviris.shard ngl2.sqlite --reset-failed
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from aviris.cache import _owner, _owner_alive
+
+DEFAULT_LEASE = 30 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    payload TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, position);
+"""
+STATES = ("pending", "running", "done", "failed")
+
+
+def worker_name():
+    """``<array job>_<task>`` under a SLURM array, the job ID or host:pid otherwise."""
+    if "SLURM_ARRAY_TASK_ID" in os.environ:
+        return f"{os.environ.get('SLURM_ARRAY_JOB_ID', '')}_{os.environ['SLURM_ARRAY_TASK_ID']}"
+    if "SLURM_JOB_ID" in os.environ:
+        return os.environ["SLURM_JOB_ID"]
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Manifest:
+    """
+    Work items in a SQLite file shared by all workers of a run
+
+    Parameters
+    ----------
+    path : str
+        Location of the manifest; put it on a file system every node sees.
+    lease : float
+        Seconds without a heartbeat after which an item still running on
+        another host is assumed lost and handed out again. Claims are renewed
+        every quarter lease while this manifest is open.
+    worker : str, optional
+        Name recorded with each claim, see ``worker_name``.
+    """
+
+    def __init__(self, path, lease=DEFAULT_LEASE, worker=None):
+        self.path = path
+        self.lease = lease
+        self.worker = worker or worker_name()
+        self.owner = _owner()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.conn = sqlite3.connect(path, timeout=300, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL is not safe across nodes of a network file system, see above
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def build(self, items):
+        """
+        Add items, keeping the ones that are already in the manifest
+
+        Every worker of an array can call this with the same list; only the
+        first call inserts anything. Items are ordered by key, so the order
+        does not depend on how the list was assembled.
+
+        Parameters
+        ----------
+        items : dict or iterable
+            ``{key: payload}`` with JSON-serialisable payloads, or bare keys.
+
+        Returns
+        -------
+        int
+            Number of items added.
+        """
+        if not isinstance(items, dict):
+            items = {key: None for key in items}
+        with self._transaction() as conn:
+            position = conn.execute("SELECT COALESCE(MAX(position), -1) FROM items").fetchone()[0]
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (key, position, payload) VALUES (?, ?, ?)",
+                [(key, position + i + 1, json.dumps(items[key])) for i, key in enumerate(sorted(items))],
+            )
+            added = conn.total_changes - before
+        return added
+
+    def _reclaim(self, conn):
+        """Put items of dead workers back to pending."""
+        expired = time.time() - self.lease
+        for row in conn.execute("SELECT key, owner, claimed FROM items WHERE state = 'running'").fetchall():
+            if not _owner_alive(row["owner"]) or row["claimed"] < expired:
+                conn.execute("UPDATE items SET state = 'pending', owner = NULL WHERE key = ?", (row["key"],))
+
+    def _beat(self):
+        while not self._stop.wait(self.lease / 4):
+            try:
+                self.touch()
+            except sqlite3.Error as e:
+                # A missed beat is retried; the lease allows for several
+                print(f"⚠️ [{self.worker}] manifest heartbeat failed: {e}")
+
+    def claim(self):
+        """
+        Claim the next pending item
+
+        The first claim starts the heartbeat that renews this worker's claims
+        until the manifest is closed.
+
+        Returns
+        -------
+        (str, object) or None
+            Key and payload, or None when nothing is left.
+        """
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="manifest-heartbeat", daemon=True)
+                self._heartbeat.start()
+        with self._transaction() as conn:
+            self._reclaim(conn)
+            row = conn.execute(
+                "SELECT key, payload FROM items WHERE state = 'pending' ORDER BY position LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE items SET state = 'running', owner = ?, worker = ?, claimed = ?, attempts = attempts + 1 "
+                "WHERE key = ?",
+                (self.owner, self.worker, time.time(), row["key"]),
+            )
+        return row["key"], json.loads(row["payload"])
+
+    def claims(self):
+        """Yield ``(key, payload)`` claims until the manifest is exhausted."""
+        while (item := self.claim()) is not None:
+            yield item
+
+    def _finish(self, key, state, result=None, error=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE items SET state = ?, owner = NULL, finished = ?, result = ?, error = ? WHERE key = ?",
+                (state, time.time(), json.dumps(result) if result is not None else None, error, key),
+            )
+
+    def done(self, key, result=None):
+        """Mark a claimed item as finished; ``result`` is stored as JSON."""
+        self._finish(key, "done", result=result)
+
+    def fail(self, key, error):
+        """Mark a claimed item as failed; it is not handed out again until reset."""
+        self._finish(key, "failed", error=str(error)[:1000])
+
+    def touch(self, key=None):
+        """Renew the lease of one claimed item, or of all of this worker's claims."""
+        with self._transaction() as conn:
+            if key is None:
+                conn.execute("UPDATE items SET claimed = ? WHERE state = 'running' AND owner = ?",
+                             (time.time(), self.owner))
+            else:
+                conn.execute("UPDATE items SET claimed = ? WHERE key = ? AND owner = ?",
+                             (time.time(), key, self.owner))
+
+    def process(self, func):
+        """
+        Claim and process items until none are left
+
+        Parameters
+        ----------
+        func : callable
+            ``func(key, payload) -> result``; an exception marks the item failed.
+
+        Returns
+        -------
+        dict
+            ``{"done": n, "failed": n}`` for this worker.
+        """
+        counts = {"done": 0, "failed": 0}
+        for key, payload in self.claims():
+            try:
+                result = func(key, payload)
+            except Exception as e:
+                self.fail(key, e)
+                counts["failed"] += 1
+                print(f"❌ [{self.worker}] {key}: {e}")
+                continue
+            self.done(key, result)
+            counts["done"] += 1
+            print(f"✅ [{self.worker}] {key}")
+        return counts
+
+    def reset(self, failed=True, running=False):
+        """Put failed (and optionally running) items back to pending; returns how many."""
+        states = [state for state, flag in (("failed", failed), ("running", running)) if flag]
+        if not states:
+            return 0
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE items SET state = 'pending', owner = NULL, error = NULL "
+                f"WHERE state IN ({', '.join('?' * len(states))})",
+                states,
+            )
+            return cursor.rowcount
+
+    def status(self):
+        """``{state: count}`` over the whole manifest."""
+        with self._lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def failures(self):
+        """``[(key, error), ...]`` of the failed items."""
+        with self._lock:
+            rows = self.conn.execute("SELECT key, error FROM items WHERE state = 'failed' ORDER BY position").fetchall()
+        return [(row["key"], row["error"]) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or reset the state of a work manifest")
+    parser.add_argument("manifest", help="manifest SQLite file")
+    parser.add_argument("--reset-failed", action="store_true", help="hand failed items out again")
+    parser.add_argument("--reset-running", action="store_true",
+                        help="hand running items out again, e.g. after the whole array was cancelled")
+    parser.add_argument("--failures", action="store_true", help="list failed items and their errors")
+    args = parser.parse_args()
+
+    with Manifest(args.manifest) as manifest:
+        if args.reset_failed or args.reset_running:
+            count = manifest.reset(failed=args.reset_failed, running=args.reset_running)
+            print(f"🔄 {count} items reset to pending")
+        counts = manifest.status()
+        print(", ".join(f"{count} {state}" for state, count in counts.items()))
+        if args.failures:
+            for key, error in manifest.failures():
+                print(f"❌ {key}: {error}")
+
+
+if __name__ == "__main__":
+    main()
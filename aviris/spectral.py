@@ -0,0 +1,269 @@
+"""
+Spectral resampling of AVIRIS-NG / AVIRIS-3 cubes onto EnMAP bands.
+
+The band centres and FWHM of the source (ENVI header or NetCDF variables) and
+of the target sensor (EnMAP ``METADATA.XML``) give a sparse
+``n_target x n_source`` weight matrix: every target band is a normalised
+Gaussian (or tabulated) spectral response sampled at the source band
+centres, so it only touches the handful of source bands under it. During a
+conversion the matrix is applied to every window as one sparse-dense matrix
+product, so a resampled GeoTIFF is written in the same single pass as a plain
+conversion.
+
+Example
+-------
+>>> resampler = SpectralResampler.from_enmap_metadata("ENMAP01-..._METADATA.XML", drop_water=True)
+>>> convert_windowed("ang..._rfl.bin", "ang..._enmap.tif", band_transform=resampler)
+"""
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from scipy import sparse
+
+# Atmospheric water vapour absorption windows in nm; reflectance there is
+# mostly noise for airborne and spaceborne sensors alike
+WATER_BANDS = ((1340.0, 1445.0), (1790.0, 1955.0))
+FWHM_TO_SIGMA = 1 / (2 * np.sqrt(2 * np.log(2)))
+
+
+def water_band_mask(wavelength, ranges=WATER_BANDS):
+    """True for bands whose centre lies in one of the absorption ``ranges``."""
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    mask = np.zeros(len(wavelength), dtype=bool)
+    for low, high in ranges:
+        mask |= (wavelength >= low) & (wavelength <= high)
+    return mask
+
+
+def read_enmap_bands(metadata_path):
+    """
+    Band centres and FWHM from an EnMAP ``METADATA.XML``
+
+    Returns
+    -------
+    wavelength, fwhm : numpy.ndarray
+        In nanometers, ordered like the bands of the image.
+    """
+    root = ET.parse(metadata_path).getroot()
+    bands = []
+    for band in root.iter("bandID"):
+        center = band.find("wavelengthCenterOfBand")
+        width = band.find("FWHMOfBand")
+        if center is None or width is None:
+            continue
+        bands.append((int(band.get("number", len(bands) + 1)), float(center.text), float(width.text)))
+    if not bands:
+        raise ValueError(f"No bandCharacterisation in {metadata_path}")
+    bands.sort()
+    return np.array([b[1] for b in bands]), np.array([b[2] for b in bands])
+
+
+def _to_sparse(weights, valid, min_weight):
+    """Mask unusable source bands, prune tiny weights and normalise rows."""
+    weights = np.where(valid[np.newaxis, :], weights, 0.0)
+    row_max = weights.max(axis=1, keepdims=True)
+    weights[weights < min_weight * row_max] = 0.0
+    row_sum = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, row_sum, out=np.zeros_like(weights), where=row_sum > 0)
+    return sparse.csr_matrix(weights.astype(np.float32))
+
+
+def gaussian_srf_matrix(src_wavelength, dst_wavelength, dst_fwhm, valid=None, min_weight=1e-3):
+    """
+    Weights of Gaussian target responses at the source band centres
+
+    Each weight is the target response at a source band centre times the
+    local source band spacing, so unevenly spaced source bands are integrated
+    correctly.
+
+    Parameters
+    ----------
+    src_wavelength : array-like
+        Source band centres.
+    dst_wavelength, dst_fwhm : array-like
+        Target band centres and full widths at half maximum.
+    valid : array-like of bool, optional
+        Source bands that may contribute, e.g. the ENVI bad band list.
+    min_weight : float
+        Weights below this fraction of a row's largest weight are dropped.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        ``(n_target, n_source)``; rows of uncovered target bands are empty.
+    """
+    src = np.asarray(src_wavelength, dtype=np.float64)
+    center = np.asarray(dst_wavelength, dtype=np.float64)[:, np.newaxis]
+    sigma = np.asarray(dst_fwhm, dtype=np.float64)[:, np.newaxis] * FWHM_TO_SIGMA
+    valid = np.ones(len(src), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+
+    weights = np.exp(-0.5 * ((src[np.newaxis, :] - center) / sigma) ** 2) * np.gradient(src)[np.newaxis, :]
+    # A target band is only covered if the source spans its centre
+    outside = (center[:, 0] < src.min()) | (center[:, 0] > src.max())
+    weights[outside] = 0.0
+    return _to_sparse(weights, valid, min_weight)
+
+
+def tabulated_srf_matrix(src_wavelength, srf_wavelength, srf_response, valid=None, min_weight=1e-3):
+    """
+    Weights of tabulated target responses at the source band centres
+
+    Parameters
+    ----------
+    src_wavelength : array-like
+        Source band centres.
+    srf_wavelength : array-like
+        ``(n_samples,)`` wavelengths the responses are tabulated at.
+    srf_response : array-like
+        ``(n_target, n_samples)`` relative spectral responses.
+    valid, min_weight
+        See ``gaussian_srf_matrix``.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+    """
+    src = np.asarray(src_wavelength, dtype=np.float64)
+    valid = np.ones(len(src), dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+    weights = np.array([
+        np.interp(src, srf_wavelength, response, left=0.0, right=0.0) for response in np.asarray(srf_response)
+    ])
+    return _to_sparse(weights * np.gradient(src)[np.newaxis, :], valid, min_weight)
+
+
+class BandTransform:
+    """
+    A sparse band matrix bound to one source cube
+
+    Parameters
+    ----------
+    matrix : scipy.sparse.csr_matrix
+        ``(count, n_source)`` weights.
+    wavelength, fwhm : numpy.ndarray
+        Centres and widths of the output bands.
+    """
+
+    dtype = "float32"
+
+    def __init__(self, matrix, wavelength, fwhm=None):
+        self.matrix = matrix
+        self.wavelength = wavelength
+        self.fwhm = fwhm
+        self.count = matrix.shape[0]
+        # Source bands that feed at least one output band
+        self.used = np.unique(matrix.indices)
+
+    @property
+    def descriptions(self):
+        return [f"{w:.2f} nm" for w in self.wavelength]
+
+    def band_tags(self, band):
+        """Tags of output band ``band`` (0-based)."""
+        tags = {"wavelength": f"{self.wavelength[band]:.4f}"}
+        if self.fwhm is not None:
+            tags["fwhm"] = f"{self.fwhm[band]:.4f}"
+        return tags
+
+    def __call__(self, block, nodata=None):
+        """
+        Resample a ``(n_source, rows, cols)`` block to ``(count, rows, cols)``
+
+        Pixels where a contributing source band is ``nodata`` (or NaN) are
+        ``nodata`` in every output band.
+        """
+        bands, rows, cols = block.shape
+        flat = block.reshape(bands, -1)
+        out = np.asarray(self.matrix @ flat.astype(np.float32, copy=False))
+
+        if nodata is not None:
+            used = flat[self.used]
+            invalid = np.isnan(used).any(axis=0) if np.isnan(float(nodata)) else (used == nodata).any(axis=0)
+            out[:, invalid] = nodata
+        return out.reshape(self.count, rows, cols)
+
+
+class SpectralResampler:
+    """
+    Target band set for ``convert_windowed(band_transform=...)``
+
+    Without target bands, only the bad and water absorption bands of the
+    source are dropped.
+
+    Parameters
+    ----------
+    wavelength, fwhm : array-like, optional
+        Target band centres and FWHM in nanometers, e.g. from
+        ``read_enmap_bands``.
+    srf : (array-like, array-like), optional
+        Tabulated ``(srf_wavelength, srf_response)`` used instead of
+        Gaussians.
+    drop_water : bool
+        Drop bands inside ``water_bands`` from the source and the output.
+    water_bands : tuple
+        Absorption windows in nanometers.
+    min_weight : float
+        Relative weight below which a source band is ignored.
+    """
+
+    def __init__(self, wavelength=None, fwhm=None, srf=None, drop_water=False, water_bands=WATER_BANDS,
+                 min_weight=1e-3):
+        if wavelength is not None and fwhm is None and srf is None:
+            raise ValueError("Target bands need either fwhm or tabulated srf")
+        self.wavelength = None if wavelength is None else np.asarray(wavelength, dtype=np.float64)
+        self.fwhm = None if fwhm is None else np.asarray(fwhm, dtype=np.float64)
+        self.srf = srf
+        self.drop_water = drop_water
+        self.water_bands = water_bands
+        self.min_weight = min_weight
+
+    @classmethod
+    def from_enmap_metadata(cls, metadata_path, **kwargs):
+        """Resample to the bands of an EnMAP scene."""
+        wavelength, fwhm = read_enmap_bands(metadata_path)
+        return cls(wavelength, fwhm, **kwargs)
+
+    def prepare(self, wavelength, fwhm=None, bbl=None):
+        """
+        Bind to a source band set
+
+        Parameters
+        ----------
+        wavelength : array-like
+            Source band centres in nanometers.
+        fwhm : array-like, optional
+            Source band widths, kept as output metadata when only bands are
+            dropped.
+        bbl : array-like, optional
+            ENVI bad band list, 0 for unusable bands.
+
+        Returns
+        -------
+        BandTransform
+        """
+        wavelength = np.asarray(wavelength, dtype=np.float64)
+        valid = np.ones(len(wavelength), dtype=bool)
+        if bbl is not None:
+            valid &= np.asarray(bbl) != 0
+        if self.drop_water:
+            valid &= ~water_band_mask(wavelength, self.water_bands)
+
+        if self.wavelength is None:
+            keep = np.flatnonzero(valid)
+            matrix = sparse.csr_matrix(
+                (np.ones(len(keep), dtype=np.float32), (np.arange(len(keep)), keep)),
+                shape=(len(keep), len(wavelength)),
+            )
+            return BandTransform(matrix, wavelength[keep], None if fwhm is None else np.asarray(fwhm)[keep])
+
+        if self.srf is not None:
+            matrix = tabulated_srf_matrix(wavelength, *self.srf, valid=valid, min_weight=self.min_weight)
+        else:
+            matrix = gaussian_srf_matrix(wavelength, self.wavelength, self.fwhm, valid=valid,
+                                         min_weight=self.min_weight)
+
+        # Keep target bands that got weights and are outside the water windows
+        keep = np.diff(matrix.indptr) > 0
+        if self.drop_water:
+            keep &= ~water_band_mask(self.wavelength, self.water_bands)
+        keep = np.flatnonzero(keep)
+        return BandTransform(matrix[keep], self.wavelength[keep], None if self.fwhm is None else self.fwhm[keep])
@@ -0,0 +1,421 @@
+"""
+Streaming, mergeable per-band statistics.
+
+``convert_windowed`` and ``netcdf_to_cog`` feed every window they write to a
+``BandStats``, so the count, mean, variance, min / max and a fixed-bin
+histogram of each band come for free with the conversion and are saved as a
+``<name>.tif.stats.json`` sidecar. Means and variances are accumulated with
+Welford's method per window and merged with the parallel-variance formula of
+Chan et al., so sidecars of any number of scenes merge into exact
+collection-wide statistics without reading a GeoTIFF again. Nodata and
+non-finite values are ignored. Histograms share fixed bin edges, so they add
+up too; values outside the range are counted as under- / overflow. The range
+follows the stored values, see ``default_range``: reflectance for float data,
+reflectance divided by the scale factor for scaled integers, and the whole
+type range for unscaled integers.
+
+Example
+-------
+>>> stats = BandStats(425, default_range("float32"))
+>>> stats.update(block, nodata=-9999)         # (bands, rows, cols)
+>>> stats.save("scene.tif.stats.json")
+$ python -m aviris.stats /orange/.../NGL2_TranslatedTIFs -o collection_stats.json
+"""
+import argparse
+import csv
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from glob import glob
+
+import numpy as np
+
+SUFFIX = ".stats.json"
+# Reflectance in [-0.1, 1.5) in steps of 0.005
+REFLECTANCE_RANGE = (-0.1, 1.5)
+DEFAULT_BINS = 320
+
+
+def sidecar_path(raster_path):
+    """Statistics sidecar of a raster, ``<raster>.stats.json``."""
+    return raster_path + SUFFIX
+
+
+def default_range(dtype, scale=1.0, offset=0.0):
+    """
+    Histogram range for the stored values of a band
+
+    Parameters
+    ----------
+    dtype : numpy.dtype or str
+        Data type of the values given to ``BandStats.update``.
+    scale, offset : float
+        Stored values times ``scale`` plus ``offset`` are reflectance, e.g.
+        ``scale=1e-4`` for reflectance stored as int16.
+
+    Returns
+    -------
+    (float, float)
+        ``REFLECTANCE_RANGE`` in stored units for float or scaled data, the
+        range of the type for unscaled integers.
+    """
+    dtype = np.dtype(dtype)
+    scale = 1.0 if scale is None else float(scale)
+    offset = 0.0 if offset is None else float(offset)
+    if dtype.kind in "iu" and scale == 1.0 and offset == 0.0:
+        info = np.iinfo(dtype)
+        return float(info.min), float(info.max) + 1.0
+    low, high = ((edge - offset) / scale for edge in REFLECTANCE_RANGE)
+    return min(low, high), max(low, high)
+
+
+class BandStats:
+    """
+    Count, mean, variance, min / max and histogram of every band
+
+    Parameters
+    ----------
+    bands : int
+        Number of bands.
+    value_range : (float, float)
+        Lower and upper edge of the histogram, see ``default_range`` for the
+        one that fits the data.
+    bins : int
+        Number of histogram bins.
+    descriptions : list[str], optional
+        Band descriptions, e.g. ``"452.34 nm"``; merged statistics must agree.
+    """
+
+    def __init__(self, bands, value_range, bins=DEFAULT_BINS, descriptions=None):
+        self.bands = bands
+        self.range = (float(value_range[0]), float(value_range[1]))
+        self.bins = bins
+        self.descriptions = list(descriptions) if descriptions else None
+        self.scenes = []
+        self.count = np.zeros(bands, dtype=np.int64)
+        self.mean = np.zeros(bands)
+        self.m2 = np.zeros(bands)
+        self.min = np.full(bands, np.inf)
+        self.max = np.full(bands, -np.inf)
+        # Underflow in column 0, overflow in the last column
+        self.histogram = np.zeros((bands, bins + 2), dtype=np.int64)
+
+    @property
+    def edges(self):
+        return np.linspace(self.range[0], self.range[1], self.bins + 1)
+
+    @property
+    def std(self):
+        """Population standard deviation, NaN for bands without data."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / self.count)
+
+    def update(self, block, nodata=None):
+        """
+        Add a ``(bands, rows, cols)`` block
+
+        Parameters
+        ----------
+        block : numpy.ndarray
+            Pixels of one window, bands first.
+        nodata : float, optional
+            Fill value to ignore; NaN and infinite values are always ignored.
+        """
+        low, high = self.range
+        scale = self.bins / (high - low)
+        for band, pixels in enumerate(block.reshape(block.shape[0], -1)):
+            valid = np.isfinite(pixels)
+            if nodata is not None and not np.isnan(nodata):
+                valid &= pixels != nodata
+            values = pixels[valid]
+            count = values.size
+            if not count:
+                continue
+
+            # Welford / Chan update with the moments of this window, in float64
+            mean = values.sum(dtype=np.float64) / count
+            deviation = values.astype(np.float64)
+            deviation -= mean
+            total = self.count[band] + count
+            delta = mean - self.mean[band]
+            self.mean[band] += delta * count / total
+            self.m2[band] += np.dot(deviation, deviation) + delta ** 2 * self.count[band] * count / total
+            self.count[band] = total
+            self.min[band] = min(self.min[band], values.min())
+            self.max[band] = max(self.max[band], values.max())
+
+            # Bin -1 / ``bins`` after clipping are the under- / overflow
+            index = (values.astype(np.float64) - low) * scale
+            np.clip(index, -1, self.bins, out=index)
+            index += 1
+            self.histogram[band] += np.bincount(index.astype(np.intp), minlength=self.bins + 2)
+
+    def merge(self, other):
+        """Add the statistics of another scene (or collection) in place."""
+        if other.bands != self.bands or other.bins != self.bins or other.range != self.range:
+            raise ValueError(f"Cannot merge statistics of {other.bands} bands / {other.bins} bins over {other.range} "
+                             f"into {self.bands} bands / {self.bins} bins over {self.range}")
+        if self.descriptions and other.descriptions and self.descriptions != other.descriptions:
+            raise ValueError("Cannot merge statistics of different bands")
+        self.descriptions = self.descriptions or other.descriptions
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        share = other.count / np.maximum(total, 1)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * share
+        self.count = total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.histogram += other.histogram
+        self.scenes += other.scenes
+        return self
+
+    def percentile(self, q):
+        """
+        Approximate percentiles of every band from the histogram
+
+        Parameters
+        ----------
+        q : float or sequence of float
+            Percentiles in [0, 100].
+
+        Returns
+        -------
+        numpy.ndarray
+            ``(bands,)`` or ``(len(q), bands)``; values in the under- or
+            overflow bin are reported as the range edge.
+        """
+        q = np.asarray(q, dtype=float)
+        cumulative = np.cumsum(self.histogram, axis=1)
+        total = cumulative[:, -1:]
+        edges = np.concatenate([[self.range[0]], self.edges, [self.range[1]]])
+        result = np.full((q.size, self.bands), np.nan)
+        for i, value in enumerate(q.ravel()):
+            target = value / 100 * total[:, 0]
+            for band in np.flatnonzero(total[:, 0]):
+                b = min(int(np.searchsorted(cumulative[band], target[band])), self.bins + 1)
+                below = cumulative[band, b - 1] if b > 0 else 0
+                inside = self.histogram[band, b]
+                fraction = (target[band] - below) / inside if inside else 0.0
+                result[i, band] = edges[b] + fraction * (edges[b + 1] - edges[b])
+        return result[0] if q.ndim == 0 else result
+
+    def to_dict(self):
+        def floats(values):
+            # JSON has no infinity or NaN
+            return [float(v) if np.isfinite(v) else None for v in values]
+
+        return {
+            "scenes": self.scenes,
+            "bands": self.bands,
+            "descriptions": self.descriptions,
+            "range": list(self.range),
+            "bins": self.bins,
+            "count": self.count.tolist(),
+            "mean": floats(self.mean),
+            "m2": floats(self.m2),
+            "std": floats(self.std),
+            "min": floats(self.min),
+            "max": floats(self.max),
+            "histogram": self.histogram.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data["bands"], data["range"], data["bins"], data.get("descriptions"))
+        stats.scenes = list(data.get("scenes", []))
+        stats.count = np.array(data["count"], dtype=np.int64)
+        stats.mean = np.array([v if v is not None else 0.0 for v in data["mean"]])
+        stats.m2 = np.array([v if v is not None else 0.0 for v in data["m2"]])
+        stats.min = np.array([v if v is not None else np.inf for v in data["min"]])
+        stats.max = np.array([v if v is not None else -np.inf for v in data["max"]])
+        stats.histogram = np.array(data["histogram"], dtype=np.int64)
+        return stats
+
+    def save(self, path):
+        """Write as JSON; the file is replaced only once complete."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def make_stats(stats, bands, dtype, descriptions=None, scale=1.0, offset=0.0):
+    """
+    The ``BandStats`` a conversion asked for with its ``stats`` argument
+
+    ``True`` uses the histogram range that fits ``dtype``, ``scale`` and
+    ``offset`` (see ``default_range``), a dict holds ``BandStats`` keyword
+    arguments (``value_range``, ``bins``), anything false disables statistics.
+    """
+    if not stats:
+        return None
+    options = dict(stats) if isinstance(stats, dict) else {}
+    options.setdefault("value_range", default_range(dtype, scale, offset))
+    return BandStats(bands, descriptions=descriptions, **options)
+
+
+def raster_stats(path, value_range=None, bins=DEFAULT_BINS, save=True):
+    """
+    Statistics of an existing raster, read block by block
+
+    For GeoTIFFs converted before statistics were collected; new conversions
+    write their sidecar themselves. The histogram range is derived from the
+    raster's data type and scale unless given.
+    """
+    import rasterio
+
+    with rasterio.open(path) as src:
+        descriptions = list(src.descriptions) if any(src.descriptions) else None
+        if value_range is None:
+            value_range = default_range(src.dtypes[0], src.scales[0], src.offsets[0])
+        stats = BandStats(src.count, value_range, bins, descriptions)
+        for _, window in src.block_windows(1):
+            stats.update(src.read(window=window), src.nodata)
+    stats.scenes = [os.path.basename(path)]
+    if save:
+        stats.save(sidecar_path(path))
+    return stats
+
+
+def reduce_sidecars(paths):
+    """
+    Merge sidecars into collection-wide statistics
+
+    Sidecars that cannot be read, or that do not merge with the first one
+    (other bands, bins or range), are reported and left out.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Sidecar files, see ``sidecar_path``.
+
+    Returns
+    -------
+    BandStats
+    """
+    if not paths:
+        raise ValueError("No statistics sidecars to merge")
+    total = None
+    skipped = 0
+    for path in sorted(paths):
+        try:
+            stats = BandStats.load(path)
+            total = stats if total is None else total.merge(stats)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            skipped += 1
+            print(f"⚠️ Skipping {os.path.basename(path)}: {e}")
+    if total is None:
+        raise ValueError("None of the statistics sidecars could be read")
+    if skipped:
+        print(f"⚠️ {skipped} of {len(paths)} sidecars left out of the merged statistics")
+    return total
+
+
+def write_band_table(stats, csv_path, percentiles=(2, 98)):
+    """Per-band count, mean, std, min, max and percentiles as CSV."""
+    values = stats.percentile(percentiles)
+    std = stats.std
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["band", "description", "count", "mean", "std", "min", "max",
+                         *(f"p{p:g}" for p in percentiles)])
+        for band in range(stats.bands):
+            description = stats.descriptions[band] if stats.descriptions else ""
+            writer.writerow([band + 1, description, int(stats.count[band]), stats.mean[band], std[band],
+                             stats.min[band], stats.max[band], *values[:, band]])
+    return csv_path
+
+
+@contextmanager
+def _output_lock(output):
+    """Exclusive lock on the merged output, held across processes and nodes."""
+    with open(output + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def reduce_directory(directory, output=None, backfill=False):
+    """
+    Merge the sidecars of all GeoTIFFs in a directory
+
+    Runs under a lock on ``output``, so tasks of a job array finishing
+    together merge one after the other, and a merge that is already newer
+    than every sidecar is not repeated.
+
+    Parameters
+    ----------
+    directory : str
+        Directory with ``*.tif`` and their sidecars.
+    output : str, optional
+        Merged JSON, ``<directory>/collection_stats.json`` by default; a CSV
+        with one row per band is written next to it.
+    backfill : bool
+        Compute the sidecars of GeoTIFFs that have none (one extra read of
+        those files only); otherwise they are left out.
+
+    Returns
+    -------
+    BandStats or None
+        None when no GeoTIFF has statistics.
+    """
+    output = output or os.path.join(directory, "collection_stats.json")
+    with _output_lock(output):
+        tifs = sorted(glob(os.path.join(directory, "*.tif")))
+        missing = [tif for tif in tifs if not os.path.exists(sidecar_path(tif))]
+        if missing and backfill:
+            for i, tif in enumerate(missing, start=1):
+                try:
+                    raster_stats(tif)
+                except Exception as e:
+                    print(f"[{i}/{len(missing)}] ❌ {os.path.basename(tif)}: {e}")
+                    continue
+                print(f"[{i}/{len(missing)}] 📊 {os.path.basename(tif)}")
+        elif missing:
+            print(f"⚠️ {len(missing)} GeoTIFFs have no statistics sidecar and are left out (use --backfill)")
+
+        paths = [sidecar_path(tif) for tif in tifs if os.path.exists(sidecar_path(tif))]
+        if not paths:
+            print(f"No statistics sidecars in {directory}")
+            return None
+        if os.path.exists(output) and os.path.getmtime(output) >= max(os.path.getmtime(p) for p in paths):
+            print(f"📊 {output} is up to date")
+            return BandStats.load(output)
+        stats = reduce_sidecars(paths)
+        stats.save(output)
+        write_band_table(stats, os.path.splitext(output)[0] + ".csv")
+    print(f"📊 Statistics of {len(stats.scenes)} scenes, {int(stats.count.max())} valid pixels per band -> {output}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge per-scene band statistics into collection-wide statistics")
+    parser.add_argument("inputs", nargs="+", help="directory of GeoTIFFs, or sidecar files")
+    parser.add_argument("-o", "--output", help="merged JSON (default: <directory>/collection_stats.json)")
+    parser.add_argument("--backfill", action="store_true",
+                        help="compute missing sidecars from the GeoTIFFs first")
+    args = parser.parse_args()
+
+    if len(args.inputs) == 1 and os.path.isdir(args.inputs[0]):
+        reduce_directory(args.inputs[0], args.output, args.backfill)
+        return
+    if not args.output:
+        parser.error("--output is required when merging sidecar files")
+    stats = reduce_sidecars(args.inputs)
+    stats.save(args.output)
+    write_band_table(stats, os.path.splitext(args.output)[0] + ".csv")
+    print(f"📊 Statistics of {len(stats.scenes)} scenes -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
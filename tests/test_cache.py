@@ -0,0 +1,77 @@
+import hashlib
+import time
+
+import pytest
+
+from aviris.cache import GranuleCache
+from aviris.cmr import FileInfo
+from aviris.download import IntegrityError
+
+
+def _writer(data):
+    def download(url, path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return download
+
+
+def _info(data):
+    return FileInfo(len(data), hashlib.md5(data).hexdigest(), "MD5")
+
+
+def test_download_callable_is_verified(tmp_path):
+    cache = GranuleCache(str(tmp_path))
+    data = b"x" * 100
+    path = cache.get("https://host/s0.hdr", expected=_info(data), download=_writer(data))
+    assert open(path, "rb").read() == data
+
+    with pytest.raises(IntegrityError):
+        cache.get("https://host/s1.hdr", expected=_info(data), download=_writer(b"y" * 100))
+    assert cache.files() == [path]
+    assert cache.usage() == (100, 1)
+
+
+def test_unknown_size_is_evicted_for(tmp_path):
+    cache = GranuleCache(str(tmp_path), quota=250)
+    first = cache.get("https://host/s0.bin", download=_writer(b"a" * 100))
+    second = cache.get("https://host/s1.bin", download=_writer(b"b" * 100))
+    third = cache.get("https://host/s2.bin", download=_writer(b"c" * 100))
+    assert cache.files() == [third, second]
+    assert cache.usage() == (200, 2)
+    assert first not in cache.files()
+
+
+def test_remote_pins_expire(tmp_path):
+    cache = GranuleCache(str(tmp_path), quota=150, lease=60)
+    path = cache.get("https://host/s0.bin", download=_writer(b"a" * 100), pin=True)
+    with cache._transaction() as conn:
+        conn.execute("UPDATE pins SET owner = 'other-node:1', pinned = ?", (time.time() - 30,))
+    # Pinned by a live process on another host: kept
+    assert not cache.evict(100)
+    with cache._transaction() as conn:
+        conn.execute("UPDATE pins SET pinned = ?", (time.time() - 61,))
+        conn.execute(
+            "INSERT INTO entries VALUES ('s1', 's1.bin', NULL, NULL, 10, 'fetching', 'other-node:1', ?, ?)",
+            (time.time() - 61, time.time() - 61),
+        )
+    assert cache.evict(100)
+    assert path not in cache.files()
+    assert cache.usage() == (0, 0)
+
+
+def test_part_files_count_against_quota(tmp_path):
+    cache = GranuleCache(str(tmp_path), quota=150, wait=0)
+    other = GranuleCache(str(tmp_path), quota=150, wait=0)
+    checked = []
+
+    def download(url, path):
+        with open(path, "wb") as f:
+            f.write(b"a" * 120)
+        # Another process sees the bytes of the unknown-size fetch in flight
+        assert other.usage() == (120, 1)
+        assert not other.evict(100)
+        checked.append(path)
+
+    path = cache.get("https://host/s0.bin", download=download)
+    assert checked == [path + ".part"]
+    assert cache.usage() == (120, 1)
@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from aviris.chips import ChipDataset, chip_windows, export_pair, write_index
+
+
+def test_chip_windows():
+    mask = np.ones((8, 12), dtype=np.uint8)
+    mask[:4, :4] = 0        # chip (0, 0) is empty
+    mask[4:8, 8:10] = 0     # chip (4, 8) is half valid
+    mask[0, 4] = 0          # chip (0, 4) misses one pixel
+
+    assert chip_windows(mask, size=4) == [(0, 4, 15 / 16), (0, 8, 1.0), (4, 0, 1.0), (4, 4, 1.0)]
+    assert [w[:2] for w in chip_windows(mask, size=4, min_valid=0.5)] == [(0, 4), (0, 8), (4, 0), (4, 4), (4, 8)]
+    assert [w[:2] for w in chip_windows(mask, size=4, min_valid=1.0)] == [(0, 8), (4, 0), (4, 4)]
+    # Overlapping chips with a stride of two
+    assert [w[:2] for w in chip_windows(mask, size=4, stride=2, min_valid=1.0)] == [
+        (0, 6), (0, 8), (2, 4), (4, 0), (4, 2), (4, 4)]
+    assert chip_windows(mask, size=16) == []
+
+
+def _write(path, array, dtype):
+    array = array if array.ndim == 3 else array[np.newaxis]
+    with rasterio.open(path, "w", driver="GTiff", width=array.shape[2], height=array.shape[1],
+                       count=array.shape[0], dtype=dtype, crs="EPSG:32611",
+                       transform=from_origin(500000, 4000000, 30, 30)) as dst:
+        dst.write(array.astype(dtype))
+    return path
+
+
+def test_export_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    aviris = rng.random((4, 20, 24)).astype(np.float32)
+    enmap = rng.integers(0, 10000, (3, 20, 24)).astype(np.int16)
+    mask = np.ones((20, 24), dtype=np.uint8)
+    mask[10:, :8] = 0
+    paths = {
+        "aviris": _write(str(tmp_path / "pair_aviris.tif"), aviris, "float32"),
+        "enmap": _write(str(tmp_path / "pair_enmap.tif"), enmap, "int16"),
+        "mask": _write(str(tmp_path / "pair_mask.tif"), mask, "uint8"),
+    }
+    out_dir = str(tmp_path / "chips")
+    rows = export_pair(paths, out_dir, "pair", size=8, stride=4, chips_per_shard=3,
+                       metadata={"enmap_id": "ENMAP01", "cloud_cover": 2.5})
+    write_index(rows, os.path.join(out_dir, "index.csv"))
+
+    windows = chip_windows(mask, size=8, stride=4)
+    assert len(rows) == len(windows) == 14
+    assert sorted(f for f in os.listdir(out_dir) if f.endswith(".npy"))[:3] == [
+        "pair_000_aviris.npy", "pair_000_enmap.npy", "pair_000_mask.npy"]
+    shard = np.load(os.path.join(out_dir, "pair_004_enmap.npy"))
+    assert shard.shape == (2, 3, 8, 8) and shard.dtype == np.int16
+
+    chips = pickle.loads(pickle.dumps(ChipDataset(out_dir)))
+    assert len(chips) == len(windows)
+    for i, (row, col, valid) in enumerate(windows):
+        chip_aviris, chip_enmap, chip_mask = chips[i]
+        np.testing.assert_array_equal(chip_aviris, aviris[:, row:row + 8, col:col + 8])
+        np.testing.assert_array_equal(chip_enmap, enmap[:, row:row + 8, col:col + 8])
+        np.testing.assert_array_equal(chip_mask, mask[row:row + 8, col:col + 8])
+        assert chips.index[i]["enmap_id"] == "ENMAP01"
+        assert float(chips.index[i]["valid_fraction"]) == round(valid, 4)
@@ -0,0 +1,62 @@
+import sys
+from unittest import mock
+
+import pytest
+import requests
+
+from aviris import auth, cli
+
+
+def test_unknown_collection(capsys):
+    with mock.patch("aviris.cli.cmd_download") as cmd:
+        with pytest.raises(SystemExit) as exc:
+            cli.main(["download", "ngl2", "nope"])
+    assert exc.value.code == 2
+    assert "nope" in capsys.readouterr().err
+    cmd.assert_not_called()
+
+
+def test_cache_quota_in_bytes():
+    with mock.patch("aviris.cli.cmd_download") as cmd:
+        cli.main(["download", "ngl2", "--cache-quota", "1.5"])
+    assert cmd.call_args.args[0].cache_quota == int(1.5 * 1024 ** 3)
+    with mock.patch("aviris.cli.cmd_convert") as cmd:
+        cli.main(["convert", "av3l2a"])
+    assert cmd.call_args.args[0].cache_quota is None
+
+
+def test_list_registry_without_catalog(capsys, tmp_path):
+    with mock.patch("aviris.catalog.Catalog") as catalog:
+        cli.main(["--catalog", str(tmp_path / "catalog.sqlite"), "list"])
+    catalog.assert_not_called()
+    assert not (tmp_path / "catalog.sqlite").exists()
+    out = capsys.readouterr().out
+    assert "ngl2" in out and "av3l2a" in out
+
+
+@pytest.fixture
+def earthaccess(monkeypatch):
+    module = mock.Mock()
+    module.login.return_value = True
+    module.get_requests_https_session.side_effect = requests.Session
+    monkeypatch.setitem(sys.modules, "earthaccess", module)
+    monkeypatch.setattr(auth, "_session", None)
+    monkeypatch.setattr(auth, "setup_netrc", mock.Mock())
+    return module
+
+
+def test_login_once(earthaccess):
+    session = auth.earthdata_session()
+    assert auth.earthdata_session() is session
+    assert auth.earthdata_session("interactive") is session
+    earthaccess.login.assert_called_once_with()
+    # The .netrc prompt is only for the fallback
+    auth.setup_netrc.assert_not_called()
+
+
+def test_netrc_fallback(earthaccess):
+    earthaccess.login.return_value = None
+    session = auth.earthdata_session()
+    assert isinstance(session, requests.Session)
+    auth.setup_netrc.assert_called_once_with()
+    earthaccess.get_requests_https_session.assert_not_called()
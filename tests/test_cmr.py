@@ -0,0 +1,57 @@
+from unittest import mock
+
+from aviris.catalog import Catalog
+from aviris.cmr import search_granules
+
+
+def _entry(i):
+    return {"id": f"G{i}", "title": f"ang{i:04d}_rfl", "time_start": f"2023-01-{i % 28 + 1:02d}T00:00:00Z",
+            "polygons": [["30 10 30 11 31 11 31 10 30 10"]],
+            "links": [{"rel": "data", "href": f"https://host/ang{i:04d}_rfl.bin", "title": "dropped"}],
+            "producer_granule_id": "dropped"}
+
+
+def _session(total):
+    """Mocked CMR: ``total`` granules in pages chained with CMR-Search-After tokens."""
+    def get(url, params=None, headers=None, timeout=None):
+        page_size = params["page_size"]
+        page = int(headers.get("CMR-Search-After", "0"))
+        entries = [_entry(i) for i in range(page * page_size, min((page + 1) * page_size, total))]
+        response = mock.Mock(content=b"", raw=None, headers={"CMR-Search-After": str(page + 1)})
+        response.json.return_value = {"feed": {"entry": entries}}
+        return response
+
+    session = mock.Mock()
+    session.get.side_effect = get
+    return session
+
+
+def test_search_after_paging():
+    session = _session(total=5)
+    granules = list(search_granules("C1-X", session=session, page_size=2, temporal="2023-01-01,"))
+    assert [g["id"] for g in granules] == ["G0", "G1", "G2", "G3", "G4"]
+    # Only the fields the scripts use are kept
+    assert set(granules[0]) == {"id", "title", "time_start", "polygons", "links"}
+    assert granules[0]["links"] == [{"rel": "data", "href": "https://host/ang0000_rfl.bin"}]
+
+    calls = session.get.call_args_list
+    assert [call.kwargs["headers"].get("CMR-Search-After") for call in calls] == [None, "1", "2"]
+    assert all(call.kwargs["params"]["collection_concept_id"] == "C1-X" for call in calls)
+    assert calls[0].kwargs["params"]["temporal"] == "2023-01-01,"
+
+
+def test_full_last_page_stops_on_empty_page():
+    session = _session(total=4)
+    assert len(list(search_granules("C1-X", session=session, page_size=2))) == 4
+    assert session.get.call_count == 3
+
+
+def test_catalog_sync_and_incremental_update():
+    session = _session(total=2003)
+    with Catalog(":memory:") as catalog:
+        assert catalog.sync("C1-X", session=session) == 2003
+        assert len(catalog.granules("C1-X")) == 2003
+        session.get.reset_mock()
+        catalog.sync("C1-X", session=session)
+        # The second sync only asks for granules updated since the first one
+        assert "updated_since" in session.get.call_args_list[0].kwargs["params"]
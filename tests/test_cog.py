@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pytest
+import rasterio
+
+from aviris.cog import netcdf_to_cog
+from aviris.stats import sidecar_path
+
+netCDF4 = pytest.importorskip("netCDF4")
+
+FILL = -9999
+SCALE = 1e-4
+
+
+def _scaled_netcdf(path, bands=3, size=384):
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 10000, (bands, size, size)).astype(np.int16)
+    # The western two thirds are fill, i.e. every tile of the first two tile columns
+    values[:, :, :256] = FILL
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("wavelength", bands)
+        ds.createDimension("northing", size)
+        ds.createDimension("easting", size)
+        easting = ds.createVariable("easting", "f8", ("easting",))
+        northing = ds.createVariable("northing", "f8", ("northing",))
+        easting[:] = 500000 + 5 * np.arange(size) + 2.5
+        northing[:] = 4000000 - 5 * np.arange(size) - 2.5
+        wavelength = ds.createVariable("wavelength", "f4", ("wavelength",))
+        wavelength[:] = [450, 550, 650]
+        reflectance = ds.createVariable("reflectance", "i2", ("wavelength", "northing", "easting"),
+                                        fill_value=FILL)
+        reflectance.scale_factor = SCALE
+        reflectance.add_offset = 0.0
+        reflectance.set_auto_maskandscale(False)
+        reflectance[:] = values
+    return values
+
+
+def test_scaled_int16(tmp_path):
+    values = _scaled_netcdf(str(tmp_path / "scene_RFL_ORT.nc"))
+    cog_path = str(tmp_path / "scene.tif")
+    netcdf_to_cog(str(tmp_path / "scene_RFL_ORT.nc"), cog_path, blocksize=128)
+
+    with rasterio.open(cog_path) as src:
+        assert src.dtypes[0] == "int16"
+        assert src.nodata == FILL
+        assert src.scales == (SCALE,) * 3
+        np.testing.assert_array_equal(src.read(), values)
+        # The all-fill tiles are not written
+        offsets = [src.get_tag_item(f"BLOCK_OFFSET_{i}_0", "TIFF", bidx=1) for i in range(3)]
+        assert offsets[0] is None and offsets[1] is None
+        assert offsets[2] is not None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scene.tif", "scene.tif.stats.json", "scene_RFL_ORT.nc"]
+
+    with open(sidecar_path(cog_path)) as f:
+        stats = json.load(f)
+    assert stats["count"] == [384 * 128] * 3
+    assert stats["range"] == pytest.approx([-1000, 15000])
+    np.testing.assert_allclose(stats["mean"], values[:, :, 256:].reshape(3, -1).mean(axis=1))
+
+
+def test_failed_conversion_cleans_up(tmp_path):
+    _scaled_netcdf(str(tmp_path / "scene_RFL_ORT.nc"))
+    with pytest.raises(KeyError):
+        netcdf_to_cog(str(tmp_path / "scene_RFL_ORT.nc"), str(tmp_path / "scene.tif"), variable="radiance")
+    assert [p.name for p in tmp_path.iterdir()] == ["scene_RFL_ORT.nc"]
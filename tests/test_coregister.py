@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window
+
+from aviris.coregister import _snap_window, _source_extent, _strip_rows, coregister_pair, overlap_window
+
+NODATA = -9999.0
+# AVIRIS flight lines are stored rotated against north (ENVI map info rotation)
+AVIRIS_TRANSFORM = Affine.translation(500000, 4000000) * Affine.rotation(-30) * Affine.scale(5, -5)
+ENMAP_TRANSFORM = Affine(30, 0, 499900, 0, -30, 4000100)
+
+
+def _write(path, array, transform, nodata=None):
+    with rasterio.open(path, "w", driver="GTiff", width=array.shape[2], height=array.shape[1],
+                       count=array.shape[0], dtype=array.dtype, crs="EPSG:32611", transform=transform,
+                       nodata=nodata) as dst:
+        dst.write(array)
+    return path
+
+
+@pytest.fixture
+def pair(tmp_path):
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[0:180, 0:120]
+    aviris = np.stack([np.sin(rows / 17 + band) + cols / 50 + rng.normal(0, 0.05, rows.shape)
+                       for band in range(4)]).astype(np.float32)
+    aviris[:, 60:90, 40:70] = NODATA
+    enmap = rng.integers(0, 10000, (3, 40, 40)).astype(np.int16)
+    return (_write(str(tmp_path / "ang_rfl.tif"), aviris, AVIRIS_TRANSFORM, NODATA),
+            _write(str(tmp_path / "ENMAP01_SPECTRAL_IMAGE.TIF"), enmap, ENMAP_TRANSFORM))
+
+
+def test_strip_rows_fit(pair):
+    with rasterio.open(pair[0]) as aviris, rasterio.open(pair[1]) as enmap:
+        window = overlap_window(aviris, enmap)
+        assert window.col_off > 0 or window.row_off > 0
+        max_memory = 256 * 1024
+        rows = _strip_rows(aviris, enmap, window, 8, max_memory)
+        assert 1 <= rows < window.height
+
+        def strip_bytes(n):
+            src_rows, src_cols = _source_extent(aviris, enmap, Window(window.col_off, window.row_off, window.width, n))
+            return (src_rows * src_cols * aviris.count + n * window.width * 8) * 4
+
+        # The largest strip that fits
+        assert strip_bytes(rows) <= max_memory < strip_bytes(rows + 1)
+
+        # The estimate covers what _warp_strip actually reads of the rotated source
+        strip = Window(window.col_off, window.row_off + rows, window.width, rows)
+        read = _snap_window(transform_bounds(enmap.crs, aviris.crs, *enmap.window_bounds(strip), densify_pts=21),
+                            aviris, margin=1)
+        src_rows, src_cols = _source_extent(aviris, enmap, strip)
+        assert read.height <= src_rows and read.width <= src_cols
+        assert read.height < aviris.height
+
+
+def test_strips_match_whole_reproject(pair, tmp_path):
+    result = coregister_pair(*pair, str(tmp_path / "out"), max_memory=256 * 1024, preset=None)
+
+    with rasterio.open(pair[0]) as aviris, rasterio.open(pair[1]) as enmap:
+        window = overlap_window(aviris, enmap)
+        assert _strip_rows(aviris, enmap, window, 2 * aviris.count + enmap.count + 1, 256 * 1024) < window.height
+        expected = np.full((aviris.count, window.height, window.width), NODATA, dtype=np.float32)
+        reproject(aviris.read(), expected, src_transform=aviris.transform, src_crs=aviris.crs,
+                  src_nodata=NODATA, dst_transform=enmap.window_transform(window), dst_crs=enmap.crs,
+                  dst_nodata=NODATA, resampling=Resampling.average)
+        enmap_expected = enmap.read(window=window)
+
+    # GDAL decides pixels that the scene covers only a sliver of differently
+    # depending on the output extent, so those are left out of the comparison
+    rows, cols = np.mgrid[0:window.height + 1, 0:window.width + 1]
+    corner_cols, corner_rows = ~AVIRIS_TRANSFORM * (ENMAP_TRANSFORM * (cols + window.col_off, rows + window.row_off))
+    inside = (corner_cols >= 0) & (corner_cols <= 120) & (corner_rows >= 0) & (corner_rows <= 180)
+    inside = inside[:-1, :-1] & inside[1:, :-1] & inside[:-1, 1:] & inside[1:, 1:]
+    assert inside.sum() > 100
+
+    valid = ~(expected == NODATA).any(axis=0)
+    with rasterio.open(result["aviris"]) as src:
+        assert src.transform == ENMAP_TRANSFORM * Affine.translation(window.col_off, window.row_off)
+        np.testing.assert_allclose(src.read()[:, inside], expected[:, inside], rtol=1e-5, atol=1e-5)
+    with rasterio.open(result["mask"]) as src:
+        mask = src.read(1)
+        np.testing.assert_array_equal(mask[inside], valid[inside])
+    with rasterio.open(result["enmap"]) as src:
+        np.testing.assert_array_equal(src.read(), enmap_expected)
+    assert result["valid"] == mask.sum() > 0
+    # The nodata block of the source is masked
+    assert not valid[inside].all()
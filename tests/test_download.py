@@ -0,0 +1,110 @@
+import hashlib
+import os
+import re
+from unittest import mock
+
+import pytest
+
+from aviris.cmr import FileInfo
+from aviris.download import IntegrityError, ThroughputReport, download_file, verify_file
+
+DATA = bytes(range(256)) * 40
+URL = "https://host/scene_img.bin"
+
+
+def _info(data=DATA, checksum=None):
+    return FileInfo(len(data), checksum or hashlib.md5(data).hexdigest(), "MD5")
+
+
+def _session(data=DATA, ranges=True, status=None):
+    """Mocked streaming session; ``ranges=False`` ignores Range like some servers do."""
+    requests = []
+
+    def get(url, headers=None, stream=None, timeout=None):
+        requests.append(dict(headers))
+        match = re.match(r"bytes=(\d+)-", headers.get("Range", ""))
+        if status is not None:
+            code, body, extra = status, b"", {}
+        elif match and ranges:
+            start = int(match.group(1))
+            code, body = 206, data[start:]
+            extra = {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"}
+        else:
+            code, body, extra = 200, data, {"Content-Length": str(len(data))}
+        response = mock.MagicMock(status_code=code, headers=extra, raw=None)
+        response.__enter__.return_value = response
+        response.iter_content.side_effect = lambda chunk_size: (
+            body[i:i + 1000] for i in range(0, len(body), 1000))
+        return response
+
+    session = mock.Mock()
+    session.get.side_effect = get
+    session.requests = requests
+    return session
+
+
+def _part(path, data):
+    with open(path + ".part", "wb") as f:
+        f.write(data)
+
+
+def test_resume_from_part(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    _part(path, DATA[:3000])
+    session, report = _session(), ThroughputReport()
+    download_file(session, URL, path, report, expected=_info())
+
+    assert session.requests[0]["Range"] == "bytes=3000-"
+    assert report.resumed == 1 and report.bytes == len(DATA) - 3000
+    with open(path, "rb") as f:
+        assert hashlib.md5(f.read()).hexdigest() == _info().checksum
+    assert not os.path.exists(path + ".part")
+
+
+def test_range_ignored_restarts(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    _part(path, DATA[:3000])
+    report = ThroughputReport()
+    download_file(_session(ranges=False), URL, path, report, expected=_info())
+
+    assert report.resumed == 0 and report.bytes == len(DATA)
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_416_on_complete_part(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    _part(path, DATA)
+    # Without a known size the .part file is sent a Range request past its end
+    info = FileInfo(None, _info().checksum, "MD5")
+    session = _session(status=416)
+    download_file(session, URL, path, ThroughputReport(), expected=info)
+
+    assert session.requests[0]["Range"] == f"bytes={len(DATA)}-"
+    with open(path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_checksum_mismatch(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    with pytest.raises(IntegrityError, match="checksum"):
+        download_file(_session(), URL, path, ThroughputReport(), expected=_info(checksum="0" * 32))
+    assert os.listdir(tmp_path) == []
+
+
+def test_short_download_kept(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    with pytest.raises(IntegrityError, match="size"):
+        download_file(_session(DATA[:1000]), URL, path, ThroughputReport(), expected=_info())
+    assert os.listdir(tmp_path) == ["scene_img.bin.part"]
+
+
+def test_verify_file(tmp_path):
+    path = str(tmp_path / "scene_img.bin")
+    with open(path, "wb") as f:
+        f.write(DATA)
+    verify_file(path, _info())
+    verify_file(path, None)
+    with pytest.raises(IntegrityError):
+        verify_file(path, _info(checksum="0" * 32))
+    assert not os.path.exists(path)
@@ -0,0 +1,62 @@
+import sys
+from unittest import mock
+
+from shapely.geometry import box, mapping
+
+from aviris.enmap import match_enmap
+
+
+class Footprints:
+    def __init__(self, geometries):
+        self.geometries = geometries
+
+    def geometry(self, granule_id):
+        return self.geometries.get(granule_id)
+
+
+def _item(id, bounds, start, version="01.05.00", cloud_cover=10):
+    return {
+        "id": id,
+        "geometry": mapping(box(*bounds)),
+        "properties": {"start_datetime": start, "version": version, "eo:cloud_cover": cloud_cover},
+        "assets": {"image": {"href": f"https://enmap/{id}.tif"}},
+    }
+
+
+ITEMS = [
+    _item("E1", (10.0, 30.0, 10.5, 30.5), "2023-05-20T10:00:00Z"),
+    # Reprocessed version of E1: only the newer one is kept
+    _item("E1b", (10.0, 30.0, 10.5, 30.5), "2023-05-20T10:00:00Z", version="01.05.02"),
+    # Too far apart in time, or too cloudy
+    _item("E2", (10.0, 30.0, 10.5, 30.5), "2023-09-01T10:00:00Z"),
+    _item("E3", (10.0, 30.0, 10.5, 30.5), "2023-05-10T10:00:00Z", cloud_cover=80),
+    # Elsewhere
+    _item("E4", (50.0, 30.0, 50.5, 30.5), "2023-05-20T10:00:00Z"),
+]
+
+
+def _client():
+    client = mock.Mock(self_href="https://stac")
+    client.search.return_value.items_as_dicts.side_effect = lambda: iter(ITEMS)
+    return client
+
+
+def test_one_search_per_cell_and_year(tmp_path):
+    granules = [
+        {"id": "A1", "title": "ang1", "time_start": "2023-05-01T00:00:00Z"},
+        {"id": "A2", "title": "ang2", "time_start": "2023-06-01T00:00:00Z"},
+        {"id": "A3", "title": "ang3", "time_start": "2022-06-01T00:00:00Z"},
+    ]
+    footprints = Footprints({g["id"]: box(10.1, 30.1, 10.2, 30.2) for g in granules})
+    client = _client()
+    pystac_client = mock.Mock()
+    pystac_client.Client.open.return_value = client
+    with mock.patch.dict(sys.modules, {"pystac_client": pystac_client}):
+        pairs = match_enmap(granules, footprints, cloud_cover_max=30, cache_dir=str(tmp_path))
+        # Two years in one cell: two searches
+        assert client.search.call_count == 2
+        assert sorted(zip(pairs["granule_id"], pairs["enmap_id"])) == [("A1", "E1b"), ("A2", "E1b")]
+
+        # The responses are cached on disk
+        match_enmap(granules, footprints, cloud_cover_max=30, cache_dir=str(tmp_path))
+        assert client.search.call_count == 2
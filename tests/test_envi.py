@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.windows import Window
+
+from aviris.envi import EnviCube, map_transform, numpy_dtype, parse_header, spectral_info
+
+HEADER = """ENVI
+description = {{
+  AVIRIS-NG reflectance, test scene}}
+samples = {samples}
+lines = {lines}
+bands = {bands}
+header offset = {offset}
+data type = {data_type}
+interleave = {interleave}
+byte order = {byte_order}
+data ignore value = -9999
+map info = {{ UTM , 2.000 , 3.000 , 500000.000 , 4000000.000 , 5.0000000000e+00 , 5.0000000000e+00 , 11 , North , WGS-84 , units=Meters , rotation=30.00000000 }}
+wavelength units = Micrometers
+wavelength = {{ 0.4, 0.5,
+ 0.6 }}
+fwhm = {{0.005, 0.005, 0.006}}
+band names = {{ b1, b2, b3 }}
+"""
+
+
+def _write(tmp_path, cube, interleave, byte_order=0, offset=0, data_type=4):
+    bands, lines, samples = cube.shape
+    layout = {"bsq": cube, "bil": cube.transpose(1, 0, 2), "bip": cube.transpose(1, 2, 0)}[interleave]
+    path = tmp_path / f"scene_{interleave}_img"
+    path.with_suffix(".hdr").write_text(HEADER.format(
+        samples=samples, lines=lines, bands=bands, offset=offset, data_type=data_type,
+        interleave=interleave, byte_order=byte_order))
+    dtype = cube.dtype.newbyteorder(">" if byte_order else "<")
+    path.write_bytes(b"\0" * offset + np.ascontiguousarray(layout, dtype=dtype).tobytes())
+    return str(path)
+
+
+def test_parse_header():
+    header = parse_header(HEADER.format(samples=7, lines=5, bands=3, offset=0, data_type=12,
+                                        interleave="bil", byte_order=1))
+    assert header["samples"] == 7 and header["interleave"] == "bil"
+    assert header["description"] == ["AVIRIS-NG reflectance", "test scene"]
+    assert header["band names"] == ["b1", "b2", "b3"]
+    assert header["data ignore value"] == -9999.0
+    np.testing.assert_array_equal(header["wavelength"], [0.4, 0.5, 0.6])
+    assert header["map info"][-1] == "rotation=30.00000000"
+    assert numpy_dtype(header) == np.dtype(">u2")
+    assert numpy_dtype({"data type": 4}) == np.dtype("<f4")
+    with pytest.raises(ValueError):
+        parse_header("samples = 7")
+
+
+def test_map_transform_matches_gdal(tmp_path):
+    path = _write(tmp_path, np.zeros((3, 5, 7), dtype=np.float32), "bsq")
+    transform, crs = map_transform(EnviCube(path).header)
+    assert crs == "EPSG:32611"
+    # Reference pixel (2, 3) in 1-based pixel corners
+    assert transform * (0, 0) == pytest.approx((499995.0, 4000010.0))
+    with rasterio.open(path) as src:
+        assert transform.almost_equals(src.transform)
+    assert map_transform({}) == (None, None)
+
+
+def test_spectral_info(tmp_path):
+    path = _write(tmp_path, np.zeros((3, 5, 7), dtype=np.float32), "bsq")
+    wavelength, fwhm, bbl = spectral_info(path)
+    np.testing.assert_allclose(wavelength, [400.0, 500.0, 600.0])
+    np.testing.assert_allclose(fwhm, [5.0, 5.0, 6.0])
+    assert bbl is None
+
+
+@pytest.mark.parametrize("interleave", ["bsq", "bil", "bip"])
+@pytest.mark.parametrize("byte_order", [0, 1])
+def test_memmap_indexing(tmp_path, interleave, byte_order):
+    cube = np.arange(3 * 5 * 7, dtype=np.int16).reshape(3, 5, 7) - 50
+    path = _write(tmp_path, cube, interleave, byte_order=byte_order, offset=16, data_type=2)
+    with EnviCube(path + ".hdr") as envi:
+        assert envi.shape == (3, 5, 7) and envi.nodata == -9999
+        np.testing.assert_array_equal(envi.cube, cube)
+        np.testing.assert_array_equal(envi.spectrum(4, 6), cube[:, 4, 6])
+        np.testing.assert_array_equal(envi.spectrum(1, 2, bands=[2, 0]), cube[[2, 0], 1, 2])
+        np.testing.assert_array_equal(envi.band(1), cube[1])
+        window = Window(2, 1, 4, 3)
+        np.testing.assert_array_equal(envi.read(window), cube[:, 1:4, 2:6])
+        np.testing.assert_array_equal(envi.read(window, bands=2), cube[2:3, 1:4, 2:6])
+        np.testing.assert_array_equal(envi.read(window, bands=slice(0, 3, 2)), cube[::2, 1:4, 2:6])
+        np.testing.assert_array_equal(envi.read(window, bands=[2, 0]), cube[[2, 0], 1:4, 2:6])
+        assert isinstance(envi.read(window, bands=slice(0, 2)), np.memmap)
+        # The same pixels as GDAL
+        with rasterio.open(path) as src:
+            np.testing.assert_array_equal(src.read(), cube)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from aviris.footprints import FootprintIndex
+
+
+def _granule(id, lat=None, lon=10):
+    polygons = []
+    if lat is not None:
+        polygons = [[f"{lat} {lon} {lat} {lon + 1} {lat + 1} {lon + 1} {lat + 1} {lon} {lat} {lon}"]]
+    return {"id": id, "title": f"ang{id}", "time_start": "2023-01-01T00:00:00Z", "polygons": polygons}
+
+
+def test_granules_without_polygon_anywhere():
+    granules = [_granule("none0"), _granule("a", 30), _granule("none1"), _granule("b", 50),
+                _granule("none2")]
+    index = FootprintIndex.from_granules(granules)
+    assert [index.geometry(g["id"]) is None for g in granules] == [True, False, True, False, True]
+    assert index.geometry("a").bounds == (10, 30, 11, 31)
+    assert index.geometry("b").bounds == (10, 50, 11, 51)
+
+    assert index.query((10.2, 30.2, 10.4, 30.4)).tolist() == [1]
+    assert index.query((10.2, 50.2, 10.4, 50.4)).tolist() == [3]
+    assert index.query((9, 29, 12, 52)).tolist() == [1, 3]
+    assert index.query((50, 0, 51, 1)).size == 0
+
+
+def test_save_and_load(tmp_path):
+    index = FootprintIndex.from_granules([_granule("none"), _granule("a", 30)])
+    index.last_sync = "2023-01-02T00:00:00Z"
+    index.save(tmp_path / "footprints.npz")
+    loaded = FootprintIndex.load(tmp_path / "footprints.npz")
+    assert loaded.last_sync == index.last_sync
+    assert loaded.geometry("none") is None
+    assert loaded.geometry("a").equals(index.geometry("a"))
+    np.testing.assert_array_equal(loaded.query((10.5, 30.5, 10.6, 30.6)), [1])
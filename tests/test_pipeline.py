@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from aviris.cmr import FileInfo
+from aviris.pipeline import DiskBudget, run_pipeline
+
+SCENES = [f"scene{i}" for i in range(5)]
+URLS = [f"https://host/{scene}_img.{ext}" for scene in SCENES for ext in ("hdr", "bin")]
+EXPECTED = {url.split("/")[-1]: FileInfo(100, None, None) for url in URLS}
+
+
+def _fake_download(fail=()):
+    def download_file(session, url, path, report, expected=None):
+        if os.path.basename(path).startswith(fail):
+            raise IOError("connection reset")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 100)
+    return download_file
+
+
+def _convert(fail=(), delay=0.0, seen=None):
+    def convert(paths, output_dir, options):
+        if seen is not None:
+            # Originals on disk while this scene converts, including the scenes fetched ahead
+            seen.append(len(os.listdir(os.path.dirname(paths[0]))))
+        time.sleep(delay)
+        scene = os.path.basename(paths[0]).split("_")[0]
+        if scene in fail:
+            raise ValueError("bad header")
+        return os.path.join(output_dir, scene + ".tif")
+    return convert
+
+
+def _run(tmp_path, download=None, timeout=20, **kwargs):
+    """run_pipeline in a thread, so that a deadlock fails the test instead of hanging it."""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = run_pipeline(URLS, str(tmp_path / "raw"), str(tmp_path / "out"),
+                                           session=mock.Mock(), expected=EXPECTED, **kwargs)
+        except Exception as e:
+            result["error"] = e
+
+    with mock.patch("aviris.pipeline.download_file", download or _fake_download()):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+    assert not thread.is_alive(), "pipeline did not shut down"
+    return result
+
+
+def test_reserve_blocks_until_release(tmp_path):
+    budget = DiskBudget(str(tmp_path), quota=150)
+    budget.reserve(100)
+    reserved = threading.Event()
+    thread = threading.Thread(target=lambda: (budget.reserve(100), reserved.set()))
+    thread.start()
+    assert not reserved.wait(0.2)
+    budget.release(100)
+    assert reserved.wait(5)
+    thread.join()
+    assert budget.reserved == 100
+
+
+def test_oversized_scene_passes_alone(tmp_path):
+    budget = DiskBudget(str(tmp_path), quota=10)
+    budget.reserve(100)
+    assert budget.reserved == 100
+
+
+def test_backpressure(tmp_path):
+    seen = []
+    # Room for two scenes of 200 bytes: one converting and one fetched ahead
+    result = _run(tmp_path, quota=400, fetch_workers=3, convert_workers=1, convert=_convert(delay=0.05, seen=seen))
+    assert sorted(os.path.basename(p) for p in result["value"]["converted"]) == [s + ".tif" for s in SCENES]
+    assert result["value"]["failed"] == []
+    assert max(seen) <= 4
+    assert os.listdir(tmp_path / "raw") == []
+
+
+def test_failures_are_reported(tmp_path):
+    result = _run(tmp_path, download=_fake_download(fail=("scene1",)), quota=200,
+                  convert=_convert(fail=("scene3",)))
+    failed = dict(result["value"]["failed"])
+    assert sorted(failed) == ["scene1_img", "scene3_img"]
+    assert failed["scene1_img"].startswith("download:") and failed["scene3_img"].startswith("convert:")
+    assert len(result["value"]["converted"]) == 3
+    # Failed conversions keep their originals for a retry
+    assert sorted(os.listdir(tmp_path / "raw")) == ["scene3_img.bin", "scene3_img.hdr"]
+
+
+def test_scheduler_error_shuts_down(tmp_path):
+    def claims():
+        yield "scene0", URLS[:2]
+        raise RuntimeError("manifest is gone")
+
+    manifest = mock.Mock()
+    manifest.claims.side_effect = claims
+    result = _run(tmp_path, manifest=manifest, convert=_convert())
+    assert isinstance(result["error"], RuntimeError)
+    # The scene claimed before the error still finished
+    manifest.done.assert_called_once_with("scene0", {"output": str(tmp_path / "out" / "scene0.tif")})
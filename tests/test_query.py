@@ -0,0 +1,42 @@
+import json
+
+from aviris.catalog import Catalog
+from aviris.query import GranuleQuery
+
+
+def _entry(id, time_start, lat):
+    ring = f"{lat} 10 {lat} 11 {lat + 1} 11 {lat + 1} 10 {lat} 10"
+    return {"id": id, "title": f"ang{id}_rfl", "time_start": time_start, "polygons": [[ring]], "links": []}
+
+
+def _catalog(entries):
+    catalog = Catalog(":memory:")
+    with catalog.conn:
+        catalog.conn.executemany(
+            "INSERT INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(e["id"], "X", e["title"], e["time_start"], None, None, json.dumps(e["polygons"]), "[]")
+             for e in entries],
+        )
+    return catalog
+
+
+def test_empty_catalog_query():
+    catalog = Catalog(":memory:")
+    assert catalog.granules("X", query=GranuleQuery(start="2030-01-01")) == []
+    assert catalog.granules("X", query=GranuleQuery(lat_band=(-90, 45))) == []
+
+
+def test_filter_empty_list():
+    assert GranuleQuery(start="2030-01-01", end="2031-01-01", title_pattern="*rfl*").filter([]) == []
+
+
+def test_catalog_query_combines_sql_and_spatial_filters():
+    catalog = _catalog([
+        _entry("1", "2022-01-01T00:00:00Z", 30),
+        _entry("2", "2023-01-01T00:00:00Z", 30),
+        _entry("3", "2023-06-01T00:00:00Z", 60),
+    ])
+    query = GranuleQuery(start="2022-06-01", lat_band=(-90, 45))
+    assert [g["id"] for g in catalog.granules("X", query=query)] == ["2"]
+    # The same result as filtering everything locally
+    assert query.filter(catalog.granules("X")) == catalog.granules("X", query=query)
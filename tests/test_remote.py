@@ -0,0 +1,71 @@
+import re
+from unittest import mock
+
+import numpy as np
+import pytest
+from rasterio.windows import Window
+
+from aviris.remote import RemoteEnviCube
+
+HEADER = """ENVI
+samples = 7
+lines = 5
+bands = 3
+header offset = 0
+data type = 4
+interleave = {interleave}
+byte order = 0
+"""
+
+
+def _response(status, content, headers=None):
+    return mock.Mock(status_code=status, content=content, headers=headers or {}, raw=None)
+
+
+def _session(data, interleave="bil", ranges=None):
+    """Mocked session serving a header and Range requests on ``data``; ``ranges`` overrides the answer."""
+    def get(url, headers=None, timeout=None):
+        if url.endswith(".hdr"):
+            response = _response(200, b"")
+            response.text = HEADER.format(interleave=interleave)
+            return response
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", headers["Range"]).groups())
+        if ranges is not None:
+            return ranges(start, end)
+        return _response(206, data[start:end + 1], {"Content-Range": f"bytes {start}-{end}/{len(data)}"})
+
+    session = mock.MagicMock()
+    session.get.side_effect = get
+    return session
+
+
+@pytest.mark.parametrize("interleave", ["bsq", "bil", "bip"])
+def test_read_matches_array(interleave):
+    cube = np.arange(3 * 5 * 7, dtype="<f4").reshape(3, 5, 7)
+    layout = {"bsq": cube, "bil": cube.transpose(1, 0, 2), "bip": cube.transpose(1, 2, 0)}[interleave]
+    remote = RemoteEnviCube("https://host/s0.bin", session=_session(layout.tobytes(), interleave), block_size=16)
+    np.testing.assert_array_equal(remote.read(), cube)
+    np.testing.assert_array_equal(remote.read(Window(2, 1, 4, 3), bands=[2, 0]), cube[[2, 0], 1:4, 2:6])
+
+
+def test_range_ignored():
+    data = np.zeros((3, 5, 7), dtype="<f4").tobytes()
+    session = _session(data, ranges=lambda start, end: _response(200, data))
+    with pytest.raises(IOError, match="Range"):
+        RemoteEnviCube("https://host/s0.bin", session=session).read()
+
+
+def test_wrong_content_range():
+    data = np.zeros((3, 5, 7), dtype="<f4").tobytes()
+    session = _session(data, ranges=lambda start, end: _response(
+        206, data[start + 4:end + 5], {"Content-Range": f"bytes {start + 4}-{end + 4}/{len(data)}"}))
+    with pytest.raises(IOError, match="Content-Range"):
+        RemoteEnviCube("https://host/s0.bin", session=session).read()
+
+
+def test_short_body():
+    data = np.zeros((3, 5, 7), dtype="<f4").tobytes()
+    session = _session(data, ranges=lambda start, end: _response(
+        206, data[start:end], {"Content-Range": f"bytes {start}-{end}/{len(data)}"}))
+    with pytest.raises(IOError, match="bytes"):
+        RemoteEnviCube("https://host/s0.bin", session=session).read()
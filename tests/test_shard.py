@@ -0,0 +1,91 @@
+import json
+import multiprocessing
+import time
+
+from aviris.shard import Manifest
+
+
+def test_claims_are_handed_out_once(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    with Manifest(path, worker="a") as a, Manifest(path, worker="b") as b:
+        assert a.build({"s2": 2, "s0": 0, "s1": 1}) == 3
+        assert b.build({"s0": 0, "s1": 1, "s2": 2}) == 0
+        assert a.claim() == ("s0", 0)
+        assert b.claim() == ("s1", 1)
+        a.done("s0", {"output": "s0.tif"})
+        b.fail("s1", RuntimeError("bad scene"))
+        assert a.claim() == ("s2", 2)
+        assert b.claim() is None
+        assert a.status() == {"pending": 0, "running": 1, "done": 1, "failed": 1}
+        assert b.failures() == [("s1", "bad scene")]
+
+
+def test_expired_lease_of_remote_worker(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    with Manifest(path, lease=60) as manifest:
+        manifest.build(["s0"])
+        assert manifest.claim() == ("s0", None)
+        # Held by a live worker on another host: handed out again only once the lease expires
+        manifest.conn.execute("UPDATE items SET owner = 'other-node:1', claimed = ?", (time.time() - 30,))
+        assert manifest.claim() is None
+        manifest.conn.execute("UPDATE items SET claimed = ?", (time.time() - 61,))
+        assert manifest.claim() == ("s0", None)
+
+
+def test_dead_local_worker_is_reclaimed(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    with Manifest(path) as manifest:
+        manifest.build(["s0"])
+        manifest.claim()
+        manifest.owner = manifest.owner.rpartition(":")[0] + ":999999999"
+        manifest.conn.execute("UPDATE items SET owner = ?", (manifest.owner,))
+        assert manifest.claim() == ("s0", None)
+
+
+def test_heartbeat_renews_claims(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    with Manifest(path, lease=0.4) as manifest:
+        manifest.build(["s0", "s1"])
+        manifest.claim()
+        time.sleep(1)
+        # Without the heartbeat the lease would have expired twice over
+        claimed = manifest.conn.execute("SELECT claimed FROM items WHERE key = 's0'").fetchone()[0]
+        assert time.time() - claimed < 0.4
+        assert manifest.conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def _claim_all(path, worker, start, claimed):
+    with Manifest(path, worker=worker) as manifest:
+        start.wait()
+        keys = []
+        for key, _ in manifest.claims():
+            keys.append(key)
+            time.sleep(0.005)
+            manifest.done(key, {"worker": worker})
+        claimed.put((worker, keys))
+
+
+def test_processes_never_claim_twice(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    keys = [f"s{i:02d}" for i in range(40)]
+    with Manifest(path) as manifest:
+        manifest.build(keys)
+
+    context = multiprocessing.get_context("fork")
+    start, claimed = context.Event(), context.Queue()
+    workers = [context.Process(target=_claim_all, args=(path, name, start, claimed)) for name in ("a", "b")]
+    for worker in workers:
+        worker.start()
+    start.set()
+    results = dict(claimed.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    assert sorted(results["a"] + results["b"]) == keys
+    assert not set(results["a"]) & set(results["b"])
+    with Manifest(path) as manifest:
+        assert manifest.status()["done"] == len(keys)
+        rows = manifest.conn.execute("SELECT key, attempts, result FROM items").fetchall()
+    assert all(row["attempts"] == 1 for row in rows)
+    assert all(row["key"] in results[json.loads(row["result"])["worker"]] for row in rows)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from aviris.spectral import SpectralResampler, gaussian_srf_matrix, water_band_mask
+
+SOURCE = np.arange(380.0, 2511.0, 5.0)
+
+METADATA = """<?xml version="1.0"?>
+<level_X><specific><bandCharacterisation>
+  <bandID number="2"><wavelengthCenterOfBand>560.0</wavelengthCenterOfBand><FWHMOfBand>8.0</FWHMOfBand></bandID>
+  <bandID number="1"><wavelengthCenterOfBand>480.0</wavelengthCenterOfBand><FWHMOfBand>6.5</FWHMOfBand></bandID>
+  <bandID number="3"><wavelengthCenterOfBand>1400.0</wavelengthCenterOfBand><FWHMOfBand>10.0</FWHMOfBand></bandID>
+  <bandID number="4"><wavelengthCenterOfBand>2200.0</wavelengthCenterOfBand><FWHMOfBand>10.0</FWHMOfBand></bandID>
+</bandCharacterisation></specific></level_X>
+"""
+
+
+def test_rows_sum_to_one():
+    matrix = gaussian_srf_matrix(SOURCE, [450.0, 1000.0, 2400.0, 2600.0], [10.0, 12.0, 20.0, 10.0])
+    sums = np.asarray(matrix.sum(axis=1)).ravel()
+    np.testing.assert_allclose(sums[:3], 1.0, rtol=1e-6)
+    # Outside the source range
+    assert sums[3] == 0
+
+
+def test_gaussian_fwhm():
+    source = np.arange(400.0, 700.0, 1.0)
+    weights = gaussian_srf_matrix(source, [550.0], [20.0], min_weight=0).toarray()[0]
+    peak = weights[source == 550.0][0]
+    np.testing.assert_allclose(weights[np.isin(source, [540.0, 560.0])], peak / 2, rtol=1e-6)
+    # A flat spectrum stays flat, a line is sampled at the band centre
+    np.testing.assert_allclose(weights @ np.full(len(source), 0.3), 0.3, rtol=1e-6)
+    np.testing.assert_allclose(weights @ source, 550.0, rtol=1e-6)
+
+
+def test_drop_water(tmp_path):
+    path = tmp_path / "METADATA.XML"
+    path.write_text(METADATA)
+    transform = SpectralResampler.from_enmap_metadata(str(path), drop_water=True).prepare(SOURCE)
+
+    np.testing.assert_array_equal(transform.wavelength, [480.0, 560.0, 2200.0])
+    np.testing.assert_array_equal(transform.fwhm, [6.5, 8.0, 10.0])
+    water = np.flatnonzero(water_band_mask(SOURCE))
+    assert not np.isin(transform.used, water).any()
+
+    # Without target bands only the bad and water bands are dropped
+    bbl = np.ones(len(SOURCE))
+    bbl[0] = 0
+    subset = SpectralResampler(drop_water=True).prepare(SOURCE, fwhm=np.full(len(SOURCE), 5.0), bbl=bbl)
+    assert subset.count == len(SOURCE) - len(water) - 1
+    assert 380.0 not in subset.wavelength and not water_band_mask(subset.wavelength).any()
+
+
+@pytest.mark.parametrize("nodata", [-9999.0, np.nan])
+def test_nodata_propagated(nodata):
+    transform = SpectralResampler([480.0, 2200.0], [10.0, 10.0]).prepare(SOURCE)
+    block = np.full((len(SOURCE), 2, 3), 0.25, dtype=np.float32)
+    # A source band used by the first target band only, still masks the pixel in both
+    block[np.flatnonzero(SOURCE == 480.0)[0], 0, 1] = nodata
+    # A band no target uses does not matter
+    block[np.flatnonzero(SOURCE == 1000.0)[0], 1, 2] = nodata
+
+    out = transform(block, nodata=nodata)
+    assert out.shape == (2, 2, 3)
+    invalid = np.isnan(out) if np.isnan(nodata) else out == nodata
+    np.testing.assert_array_equal(invalid[0], [[False, True, False], [False, False, False]])
+    np.testing.assert_array_equal(invalid[1], invalid[0])
+    np.testing.assert_allclose(out[:, ~invalid[0]], 0.25, rtol=1e-6)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from aviris.stats import BandStats, default_range, reduce_directory, reduce_sidecars, sidecar_path
+
+
+def test_default_range():
+    assert default_range("float32") == (-0.1, 1.5)
+    assert default_range("int16", scale=1e-4) == pytest.approx((-1000, 15000))
+    assert default_range("uint8") == (0, 256)
+
+
+def _sidecar(tmp_path, name, block, value_range=(-0.1, 1.5), descriptions=None):
+    tif = tmp_path / f"{name}.tif"
+    tif.touch()
+    stats = BandStats(block.shape[0], value_range, descriptions=descriptions)
+    stats.update(block)
+    stats.scenes = [tif.name]
+    return stats.save(sidecar_path(str(tif)))
+
+
+def test_merge_matches_numpy(tmp_path):
+    rng = np.random.default_rng(0)
+    blocks = [rng.uniform(0, 1, (2, 8, 8)) for _ in range(3)]
+    paths = [_sidecar(tmp_path, f"s{i}", block) for i, block in enumerate(blocks)]
+    stats = reduce_sidecars(paths)
+    values = np.concatenate([b.reshape(2, -1) for b in blocks], axis=1)
+    np.testing.assert_allclose(stats.mean, values.mean(axis=1))
+    np.testing.assert_allclose(stats.std, values.std(axis=1))
+
+
+def test_bad_sidecars_are_skipped(tmp_path):
+    block = np.full((2, 4, 4), 0.5)
+    good = [_sidecar(tmp_path, f"s{i}", block, descriptions=["a", "b"]) for i in range(2)]
+    other_range = _sidecar(tmp_path, "s2", block, value_range=(0, 10000), descriptions=["a", "b"])
+    other_bands = _sidecar(tmp_path, "s3", block, descriptions=["c", "d"])
+    broken = tmp_path / "s4.tif.stats.json"
+    broken.write_text("{")
+    stats = reduce_sidecars([*good, other_range, other_bands, str(broken)])
+    assert stats.scenes == ["s0.tif", "s1.tif"]
+
+    merged = reduce_directory(str(tmp_path))
+    assert merged.scenes == ["s0.tif", "s1.tif"]
+    assert (tmp_path / "collection_stats.csv").exists()
+    # Nothing changed since: not merged again
+    assert reduce_directory(str(tmp_path)).scenes == merged.scenes